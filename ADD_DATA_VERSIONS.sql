@@ -0,0 +1,33 @@
+-- ========================================================================
+-- ADD DATA VERSIONS
+-- Run this in Supabase SQL Editor after RUN_THIS_FIRST.sql
+-- One counter per user (transactions, holdings, PDFs) plus a shared 'prices'
+-- counter; the app keys its caches on these instead of blind TTLs
+-- ========================================================================
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope TEXT PRIMARY KEY,  -- user id, or 'prices' for shared price data
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- ========================================================================
+-- ATOMIC BUMP (called by the app after every write it caches)
+-- ========================================================================
+
+CREATE OR REPLACE FUNCTION bump_data_version(p_scope TEXT)
+RETURNS BIGINT AS $$
+    INSERT INTO data_versions (scope, version, updated_at)
+    VALUES (p_scope, 1, NOW())
+    ON CONFLICT (scope) DO UPDATE
+        SET version = data_versions.version + 1,
+            updated_at = NOW()
+    RETURNING version;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+GRANT SELECT ON data_versions TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION bump_data_version(TEXT) TO anon, authenticated;
+
+-- Verify table was created
+SELECT 'Data versions created successfully!' as status;
+SELECT * FROM data_versions LIMIT 0;
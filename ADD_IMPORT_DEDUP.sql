@@ -0,0 +1,28 @@
+-- ========================================================================
+-- ADD IMPORT DEDUPLICATION
+-- Run this in Supabase SQL Editor after RUN_THIS_FIRST.sql
+-- Content fingerprints make CSV imports idempotent: a whole file that was
+-- already imported is skipped by its hash, and rows already stored are
+-- skipped by their natural-key hash
+-- ========================================================================
+
+-- File level: SHA-256 of the uploaded bytes
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS portfolio_id UUID REFERENCES portfolios(id) ON DELETE CASCADE;
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS rows_imported INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_file_uploads_hash
+    ON file_uploads(user_id, portfolio_id, content_hash);
+
+-- Row level: hash of (portfolio, ticker, date, type, quantity, price, occurrence)
+ALTER TABLE user_transactions ADD COLUMN IF NOT EXISTS row_hash TEXT;
+
+-- Manual entries have no row_hash and are never deduplicated
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_transactions_row_hash
+    ON user_transactions(portfolio_id, row_hash)
+    WHERE row_hash IS NOT NULL;
+
+-- Verify columns were added
+SELECT 'Import deduplication added successfully!' as status;
+SELECT content_hash, rows_imported FROM file_uploads LIMIT 0;
+SELECT row_hash FROM user_transactions LIMIT 0;
@@ -0,0 +1,15 @@
+-- ========================================================================
+-- ADD IMPORT PROGRESS
+-- Run this in Supabase SQL Editor after ADD_IMPORT_DEDUP.sql
+-- Chunk checkpoints for streaming CSV imports: an import interrupted
+-- mid-file resumes after the last committed chunk instead of starting over
+-- ========================================================================
+
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS chunk_rows INTEGER;            -- rows per chunk of this run
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS chunks_completed INTEGER DEFAULT 0;
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS rows_processed INTEGER DEFAULT 0;
+ALTER TABLE file_uploads ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+-- Verify columns were added
+SELECT 'Import progress added successfully!' as status;
+SELECT chunk_rows, chunks_completed, rows_processed FROM file_uploads LIMIT 0;
@@ -0,0 +1,40 @@
+-- ========================================================================
+-- ADD TRANSACTION LEDGER SNAPSHOTS
+-- Run this in Supabase SQL Editor after RUN_THIS_FIRST.sql
+-- Orders user_transactions as an event log and stores periodic per-portfolio
+-- position snapshots, so point-in-time holdings need only a short replay
+-- ========================================================================
+
+-- Insertion order breaks ties between transactions on the same date
+-- (existing rows are numbered when the column is added)
+ALTER TABLE user_transactions ADD COLUMN IF NOT EXISTS ledger_seq BIGSERIAL;
+
+CREATE INDEX IF NOT EXISTS idx_user_transactions_ledger
+    ON user_transactions(portfolio_id, transaction_date, ledger_seq)
+    INCLUDE (stock_id, quantity, price, transaction_type);
+
+-- ========================================================================
+-- PORTFOLIO SNAPSHOTS
+-- positions: {stock_id: [quantity, cost]} after every transaction dated
+-- on or before as_of_date; event_count is the number of events replayed
+-- ========================================================================
+
+CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    portfolio_id UUID NOT NULL REFERENCES portfolios(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    as_of_date DATE NOT NULL,
+    event_count INTEGER NOT NULL,
+    positions JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(portfolio_id, as_of_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_user ON portfolio_snapshots(user_id);
+
+GRANT ALL ON portfolio_snapshots TO anon, authenticated;
+GRANT USAGE, SELECT ON SEQUENCE user_transactions_ledger_seq_seq TO anon, authenticated;
+
+-- Verify table was created
+SELECT 'Ledger snapshots created successfully!' as status;
+SELECT * FROM portfolio_snapshots LIMIT 0;
@@ -57,6 +57,21 @@ CREATE TRIGGER update_user_pdfs_timestamp
     FOR EACH ROW
     EXECUTE FUNCTION update_user_pdfs_updated_at();
 
+-- Truncated PDF context for the AI assistant
+-- Truncation and concatenation happen here so the app never downloads full
+-- document bodies just to keep the first few thousand characters of each
+CREATE OR REPLACE FUNCTION get_user_pdf_context(p_user_id UUID, p_chars INTEGER DEFAULT 2000)
+RETURNS TEXT AS $$
+    SELECT string_agg(
+        E'\n📄 ' || filename || E':\n' || left(pdf_text, p_chars) || E'...\n',
+        '' ORDER BY uploaded_at DESC
+    )
+    FROM user_pdfs
+    WHERE user_id = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION get_user_pdf_context(UUID, INTEGER) TO anon, authenticated;
+
 -- Verify table was created
 SELECT 'PDF storage table created successfully!' as status;
 SELECT * FROM user_pdfs LIMIT 0;
@@ -0,0 +1,35 @@
+-- ========================================================================
+-- ADD PRICE UPDATED_AT
+-- Run this in Supabase SQL Editor after RUN_THIS_FIRST.sql
+-- Stamps every historical_prices write, inserts and upsert overwrites
+-- alike, so local price replicas (price_replica.py) also pick up
+-- re-priced weeks instead of only new rows
+-- ========================================================================
+
+-- Existing rows keep their insert time, so replicas do not re-pull everything
+ALTER TABLE historical_prices ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE historical_prices SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+ALTER TABLE historical_prices ALTER COLUMN updated_at SET DEFAULT NOW();
+ALTER TABLE historical_prices ALTER COLUMN updated_at SET NOT NULL;
+
+-- ON CONFLICT DO UPDATE fires BEFORE UPDATE triggers too
+CREATE OR REPLACE FUNCTION touch_historical_price()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_historical_prices_updated_at ON historical_prices;
+CREATE TRIGGER trg_historical_prices_updated_at
+    BEFORE UPDATE ON historical_prices
+    FOR EACH ROW EXECUTE FUNCTION touch_historical_price();
+
+-- Replica keyset scan: (updated_at, id)
+CREATE INDEX IF NOT EXISTS idx_historical_prices_updated
+    ON historical_prices(updated_at, id);
+
+-- Verify
+SELECT 'historical_prices.updated_at added successfully!' as status;
+SELECT updated_at FROM historical_prices LIMIT 0;
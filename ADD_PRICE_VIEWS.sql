@@ -0,0 +1,93 @@
+-- ========================================================================
+-- ADD PRICE READ VIEWS
+-- Run this in Supabase SQL Editor after RUN_THIS_FIRST.sql
+-- Turns the hottest price reads (holdings current price, 52-week charts,
+-- missing-week detection) into index-only lookups
+-- ========================================================================
+
+-- Composite covering index for per-stock date-range reads
+-- (UNIQUE(stock_id, price_date) already exists; INCLUDE makes range scans index-only)
+CREATE INDEX IF NOT EXISTS idx_historical_prices_stock_date
+    ON historical_prices(stock_id, price_date) INCLUDE (price, iso_year, iso_week);
+
+-- Drop in dependency order (the holdings view reads latest_prices)
+DROP VIEW IF EXISTS user_holdings_detailed CASCADE;
+DROP MATERIALIZED VIEW IF EXISTS latest_prices CASCADE;
+DROP MATERIALIZED VIEW IF EXISTS weekly_prices CASCADE;
+
+-- ========================================================================
+-- LATEST PRICE PER STOCK
+-- ========================================================================
+
+-- PMS/AIF 'cagr_index' rows are a shared scheme index, not a per-unit price,
+-- so holdings never take them as current_price
+CREATE MATERIALIZED VIEW latest_prices AS
+SELECT DISTINCT ON (stock_id)
+    stock_id,
+    price_date,
+    price
+FROM historical_prices
+WHERE source IS DISTINCT FROM 'cagr_index'
+ORDER BY stock_id, price_date DESC;
+
+CREATE UNIQUE INDEX idx_latest_prices_stock ON latest_prices(stock_id) INCLUDE (price, price_date);
+
+-- ========================================================================
+-- WEEKLY CLOSE PER (stock_id, iso_year, iso_week)
+-- ========================================================================
+
+CREATE MATERIALIZED VIEW weekly_prices AS
+SELECT DISTINCT ON (stock_id, iso_year, iso_week)
+    stock_id,
+    iso_year,
+    iso_week,
+    price_date,
+    price
+FROM historical_prices
+WHERE iso_year IS NOT NULL AND iso_week IS NOT NULL
+ORDER BY stock_id, iso_year, iso_week, price_date DESC;
+
+CREATE UNIQUE INDEX idx_weekly_prices_key ON weekly_prices(stock_id, iso_year, iso_week) INCLUDE (price_date, price);
+CREATE INDEX idx_weekly_prices_stock_date ON weekly_prices(stock_id, price_date) INCLUDE (price, iso_year, iso_week);
+
+-- ========================================================================
+-- HOLDINGS VIEW (falls back to the latest stored price when live_price is empty)
+-- ========================================================================
+
+CREATE OR REPLACE VIEW user_holdings_detailed AS
+SELECT
+    h.id,
+    h.user_id,
+    h.portfolio_id,
+    h.total_quantity,
+    h.average_price,
+    h.last_updated,
+    sm.id as stock_id,
+    sm.ticker,
+    sm.stock_name,
+    sm.asset_type,
+    sm.sector,
+    COALESCE(sm.live_price, lp.price) AS current_price
+FROM holdings h
+JOIN stock_master sm ON h.stock_id = sm.id
+LEFT JOIN latest_prices lp ON lp.stock_id = sm.id;
+
+-- ========================================================================
+-- REFRESH ROUTINE (called by the app after bulk price writes)
+-- ========================================================================
+
+CREATE OR REPLACE FUNCTION refresh_price_views()
+RETURNS VOID AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY latest_prices;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY weekly_prices;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+GRANT SELECT ON latest_prices, weekly_prices, user_holdings_detailed TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION refresh_price_views() TO anon, authenticated;
+
+-- Verify views were created
+SELECT 'Price views created successfully!' as status;
+SELECT * FROM latest_prices LIMIT 0;
+SELECT * FROM weekly_prices LIMIT 0;
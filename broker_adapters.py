@@ -0,0 +1,242 @@
+"""
+Broker Format Adapters
+- Recognizes broker tradebooks and CAMS / KFintech mutual fund statements by
+  their header row, so exports can be uploaded as downloaded
+- Maps each layout onto the importer's columns (date, ticker, stock_name,
+  quantity, price, transaction_type, channel, asset_type) with whole-column
+  pandas operations; the result goes straight into csv_ingest
+- Statement preambles (investor name, PAN, period lines) above the header are
+  skipped by sniffing the first lines of the file
+- Adding a layout = one BrokerFormat entry in BROKER_FORMATS
+"""
+
+import csv
+from typing import Dict, List, Optional, Sequence, Tuple, BinaryIO
+
+import numpy as np
+import pandas as pd
+
+SNIFF_BYTES = 64 * 1024  # enough for any preamble + header
+SNIFF_LINES = 30
+
+# Columns of the importer's own layout; a header with these needs no adapter
+NATIVE_COLUMNS = frozenset({'ticker', 'quantity', 'transaction_type'})
+
+# Statement wording -> buy / sell; rows matching neither (stamp duty, STT,
+# address changes, dividend payouts) are not trades and are ignored
+BUY_PATTERN = r'buy|purchase|\bsip\b|systematic investment|switch[\s_-]*in|reinvest|bonus|allot'
+SELL_PATTERN = r'sell|redemption|redeem|switch[\s_-]*out|\bswp\b|systematic withdrawal|withdraw'
+
+
+def normalize_header(names: Sequence) -> List[str]:
+    """Same rule as csv_ingest.normalize_columns, for a raw header row"""
+    return (
+        pd.Index(list(names)).astype(str).str.strip().str.lower()
+        .str.replace(r'[\s\-]+', '_', regex=True).tolist()
+    )
+
+
+class BrokerFormat:
+    """
+    One export layout
+
+    Args:
+        name: Shown in the import summary
+        signature: Normalized headers that must all be present to match
+        columns: {importer column: candidate source columns}; the first
+                 candidate present in the file is used
+        channel: Channel for rows without one
+        asset_type: Forced asset type (statements that only hold funds)
+        status_column / status_values: Keep only rows whose status is one of
+                 these (e.g. executed orders)
+        amount_column: Price is amount / quantity when no price column exists
+    """
+
+    def __init__(self, name: str, signature: Sequence[str], columns: Dict[str, Sequence[str]],
+                 channel: Optional[str] = None, asset_type: Optional[str] = None,
+                 status_column: Optional[str] = None, status_values: Sequence[str] = (),
+                 amount_column: Optional[str] = None):
+        self.name = name
+        self.signature = frozenset(signature)
+        self.columns = {target: tuple(sources) for target, sources in columns.items()}
+        self.channel = channel
+        self.asset_type = asset_type
+        self.status_column = status_column
+        self.status_values = tuple(v.lower() for v in status_values)
+        self.amount_column = amount_column
+
+    def matches(self, headers: Sequence[str]) -> bool:
+        return self.signature.issubset(headers)
+
+    def _source(self, df: pd.DataFrame, target: str) -> Optional[pd.Series]:
+        for source in self.columns.get(target, ()):
+            if source in df.columns:
+                return df[source]
+        return None
+
+    def adapt(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """
+        Map one chunk (columns normalized) onto the importer's layout
+
+        Returns:
+            (frame with importer columns and the original index, rows ignored
+            as non-trades or non-executed orders)
+        """
+        keep = pd.Series(True, index=df.index)
+
+        if self.status_column and self.status_column in df.columns and self.status_values:
+            status = df[self.status_column].fillna('').astype(str).str.strip().str.lower()
+            keep &= status.isin(self.status_values)
+
+        raw_type = self._source(df, 'transaction_type')
+        words = (raw_type if raw_type is not None else pd.Series('', index=df.index)).fillna('').astype(str).str.lower()
+        is_buy = words.str.contains(BUY_PATTERN, regex=True)
+        is_sell = ~is_buy & words.str.contains(SELL_PATTERN, regex=True)
+        keep &= is_buy | is_sell
+
+        out = pd.DataFrame(index=df.index)
+        for target in self.columns:
+            if target in ('transaction_type', 'date', 'quantity', 'price'):
+                continue
+            source = self._source(df, target)
+            if source is not None:
+                out[target] = source.fillna('').astype(str).str.strip()
+
+        # ISO first, then day-first: Indian statements write 05-03-2024 for
+        # 5 March. Each pass parses whole columns; only leftovers go per value
+        raw_date = self._source(df, 'date')
+        if raw_date is not None:
+            parsed = pd.to_datetime(raw_date, errors='coerce', format='ISO8601')
+            retry = parsed.isna() & raw_date.notna()
+            if retry.any():
+                parsed[retry] = pd.to_datetime(raw_date[retry], errors='coerce', dayfirst=True, format='mixed')
+            out['date'] = parsed.dt.strftime('%Y-%m-%d').where(parsed.notna(), raw_date)
+
+        # Redemptions are often negative units; direction comes from the type
+        raw_quantity = self._source(df, 'quantity')
+        quantity = (pd.to_numeric(_numeric_text(raw_quantity), errors='coerce').abs()
+                    if raw_quantity is not None else pd.Series(np.nan, index=df.index))
+        out['quantity'] = quantity.where(quantity.notna(), raw_quantity if raw_quantity is not None else np.nan)
+
+        price = self._source(df, 'price')
+        price = (pd.to_numeric(_numeric_text(price), errors='coerce')
+                 if price is not None else pd.Series(np.nan, index=df.index))
+        if self.amount_column and self.amount_column in df.columns:
+            amount = pd.to_numeric(_numeric_text(df[self.amount_column]), errors='coerce').abs()
+            price = price.fillna(amount / quantity.replace(0, np.nan))
+        out['price'] = price
+
+        out['transaction_type'] = np.where(is_buy, 'buy', 'sell')
+        if self.channel:
+            channel = out['channel'] if 'channel' in out.columns else pd.Series('', index=df.index)
+            out['channel'] = channel.where(channel != '', self.channel)
+        if self.asset_type:
+            out['asset_type'] = self.asset_type
+
+        return out[keep], int((~keep).sum())
+
+
+def _numeric_text(values: pd.Series) -> pd.Series:
+    """'1,25,000.50' -> '125000.50'; numeric columns pass through"""
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        return values.astype(str).str.replace(',', '', regex=False).str.strip()
+    return values
+
+
+# Most specific signatures first
+BROKER_FORMATS: List[BrokerFormat] = [
+    BrokerFormat(
+        'Zerodha tradebook',
+        signature=['symbol', 'trade_date', 'trade_type', 'quantity', 'price'],
+        columns={
+            'date': ['trade_date'], 'ticker': ['symbol'], 'transaction_type': ['trade_type'],
+            'quantity': ['quantity'], 'price': ['price']
+        },
+        channel='Zerodha'
+    ),
+    BrokerFormat(
+        'Groww order history',
+        signature=['symbol', 'type', 'quantity', 'value', 'execution_date_and_time'],
+        columns={
+            'date': ['execution_date_and_time'], 'ticker': ['symbol'], 'stock_name': ['stock_name'],
+            'transaction_type': ['type'], 'quantity': ['quantity']
+        },
+        channel='Groww', status_column='order_status', status_values=['executed'],
+        amount_column='value'
+    ),
+    BrokerFormat(
+        'Upstox tradebook',
+        signature=['date', 'company', 'side', 'quantity', 'price', 'scrip_code'],
+        columns={
+            'date': ['date'], 'ticker': ['symbol', 'scrip_code'], 'stock_name': ['company'],
+            'transaction_type': ['side'], 'quantity': ['quantity'], 'price': ['price']
+        },
+        channel='Upstox'
+    ),
+    BrokerFormat(
+        'ICICI Direct trades',
+        signature=['stock', 'action', 'quantity', 'transaction_price', 'date'],
+        columns={
+            'date': ['date'], 'ticker': ['stock'], 'transaction_type': ['action'],
+            'quantity': ['quantity'], 'price': ['transaction_price']
+        },
+        channel='ICICI Direct'
+    ),
+    BrokerFormat(
+        'CAMS transactions',
+        signature=['scheme_name', 'trade_date', 'transaction_type', 'units'],
+        columns={
+            'date': ['trade_date'], 'ticker': ['amfi_code', 'scheme_code', 'isin', 'scheme_name'],
+            'stock_name': ['scheme_name'], 'transaction_type': ['transaction_type'],
+            'quantity': ['units'], 'price': ['price', 'nav'], 'channel': ['broker']
+        },
+        channel='CAMS', asset_type='mutual_fund', amount_column='amount'
+    ),
+    BrokerFormat(
+        'KFintech transactions',
+        signature=['scheme_name', 'transaction_date', 'transaction_description', 'units'],
+        columns={
+            'date': ['transaction_date'], 'ticker': ['amfi_code', 'scheme_code', 'isin', 'scheme_name'],
+            'stock_name': ['scheme_name'], 'transaction_type': ['transaction_description'],
+            'quantity': ['units'], 'price': ['nav', 'price'], 'channel': ['broker_name']
+        },
+        channel='KFintech', asset_type='mutual_fund', amount_column='amount'
+    ),
+]
+
+
+def detect_format(headers: Sequence[str]) -> Optional[BrokerFormat]:
+    """Adapter for a normalized header, or None for the native layout / unknown files"""
+    if NATIVE_COLUMNS.issubset(headers):
+        return None
+    for fmt in BROKER_FORMATS:
+        if fmt.matches(headers):
+            return fmt
+    return None
+
+
+def sniff(source: BinaryIO) -> Tuple[Optional[BrokerFormat], int]:
+    """
+    Find the header row and layout of a CSV stream
+
+    Reads at most SNIFF_BYTES and rewinds the stream.
+
+    Returns:
+        (adapter or None, number of preamble lines above the header)
+    """
+    source.seek(0)
+    head = source.read(SNIFF_BYTES)
+    source.seek(0)
+    text = head.decode('utf-8-sig', errors='replace') if isinstance(head, bytes) else head
+
+    for line_no, line in enumerate(text.splitlines()[:SNIFF_LINES]):
+        row = next(csv.reader([line]), [])
+        headers = normalize_header([cell for cell in row if cell.strip()])
+        if len(headers) < 3:
+            continue
+        if NATIVE_COLUMNS.issubset(headers):
+            return None, line_no
+        fmt = detect_format(headers)
+        if fmt:
+            return fmt, line_no
+    return None, 0
@@ -0,0 +1,264 @@
+"""
+Columnar CSV Ingest
+- Validates, normalizes, classifies and parses a transaction CSV over whole
+  pandas columns instead of row by row
+- Produces a clean batch (one row per importable transaction, original index
+  kept) plus a compact per-row error report
+- Missing prices are fetched once per unique (ticker, date), not once per row
+- Rows with a name but a blank or unknown ticker are resolved through the
+  local name index (name_resolver) before any network lookup
+"""
+
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from smart_ticker_detector import detect_ticker_type, normalize_ticker
+from symbol_master import get_symbol_master
+
+# date is optional: rows without a parseable date use today
+REQUIRED_COLUMNS = ('ticker', 'quantity', 'transaction_type')
+
+BATCH_COLUMNS = [
+    'ticker', 'stock_name', 'asset_type', 'sector', 'transaction_type',
+    'quantity', 'price', 'transaction_date', 'channel', 'needs_price'
+]
+
+ERROR_COLUMNS = ['row', 'column', 'value', 'problem']
+
+ASSET_TYPES = ('stock', 'mutual_fund', 'pms', 'aif')
+
+
+def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """'Transaction Type' / ' transaction_type ' -> 'transaction_type'"""
+    df = df.copy()
+    df.columns = (
+        pd.Index(df.columns).astype(str).str.strip().str.lower()
+        .str.replace(r'[\s\-]+', '_', regex=True)
+    )
+    return df
+
+
+def classify_tickers(tickers: pd.Series, declared: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    Asset type and stored ticker for a column of raw tickers
+
+    Classification runs once per distinct ticker and is mapped back, so a
+    10k-row file with 40 securities makes 40 detector calls.
+
+    Args:
+        tickers: Raw tickers
+        declared: Asset types given in the file (Asset Type column or a
+                  broker adapter); blank or unknown values are detected
+
+    Returns:
+        DataFrame with asset_type and ticker columns, aligned with tickers
+    """
+    detected = {t: detect_ticker_type(t) for t in tickers.unique()}
+    asset_type = tickers.map(detected)
+    if declared is not None:
+        declared = declared.reindex(tickers.index).fillna('').astype(str).str.strip().str.lower()
+        asset_type = declared.where(declared.isin(ASSET_TYPES), asset_type)
+
+    pairs = list(zip(tickers, asset_type))
+    normalized = {pair: normalize_ticker(*pair) for pair in set(pairs)}
+    return pd.DataFrame({
+        'asset_type': asset_type,
+        'ticker': [normalized[pair] for pair in pairs]
+    }, index=tickers.index)
+
+
+def _text(df: pd.DataFrame, column: str) -> pd.Series:
+    """Stripped string column; missing column or NaN -> ''"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str).str.strip()
+
+
+def _errors(mask: pd.Series, column: str, values: pd.Series, problem: str) -> pd.DataFrame:
+    rows = mask[mask].index
+    return pd.DataFrame({
+        'row': rows + 1,
+        'column': column,
+        'value': values.loc[rows].astype(str).str.slice(0, 40),
+        'problem': problem
+    }, columns=ERROR_COLUMNS)
+
+
+def resolve_from_names(df: pd.DataFrame, raw_ticker: pd.Series,
+                       get_resolver: Callable) -> Tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """
+    Replace blank or unrecognized tickers by a confident stock-name match
+
+    A ticker is unrecognized when the symbol master is loaded, does not list
+    it, and stock_master has no such ticker either.
+
+    Returns:
+        (tickers, asset types of resolved rows ('' elsewhere), report rows)
+    """
+    names = _text(df, 'stock_name')
+    master = get_symbol_master()
+    candidates = (raw_ticker == '')
+    if len(master):
+        listed = {t: master.lookup(t) is not None for t in raw_ticker.unique()}
+        candidates |= ~raw_ticker.map(listed)
+    candidates &= names != ''
+    resolved_type = pd.Series('', index=df.index)
+    if not candidates.any():
+        return raw_ticker, resolved_type, pd.DataFrame(columns=ERROR_COLUMNS)
+
+    resolver = get_resolver()
+    known = {t: t.upper() in resolver.tickers or normalize_ticker(t) in resolver.tickers
+             for t in raw_ticker[candidates].unique() if t}
+    candidates &= ~raw_ticker.map(known).fillna(False).astype(bool)
+
+    matches = resolver.resolve_many(names[candidates].unique())
+    resolved = candidates & names.map(lambda name: matches.get(name) is not None)
+    if not resolved.any():
+        return raw_ticker, resolved_type, pd.DataFrame(columns=ERROR_COLUMNS)
+
+    hits = names[resolved].map(matches)
+    tickers = raw_ticker.copy()
+    tickers[resolved] = [match.ticker for match in hits]
+    resolved_type[resolved] = [match.asset_type for match in hits]
+    report = _errors(resolved, 'ticker', raw_ticker.where(raw_ticker != '', names), '')
+    report['problem'] = [f"resolved from stock name to {match.ticker} ({match.score:.0%} match)" for match in hits]
+    return tickers, resolved_type, report
+
+
+def ingest_frame(df: pd.DataFrame, default_channel: str,
+                 resolver: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    Turn a transaction CSV into a clean batch
+
+    Args:
+        df: CSV rows (columns normalized with normalize_columns)
+        default_channel: Channel for rows without one (the file name)
+        resolver: Returns a NameResolver; only called when some rows have a
+                  name but no usable ticker. None disables name resolution
+
+    Returns:
+        Dict with:
+            batch: DataFrame of BATCH_COLUMNS, index = original row index
+            errors: DataFrame of ERROR_COLUMNS (row is 1-based, like the old log)
+            skipped: Rows without a ticker
+            dropped: Rows with an unusable quantity
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+    error_frames = []
+
+    raw_ticker = _text(df, 'ticker')
+    declared = _text(df, 'asset_type')
+    if resolver is not None:
+        raw_ticker, resolved_type, report = resolve_from_names(df, raw_ticker, resolver)
+        declared = resolved_type.where(resolved_type != '', declared)
+        error_frames.append(report)
+
+    has_ticker = raw_ticker != ''
+    skipped = int((~has_ticker).sum())
+    df = df[has_ticker]
+    raw_ticker = raw_ticker[has_ticker]
+    declared = declared[has_ticker]
+
+    # Quantity: must be a positive number, otherwise the row is dropped
+    quantity = pd.to_numeric(df['quantity'], errors='coerce')
+    bad_quantity = quantity.isna() | (quantity <= 0)
+    error_frames.append(_errors(bad_quantity, 'quantity', df['quantity'], 'not a positive number (row dropped)'))
+
+    # Date: unparseable dates fall back to today, as the row importer did
+    raw_date = df['date'] if 'date' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    parsed = pd.to_datetime(raw_date, errors='coerce')
+    bad_date = parsed.isna()
+    error_frames.append(_errors(bad_date, 'date', raw_date, 'unparseable date (used today)'))
+    transaction_date = parsed.dt.strftime('%Y-%m-%d').where(~bad_date, datetime.now().strftime('%Y-%m-%d'))
+
+    # Price: blank/zero/non-numeric means "fetch the historical price"
+    price = pd.to_numeric(df['price'], errors='coerce') if 'price' in df.columns else pd.Series(np.nan, index=df.index)
+    needs_price = price.isna() | (price == 0)
+
+    # Type: anything mentioning "buy" is a buy, everything else a sell
+    is_buy = _text(df, 'transaction_type').str.lower().str.contains('buy', regex=False)
+
+    classified = classify_tickers(raw_ticker, declared)
+
+    stock_name = _text(df, 'stock_name')
+    channel = _text(df, 'channel')
+
+    batch = pd.DataFrame({
+        'ticker': classified['ticker'],
+        'stock_name': stock_name.where(stock_name != '', raw_ticker),
+        'asset_type': classified['asset_type'],
+        'sector': _text(df, 'sector').replace('', 'Unknown'),
+        'transaction_type': np.where(is_buy, 'buy', 'sell'),
+        'quantity': quantity,
+        'price': price.fillna(0).astype(float),
+        'transaction_date': transaction_date,
+        'channel': channel.where(channel != '', default_channel),
+        'needs_price': needs_price
+    }, index=df.index)[~bad_quantity]
+
+    errors = pd.concat(error_frames, ignore_index=True)
+    return {
+        'batch': batch,
+        'errors': errors.sort_values('row', kind='stable').reset_index(drop=True),
+        'skipped': skipped,
+        'dropped': int(bad_quantity.sum())
+    }
+
+
+def fill_missing_prices(batch: pd.DataFrame, fetch_price: Callable[[str, str, str], Optional[float]],
+                        on_progress: Optional[Callable[[int, int], None]] = None,
+                        cache: Optional[Dict[tuple, float]] = None,
+                        batch_fetch: Optional[Callable] = None) -> Dict[str, int]:
+    """
+    Fill price for rows flagged needs_price, one fetch per unique (ticker, asset_type, date)
+
+    Args:
+        batch: Output batch of ingest_frame (updated in place)
+        fetch_price: (ticker, asset_type, date) -> price or None
+        on_progress: Called with (done, total) after every fetch
+        cache: {(ticker, asset_type, date): price} shared across batches of one
+               import; looked-up prices are added to it
+        batch_fetch: smart_price_fetch_batch-style bulk lookup tried first for
+                     stocks and mutual funds; fetch_price covers what it misses
+
+    Returns:
+        Dict with requested (unique lookups) and missing (lookups with no price)
+    """
+    prices = cache if cache is not None else {}
+    pending = batch.loc[batch['needs_price'], ['ticker', 'asset_type', 'transaction_date']]
+    lookups = [key for key in pending.drop_duplicates().itertuples(index=False, name=None) if key not in prices]
+    requested = len(lookups)
+
+    if batch_fetch and lookups:
+        bulk = [key for key in lookups if key[1] in ('stock', 'mutual_fund')]
+        try:
+            found = batch_fetch([(ticker, date) for ticker, _, date in bulk])
+        except Exception:
+            found = {}
+        for ticker, asset_type, date in bulk:
+            price = (found.get((ticker, date)) or {}).get('price')
+            if price and price > 0:
+                prices[(ticker, asset_type, date)] = float(price)
+        lookups = [key for key in lookups if key not in prices]
+        if on_progress:
+            on_progress(requested - len(lookups), requested)
+
+    for done, key in enumerate(lookups, requested - len(lookups) + 1):
+        try:
+            price = fetch_price(*key)
+        except Exception:
+            price = None
+        prices[key] = float(price) if price and price > 0 else 0.0
+        if on_progress:
+            on_progress(done, requested)
+
+    if len(pending):
+        batch.loc[pending.index, 'price'] = [prices[key] for key in pending.itertuples(index=False, name=None)]
+
+    return {'requested': requested, 'missing': sum(1 for key in lookups if prices[key] == 0)}
@@ -0,0 +1,587 @@
+"""
+Embedded Database Backend (SQLite)
+- Creates the RUN_THIS_FIRST.sql / ADD_PDF_STORAGE.sql / ADD_PRICE_VIEWS.sql schema locally
+- Speaks the subset of the Supabase query builder the app uses, so every
+  SharedDatabaseManager method (and raw db.supabase.table(...) call) runs unchanged
+- Selected with WMS_DB_BACKEND=sqlite or [database] backend = "sqlite" in secrets
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from typing import Optional, Dict, List, Any, Tuple
+
+from database_shared import SharedDatabaseManager
+
+
+SQLITE_SCHEMA = """
+-- ============================================================================
+-- USER MANAGEMENT
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT UNIQUE,
+    email TEXT,
+    password_hash TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE TABLE IF NOT EXISTS portfolios (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    portfolio_name TEXT NOT NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- ============================================================================
+-- SHARED STOCK MASTER & HISTORICAL PRICES
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS stock_master (
+    id TEXT PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    stock_name TEXT NOT NULL,
+    asset_type TEXT NOT NULL,
+    sector TEXT,
+    live_price REAL,
+    last_updated TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    UNIQUE(ticker, stock_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_master_ticker ON stock_master(ticker);
+CREATE INDEX IF NOT EXISTS idx_stock_master_type ON stock_master(asset_type);
+
+CREATE TABLE IF NOT EXISTS historical_prices (
+    id TEXT PRIMARY KEY,
+    stock_id TEXT NOT NULL REFERENCES stock_master(id) ON DELETE CASCADE,
+    price_date TEXT NOT NULL,
+    price REAL NOT NULL,
+    volume INTEGER,
+    source TEXT,
+    iso_year INTEGER,
+    iso_week INTEGER,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    UNIQUE(stock_id, price_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_historical_prices_date ON historical_prices(price_date);
+CREATE INDEX IF NOT EXISTS idx_historical_prices_week ON historical_prices(iso_year, iso_week);
+CREATE INDEX IF NOT EXISTS idx_historical_prices_stock_week ON historical_prices(stock_id, iso_year, iso_week, price_date, price);
+
+-- ============================================================================
+-- USER TRANSACTIONS & HOLDINGS
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS user_transactions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    portfolio_id TEXT NOT NULL REFERENCES portfolios(id) ON DELETE CASCADE,
+    stock_id TEXT NOT NULL REFERENCES stock_master(id) ON DELETE CASCADE,
+    quantity REAL NOT NULL,
+    price REAL NOT NULL,
+    transaction_date TEXT NOT NULL,
+    transaction_type TEXT NOT NULL,
+    channel TEXT,
+    notes TEXT,
+    iso_year INTEGER,
+    iso_week INTEGER,
+    week_label TEXT,
+    ledger_seq INTEGER,
+    row_hash TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- BIGSERIAL stand-in: number each row in insertion order
+CREATE TRIGGER IF NOT EXISTS trg_user_transactions_ledger_seq
+AFTER INSERT ON user_transactions
+WHEN NEW.ledger_seq IS NULL
+BEGIN
+    UPDATE user_transactions SET ledger_seq = NEW.rowid WHERE rowid = NEW.rowid;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_user_transactions_user ON user_transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_portfolio ON user_transactions(portfolio_id);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_stock ON user_transactions(stock_id);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_date ON user_transactions(transaction_date);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_week ON user_transactions(iso_year, iso_week);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_ledger ON user_transactions(portfolio_id, transaction_date, ledger_seq);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_transactions_row_hash ON user_transactions(portfolio_id, row_hash) WHERE row_hash IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+    id TEXT PRIMARY KEY,
+    portfolio_id TEXT NOT NULL REFERENCES portfolios(id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    as_of_date TEXT NOT NULL,
+    event_count INTEGER NOT NULL,
+    positions JSON NOT NULL,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    UNIQUE(portfolio_id, as_of_date)
+);
+
+CREATE TABLE IF NOT EXISTS holdings (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    portfolio_id TEXT NOT NULL REFERENCES portfolios(id) ON DELETE CASCADE,
+    stock_id TEXT NOT NULL REFERENCES stock_master(id) ON DELETE CASCADE,
+    total_quantity REAL NOT NULL,
+    average_price REAL NOT NULL,
+    last_updated TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    UNIQUE(user_id, portfolio_id, stock_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_holdings_user ON holdings(user_id);
+CREATE INDEX IF NOT EXISTS idx_holdings_portfolio ON holdings(portfolio_id);
+CREATE INDEX IF NOT EXISTS idx_holdings_stock ON holdings(stock_id);
+
+CREATE TABLE IF NOT EXISTS file_uploads (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    file_name TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    file_size INTEGER,
+    upload_date TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    processing_status TEXT DEFAULT 'pending',
+    error_message TEXT,
+    content_hash TEXT,
+    portfolio_id TEXT REFERENCES portfolios(id) ON DELETE CASCADE,
+    rows_imported INTEGER DEFAULT 0,
+    chunk_rows INTEGER,
+    chunks_completed INTEGER DEFAULT 0,
+    rows_processed INTEGER DEFAULT 0,
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_file_uploads_hash ON file_uploads(user_id, portfolio_id, content_hash);
+
+-- ============================================================================
+-- PDF STORAGE
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS user_pdfs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    pdf_text TEXT NOT NULL,
+    ai_summary TEXT,
+    uploaded_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_pdfs_user_id ON user_pdfs(user_id);
+
+-- ============================================================================
+-- DATA VERSIONS (cache invalidation counters)
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+);
+
+-- ============================================================================
+-- VIEWS (plain views stand in for the Postgres materialized views)
+-- ============================================================================
+
+-- SQLite returns the bare price column from the MAX(price_date) row.
+-- PMS/AIF 'cagr_index' rows are a scheme index, not a per-unit price
+CREATE VIEW IF NOT EXISTS latest_prices AS
+SELECT stock_id, MAX(price_date) AS price_date, price
+FROM historical_prices
+WHERE source IS NOT 'cagr_index'
+GROUP BY stock_id;
+
+CREATE VIEW IF NOT EXISTS weekly_prices AS
+SELECT stock_id, iso_year, iso_week, MAX(price_date) AS price_date, price
+FROM historical_prices
+WHERE iso_year IS NOT NULL AND iso_week IS NOT NULL
+GROUP BY stock_id, iso_year, iso_week;
+
+CREATE VIEW IF NOT EXISTS user_holdings_detailed AS
+SELECT
+    h.id,
+    h.user_id,
+    h.portfolio_id,
+    h.total_quantity,
+    h.average_price,
+    h.last_updated,
+    sm.id AS stock_id,
+    sm.ticker,
+    sm.stock_name,
+    sm.asset_type,
+    sm.sector,
+    COALESCE(sm.live_price, lp.price) AS current_price
+FROM holdings h
+JOIN stock_master sm ON h.stock_id = sm.id
+LEFT JOIN latest_prices lp ON lp.stock_id = sm.id;
+
+CREATE VIEW IF NOT EXISTS user_transactions_detailed AS
+SELECT
+    ut.id,
+    ut.user_id,
+    ut.portfolio_id,
+    ut.quantity,
+    ut.price,
+    ut.transaction_date,
+    ut.transaction_type,
+    ut.channel,
+    ut.notes,
+    sm.id AS stock_id,
+    sm.ticker,
+    sm.stock_name,
+    sm.asset_type,
+    sm.sector
+FROM user_transactions ut
+JOIN stock_master sm ON ut.stock_id = sm.id;
+"""
+
+# Run after _migrate, once historical_prices.updated_at exists
+SQLITE_TRIGGERS = """
+-- Stamp upsert overwrites too (what ADD_PRICE_UPDATED_AT.sql does on Postgres)
+CREATE TRIGGER IF NOT EXISTS trg_historical_prices_updated_at
+AFTER UPDATE ON historical_prices
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE historical_prices SET updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_historical_prices_inserted_at
+AFTER INSERT ON historical_prices
+WHEN NEW.updated_at IS NULL
+BEGIN
+    UPDATE historical_prices SET updated_at = NEW.created_at WHERE rowid = NEW.rowid;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_historical_prices_updated ON historical_prices(updated_at, id);
+"""
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _identifier(name: str) -> str:
+    """Validate a table/column name before it is interpolated into SQL"""
+    name = name.strip()
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return name
+
+
+class LocalResponse:
+    """Mirrors the .data attribute of a postgrest APIResponse"""
+
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class SQLiteQuery:
+    """
+    Chainable query with the Supabase builder methods used in this app:
+    select/insert/upsert/update/delete, eq/neq/gt/gte/lt/lte/in_/is_,
+    order, limit, range, execute
+    """
+
+    def __init__(self, client: 'SQLiteClient', table: str):
+        self._client = client
+        self._table = _identifier(table)
+        self._operation = 'select'
+        self._columns = '*'
+        self._payload = None
+        self._on_conflict = None
+        self._where: List[str] = []
+        self._params: List[Any] = []
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+
+    # Operations --------------------------------------------------------------
+
+    def select(self, columns: str = '*'):
+        self._operation = 'select'
+        if columns.strip() != '*':
+            columns = ', '.join(_identifier(c) for c in columns.split(','))
+        self._columns = columns
+        return self
+
+    def insert(self, data):
+        self._operation = 'insert'
+        self._payload = data if isinstance(data, list) else [data]
+        return self
+
+    def upsert(self, data, on_conflict: str = 'id'):
+        self._operation = 'upsert'
+        self._payload = data if isinstance(data, list) else [data]
+        self._on_conflict = [_identifier(c) for c in on_conflict.split(',')]
+        return self
+
+    def update(self, data: Dict[str, Any]):
+        self._operation = 'update'
+        self._payload = data
+        return self
+
+    def delete(self):
+        self._operation = 'delete'
+        return self
+
+    # Filters -----------------------------------------------------------------
+
+    def _filter(self, column: str, operator: str, value: Any):
+        self._where.append(f"{_identifier(column)} {operator} ?")
+        self._params.append(value)
+        return self
+
+    def eq(self, column: str, value: Any):
+        return self._filter(column, '=', value)
+
+    def neq(self, column: str, value: Any):
+        return self._filter(column, '!=', value)
+
+    def gt(self, column: str, value: Any):
+        return self._filter(column, '>', value)
+
+    def gte(self, column: str, value: Any):
+        return self._filter(column, '>=', value)
+
+    def lt(self, column: str, value: Any):
+        return self._filter(column, '<', value)
+
+    def lte(self, column: str, value: Any):
+        return self._filter(column, '<=', value)
+
+    def in_(self, column: str, values: List[Any]):
+        values = list(values)
+        if not values:
+            self._where.append('0')
+            return self
+        self._where.append(f"{_identifier(column)} IN ({', '.join('?' * len(values))})")
+        self._params.extend(values)
+        return self
+
+    def is_(self, column: str, value: Any):
+        self._where.append(f"{_identifier(column)} IS {'NULL' if value in (None, 'null') else 'NOT NULL'}")
+        return self
+
+    # Modifiers ---------------------------------------------------------------
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append(f"{_identifier(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, count: int):
+        self._limit = int(count)
+        return self
+
+    def range(self, start: int, end: int):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    def execute(self) -> LocalResponse:
+        return LocalResponse(self._client._run(self))
+
+    # SQL generation ------------------------------------------------------------
+
+    def _where_sql(self) -> str:
+        return f" WHERE {' AND '.join(self._where)}" if self._where else ""
+
+    def _statements(self) -> List[Tuple[str, List[Any]]]:
+        """One (sql, params) pair per statement this query needs"""
+        table = self._table
+
+        if self._operation == 'select':
+            sql = f"SELECT {self._columns} FROM {table}{self._where_sql()}"
+            if self._order:
+                sql += f" ORDER BY {', '.join(self._order)}"
+            if self._limit is not None:
+                sql += f" LIMIT {self._limit}"
+                if self._offset:
+                    sql += f" OFFSET {self._offset}"
+            return [(sql, list(self._params))]
+
+        if self._operation == 'update':
+            payload = self._client._encode_row(self._payload)
+            assignments = ', '.join(f"{_identifier(c)} = ?" for c in payload)
+            sql = f"UPDATE {table} SET {assignments}{self._where_sql()} RETURNING *"
+            return [(sql, list(payload.values()) + list(self._params))]
+
+        if self._operation == 'delete':
+            return [(f"DELETE FROM {table}{self._where_sql()} RETURNING *", list(self._params))]
+
+        statements = []
+        has_id = 'id' in self._client._columns(table)
+        for row in self._payload:
+            row = self._client._encode_row(row)
+            if has_id and not row.get('id'):
+                row['id'] = str(uuid.uuid4())
+            columns = [_identifier(c) for c in row]
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            if self._operation == 'upsert':
+                updates = [c for c in columns if c not in self._on_conflict and c != 'id']
+                if updates:
+                    sql += (f" ON CONFLICT ({', '.join(self._on_conflict)}) DO UPDATE SET "
+                            + ', '.join(f"{c} = excluded.{c}" for c in updates))
+                else:
+                    sql += f" ON CONFLICT ({', '.join(self._on_conflict)}) DO NOTHING"
+            statements.append((sql + " RETURNING *", list(row.values())))
+        return statements
+
+
+class _LocalRPC:
+    """Deferred RPC call, executed like a query"""
+
+    def __init__(self, client: 'SQLiteClient', name: str, params: Dict[str, Any]):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self) -> LocalResponse:
+        return LocalResponse(self._client._call(self._name, self._params))
+
+
+class SQLiteClient:
+    """
+    Drop-in stand-in for the supabase Client backed by one SQLite file
+
+    A single connection is shared across threads and serialized with a lock;
+    WAL mode keeps reads cheap while the bulk writer threads are active.
+    """
+
+    def __init__(self, path: str = 'wealth_manager.db'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._column_cache: Dict[str, Dict[str, str]] = {}
+        self._migrate()
+
+    def _migrate(self):
+        """Columns and views changed after a file was first created (IF NOT EXISTS skips them)"""
+        if 'updated_at' not in self._columns('historical_prices'):
+            self._conn.executescript("""
+                ALTER TABLE historical_prices ADD COLUMN updated_at TEXT;
+                UPDATE historical_prices SET updated_at = created_at;
+            """)
+            self._column_cache.clear()
+        self._conn.executescript(SQLITE_TRIGGERS)
+        view = self._conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'latest_prices'"
+        ).fetchone()
+        if view and 'cagr_index' not in view['sql']:
+            self._conn.executescript("DROP VIEW latest_prices;" + SQLITE_SCHEMA)
+            self._column_cache.clear()
+
+    def table(self, table_name: str) -> SQLiteQuery:
+        return SQLiteQuery(self, table_name)
+
+    def from_(self, table_name: str) -> SQLiteQuery:
+        return self.table(table_name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _LocalRPC:
+        return _LocalRPC(self, name, params or {})
+
+    def execute_script(self, script: str):
+        """Run extra DDL (used by features that add their own local tables)"""
+        with self._lock:
+            self._conn.executescript(script)
+            self._column_cache.clear()
+
+    # Internals ---------------------------------------------------------------
+
+    def _columns(self, table: str) -> Dict[str, str]:
+        """{column: declared type} for a table or view"""
+        if table not in self._column_cache:
+            rows = self._conn.execute(f"PRAGMA table_info({_identifier(table)})").fetchall()
+            self._column_cache[table] = {row['name']: (row['type'] or '').upper() for row in rows}
+        return self._column_cache[table]
+
+    @staticmethod
+    def _encode_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON-encode dict/list values (stored in JSON-typed columns)"""
+        return {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in row.items()}
+
+    def _decode_rows(self, table: str, rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+        json_columns = [c for c, t in self._columns(table).items() if t == 'JSON']
+        decoded = []
+        for row in rows:
+            row = dict(row)
+            for column in json_columns:
+                if isinstance(row.get(column), str):
+                    row[column] = json.loads(row[column])
+            decoded.append(row)
+        return decoded
+
+    def _run(self, query: SQLiteQuery) -> List[Dict[str, Any]]:
+        with self._lock:
+            statements = query._statements()
+            if len(statements) == 1:
+                rows = self._conn.execute(*statements[0]).fetchall()
+            else:
+                # Multi-row writes are atomic, like a single PostgREST request
+                rows = []
+                self._conn.execute("BEGIN")
+                try:
+                    for sql, params in statements:
+                        rows.extend(self._conn.execute(sql, params).fetchall())
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            return self._decode_rows(query._table, rows)
+
+    def _call(self, name: str, params: Dict[str, Any]) -> Any:
+        """Local implementations of the Postgres functions the app calls"""
+        if name == 'refresh_price_views':
+            return None  # Plain views are always current
+
+        if name == 'get_user_pdf_context':
+            with self._lock:
+                row = self._conn.execute(
+                    """
+                    SELECT group_concat(chunk, '') AS context FROM (
+                        SELECT char(10) || '📄 ' || filename || ':' || char(10)
+                               || substr(pdf_text, 1, ?) || '...' || char(10) AS chunk
+                        FROM user_pdfs WHERE user_id = ? ORDER BY uploaded_at DESC
+                    )
+                    """,
+                    (params.get('p_chars', 2000), params['p_user_id'])
+                ).fetchone()
+            return row['context']
+
+        if name == 'bump_data_version':
+            with self._lock:
+                row = self._conn.execute(
+                    """
+                    INSERT INTO data_versions (scope, version, updated_at)
+                    VALUES (?, 1, strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+                    ON CONFLICT (scope) DO UPDATE
+                        SET version = version + 1, updated_at = excluded.updated_at
+                    RETURNING version
+                    """,
+                    (params['p_scope'],)
+                ).fetchone()
+            return row['version']
+
+        raise NotImplementedError(f"RPC {name!r} is not available in the local backend")
+
+
+class LocalDatabaseManager(SharedDatabaseManager):
+    """
+    SharedDatabaseManager running on the embedded SQLite store
+
+    Offline development, load tests and local analysis use this backend; all
+    business logic is inherited, only the client underneath differs.
+    """
+
+    def __init__(self, path: str = 'wealth_manager.db'):
+        super().__init__(client=SQLiteClient(path))
+        self.path = path
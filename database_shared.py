@@ -8,38 +8,136 @@ Database Manager with Shared Architecture
 import streamlit as st
 from supabase import create_client, Client
 from typing import Optional, Dict, List, Any, Tuple
+import atexit
 import hashlib
-from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 import pandas as pd
+from db_repository import PortfolioRepository, is_missing_schema_error
+from pms_aif_calculator import CAGR_INDEX_SOURCE
+from query_tracer import TracedClient, traced_methods, in_current_trace
+from ledger import PortfolioLedger, apply_event
+import numpy as np
+import week_calendar as wc
+import missing_week_planner as planner
 
-class SharedDatabaseManager:
-    """Manages database with shared historical data architecture"""
+# Bulk write tuning: chunks are sized to keep each PostgREST payload near the
+# target, then written concurrently with bounded parallelism and retries
+BULK_TARGET_PAYLOAD_BYTES = 256 * 1024
+BULK_MIN_CHUNK_SIZE = 50
+BULK_MAX_CHUNK_SIZE = 1000
+BULK_MAX_WORKERS = 4
+BULK_MAX_RETRIES = 3
+BULK_RETRY_BACKOFF = 0.5  # seconds, doubled on every attempt
+
+PAGE_SIZE = 1000  # PostgREST max rows per response (Supabase default)
+IN_FILTER_BATCH = 200  # IDs per .in_() filter, keeps request URLs short
+
+PDF_CONTEXT_CHARS = 2000  # Characters kept per PDF in the AI context
+PDF_CONTEXT_HEADER = "\n\n--- PDF DOCUMENTS ---\n\n"
+
+# file_uploads statuses an import can resume from (queued/processing ones
+# whose worker died, partial runs and failed jobs)
+RESUMABLE_UPLOAD_STATUSES = ('queued', 'processing', 'partial', 'failed')
+
+# Data version scope shared by every user (historical and live prices)
+PRICES_SCOPE = 'prices'
+# Without ADD_DATA_VERSIONS.sql the version falls back to a time bucket (old TTL)
+VERSION_FALLBACK_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+def _load_supabase_credentials() -> Tuple[str, str]:
+    """Read and validate Supabase credentials from Streamlit secrets"""
+    supabase_url = st.secrets["supabase"]["url"].strip()
+    supabase_key = st.secrets["supabase"]["key"].strip()
+    
+    # Validate URL format
+    if not supabase_url or not supabase_url.startswith("https://"):
+        raise ValueError(f"Invalid Supabase URL format. Must start with 'https://'. Got: {supabase_url[:50]}...")
+    
+    if not supabase_key or len(supabase_key) < 20:
+        raise ValueError("Invalid Supabase key. Key appears to be too short or empty.")
+    
+    return supabase_url, supabase_key
+
+
+@traced_methods
+class SharedDatabaseManager(PortfolioRepository):
+    """
+    Manages database with shared historical data architecture
     
-    def __init__(self):
+    Use get_shared_db() instead of constructing this directly: the Supabase
+    client keeps one pooled keep-alive HTTP session (httpx, thread-safe), so a
+    single instance serves every session and every cached helper.
+    """
+    
+    # Column projections per use case: hot reads select only the columns
+    # their callers render instead of select('*')
+    PROJECTIONS = {
+        'user_row': 'id, username, email, full_name',
+        'pdf_list_item': 'id, filename, ai_summary, uploaded_at',
+        'pdf_context_item': 'filename, pdf_text',
+        'portfolio_row': 'id, portfolio_name',
+        'stock_id': 'id',
+        'stock_row': 'id, ticker, stock_name, asset_type, sector, live_price',
+        'stock_name_row': 'ticker, stock_name, asset_type',
+        'holding_row': 'id, portfolio_id, stock_id, ticker, stock_name, asset_type, sector, total_quantity, average_price, current_price',
+        'holding_calc': 'quantity, price, transaction_type',
+        'transaction_row': 'id, portfolio_id, stock_id, ticker, stock_name, asset_type, sector, quantity, price, transaction_date, transaction_type, channel, notes',
+        'price_point': 'price_date, price, iso_year, iso_week',
+    }
+    
+    def __init__(self, client: Optional[Client] = None):
+        # Per-user AI context blobs, dropped whenever that user's PDFs change
+        self._pdf_context_cache: Dict[str, str] = {}
+        self._pdf_context_lock = threading.Lock()
+        
+        # Flipped off when a version read shows ADD_DATA_VERSIONS.sql has not been run
+        self._data_versions_available = True
+        
+        # Flipped off when a read shows ADD_PRICE_VIEWS.sql has not been run;
+        # reads then fall back to historical_prices (other errors only for that read)
+        self._price_views_available = True
+        
+        # Flipped off when a lookup shows ADD_IMPORT_DEDUP.sql has not been run;
+        # imports then insert every row as before
+        self._import_dedup_available = True
+        
+        # Same for the chunk checkpoint columns of ADD_IMPORT_PROGRESS.sql;
+        # streaming imports then run without resume support
+        self._import_progress_available = True
+        
+        # Optional local replica of stock_master/historical_prices (price_replica.py)
+        self.replica = None
+        
+        # Optional write-behind queue for live prices and holdings (write_behind.py)
+        self.write_behind = None
+        
+        # Point-in-time holdings from transactions + snapshots (ledger.py)
+        self.ledger = PortfolioLedger(self)
+        
+        # Every table/rpc call is traced (query_tracer.py)
+        if client is not None:
+            self.supabase: Client = TracedClient(client)
+            return
+        
         try:
-            # Get and validate Supabase credentials
-            supabase_url = st.secrets["supabase"]["url"]
-            supabase_key = st.secrets["supabase"]["key"]
-            
-            # Debug: Show what we're reading (first/last chars only for security)
-            st.info(f"🔍 Debug - URL starts with: {supabase_url[:30]}... ends with: ...{supabase_url[-20:]}")
-            st.info(f"🔍 Debug - URL length: {len(supabase_url)} characters")
-            st.info(f"🔍 Debug - Key length: {len(supabase_key)} characters")
-            
-            # Validate URL format
-            if not supabase_url or not supabase_url.startswith("https://"):
-                raise ValueError(f"Invalid Supabase URL format. Must start with 'https://'. Got: {supabase_url[:50]}...")
-            
-            if not supabase_key or len(supabase_key) < 20:
-                raise ValueError("Invalid Supabase key. Key appears to be too short or empty.")
+            supabase_url, supabase_key = _load_supabase_credentials()
             
             # Create client
-            self.supabase: Client = create_client(
-                supabase_url.strip(),
-                supabase_key.strip()
-            )
+            self.supabase: Client = TracedClient(create_client(supabase_url, supabase_key))
             
-            st.success("✅ Database connected successfully!")
+            logger.info(
+                "Supabase client created for %s... (url %d chars, key %d chars)",
+                supabase_url[:30], len(supabase_url), len(supabase_key)
+            )
             
         except KeyError as e:
             st.error(f"❌ Missing Supabase configuration in secrets: {e}")
@@ -80,7 +178,7 @@ class SharedDatabaseManager:
         try:
             password_hash = self.hash_password(password)
             
-            response = self.supabase.table('users').select('*').eq(
+            response = self.supabase.table('users').select(self.PROJECTIONS['user_row']).eq(
                 'username', username
             ).eq('password_hash', password_hash).execute()
             
@@ -105,14 +203,21 @@ class SharedDatabaseManager:
                 'ai_summary': ai_summary
             }).execute()
             
+            self._invalidate_pdf_context(user_id)
+            self.bump_data_version(user_id)
             return {'success': True, 'pdf': response.data[0]}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_user_pdfs(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all PDFs for a user"""
+    def get_user_pdfs(self, user_id: str, projection: str = 'pdf_list_item') -> List[Dict[str, Any]]:
+        """
+        Get all PDFs for a user
+        
+        The default projection leaves out pdf_text so the library list does not
+        download every document body; use get_pdf_by_id for the full record.
+        """
         try:
-            response = self.supabase.table('user_pdfs').select('*').eq(
+            response = self.supabase.table('user_pdfs').select(self.PROJECTIONS[projection]).eq(
                 'user_id', user_id
             ).order('uploaded_at', desc=True).execute()
             
@@ -135,30 +240,118 @@ class SharedDatabaseManager:
             st.error(f"Error fetching PDF: {str(e)}")
             return None
     
-    def delete_pdf(self, pdf_id: str) -> bool:
-        """Delete a PDF"""
+    def delete_pdf(self, pdf_id: str, user_id: Optional[str] = None) -> bool:
+        """Delete a PDF (pass user_id so only that user's cached context is dropped)"""
         try:
             self.supabase.table('user_pdfs').delete().eq('id', pdf_id).execute()
+            self._invalidate_pdf_context(user_id)
+            if user_id:
+                self.bump_data_version(user_id)
             return True
         except Exception as e:
             st.error(f"Error deleting PDF: {str(e)}")
             return False
     
     def get_all_pdfs_text(self, user_id: str) -> str:
-        """Get combined text from all user PDFs for AI context"""
+        """
+        Get combined text from all user PDFs for AI context
+        
+        Served from a per-user cache that save_pdf/delete_pdf invalidate; only
+        successful reads are cached. On a miss the truncation and concatenation run in the database
+        (get_user_pdf_context RPC), so only the final blob crosses the wire.
+        """
+        with self._pdf_context_lock:
+            if user_id in self._pdf_context_cache:
+                return self._pdf_context_cache[user_id]
+        
         try:
-            pdfs = self.get_user_pdfs(user_id)
-            if not pdfs:
-                return ""
-            
-            combined_text = "\n\n--- PDF DOCUMENTS ---\n\n"
-            for pdf in pdfs:
-                combined_text += f"\n📄 {pdf['filename']}:\n"
-                combined_text += pdf['pdf_text'][:2000] + "...\n"  # Limit per PDF
-            
-            return combined_text
+            try:
+                response = self.supabase.rpc('get_user_pdf_context', {
+                    'p_user_id': user_id,
+                    'p_chars': PDF_CONTEXT_CHARS
+                }).execute()
+                body = response.data or ""
+            except Exception:
+                # RPC not installed yet (older ADD_PDF_STORAGE.sql) - truncate client-side
+                body = self._build_pdf_context_locally(user_id)
+            
+            combined_text = PDF_CONTEXT_HEADER + body if body else ""
         except Exception as e:
+            # Not cached: the next call retries the read
+            logger.warning("Could not build PDF context for %s: %s", user_id, e)
             return ""
+        
+        with self._pdf_context_lock:
+            self._pdf_context_cache[user_id] = combined_text
+        return combined_text
+    
+    def _build_pdf_context_locally(self, user_id: str) -> str:
+        """
+        Fallback for get_all_pdfs_text when the context RPC is unavailable
+        
+        Reads user_pdfs directly rather than through get_user_pdfs, so a failed
+        read raises instead of looking like "no PDFs" and being cached.
+        """
+        pdfs = self.supabase.table('user_pdfs').select(self.PROJECTIONS['pdf_context_item']).eq(
+            'user_id', user_id
+        ).order('uploaded_at', desc=True).execute().data
+        
+        body = ""
+        for pdf in pdfs:
+            body += f"\n📄 {pdf['filename']}:\n"
+            body += pdf['pdf_text'][:PDF_CONTEXT_CHARS] + "...\n"  # Limit per PDF
+        
+        return body
+    
+    def _invalidate_pdf_context(self, user_id: Optional[str] = None):
+        """Drop the cached AI context for one user (or everyone if unknown)"""
+        with self._pdf_context_lock:
+            if user_id is None:
+                self._pdf_context_cache.clear()
+            else:
+                self._pdf_context_cache.pop(user_id, None)
+    
+    # ========================================================================
+    # DATA VERSIONS (cache invalidation)
+    # ========================================================================
+    
+    def bump_data_version(self, scope: str):
+        """
+        Mark a user's data (or PRICES_SCOPE) as changed
+        
+        No Streamlit calls: also runs on bulk writer and write-behind threads.
+        """
+        if not self._data_versions_available:
+            return
+        try:
+            self.supabase.rpc('bump_data_version', {'p_scope': scope}).execute()
+        except Exception as e:
+            logger.warning("Could not bump data version for %s: %s", scope, e)
+    
+    def get_data_version(self, user_id: str) -> str:
+        """
+        Version stamp of everything a user's cached pages depend on
+        
+        One small read of the user's and the shared price counters. Cache
+        helpers take the stamp as an argument, so a changed stamp is a cache
+        miss and an unchanged one is a hit. Falls back to a time bucket when
+        ADD_DATA_VERSIONS.sql has not been run.
+        """
+        if self._data_versions_available:
+            try:
+                response = self.supabase.table('data_versions').select('scope, version').in_(
+                    'scope', [user_id, PRICES_SCOPE]
+                ).execute()
+                versions = {row['scope']: row['version'] for row in response.data}
+                return f"{versions.get(user_id, 0)}.{versions.get(PRICES_SCOPE, 0)}"
+            except Exception as e:
+                if is_missing_schema_error(e):
+                    logger.warning("data_versions unavailable, run ADD_DATA_VERSIONS.sql: %s", e)
+                    self._data_versions_available = False
+                else:
+                    logger.warning("Could not read data versions, caching by time for now: %s", e)
+        
+        return f"t{int(time.time() // VERSION_FALLBACK_SECONDS)}"
     
     def create_portfolio(self, user_id: str, portfolio_name: str) -> Dict[str, Any]:
         """Create portfolio"""
@@ -175,7 +368,7 @@ class SharedDatabaseManager:
     def get_user_portfolios(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user portfolios"""
         try:
-            response = self.supabase.table('portfolios').select('*').eq(
+            response = self.supabase.table('portfolios').select(self.PROJECTIONS['portfolio_row']).eq(
                 'user_id', user_id
             ).execute()
             return response.data
@@ -200,7 +393,7 @@ class SharedDatabaseManager:
         """
         try:
             # Try to find existing
-            response = self.supabase.table('stock_master').select('*').eq(
+            response = self.supabase.table('stock_master').select(self.PROJECTIONS['stock_id']).eq(
                 'ticker', ticker
             ).eq('stock_name', stock_name).execute()
             
@@ -228,16 +421,178 @@ class SharedDatabaseManager:
             st.error(f"Error creating stock: {str(e)}")
             return None
     
+    def get_or_create_stocks(self, stocks: List[Dict[str, Any]]) -> Dict[Tuple[str, str], str]:
+        """
+        Bulk get_or_create_stock: one lookup per IN_FILTER_BATCH tickers and one upsert
+        
+        Args:
+            stocks: Dicts with ticker, stock_name, asset_type, sector
+        
+        Returns:
+            Dict of {(ticker, stock_name): stock_id}
+        """
+        wanted = {}
+        for stock in stocks:
+            wanted.setdefault((stock['ticker'], stock['stock_name']), stock)
+        
+        ids = {}
+        tickers = list({ticker for ticker, _ in wanted})
+        for i in range(0, len(tickers), IN_FILTER_BATCH):
+            batch = tickers[i:i + IN_FILTER_BATCH]
+            rows = self._fetch_all_pages(
+                lambda: self.supabase.table('stock_master').select(
+                    'id, ticker, stock_name'
+                ).in_('ticker', batch).order('id')
+            )
+            for row in rows:
+                key = (row['ticker'], row['stock_name'])
+                if key in wanted:
+                    ids.setdefault(key, row['id'])
+        
+        new_stocks = []
+        for key, stock in wanted.items():
+            if key not in ids:
+                insert_data = {
+                    'ticker': stock['ticker'],
+                    'stock_name': stock['stock_name'],
+                    'asset_type': stock['asset_type']
+                }
+                if stock.get('sector'):
+                    insert_data['sector'] = stock['sector']
+                new_stocks.append(insert_data)
+        
+        # Insert keys must match across a multi-row insert. Upsert on the unique
+        # key: a concurrent import may have created the same stock since the lookup
+        for has_sector in (True, False):
+            group = [s for s in new_stocks if ('sector' in s) == has_sector]
+            if group:
+                response = self.supabase.table('stock_master').upsert(
+                    group, on_conflict='ticker,stock_name'
+                ).execute()
+                for row in response.data:
+                    ids[(row['ticker'], row['stock_name'])] = row['id']
+        
+        return ids
+    
     def update_stock_live_price(self, stock_id: str, live_price: float):
         """Update live price in stock_master"""
         try:
-            self.supabase.table('stock_master').update({
+            values = {
                 'live_price': live_price,
-                'last_updated': datetime.now().isoformat()
-            }).eq('id', stock_id).execute()
+                # Aware UTC: the price replica's sync watermark compares it with server timestamps
+                'last_updated': datetime.now(timezone.utc).isoformat()
+            }
+            if self.write_behind is not None:
+                self.write_behind.enqueue_live_price({'id': stock_id, **values})
+            else:
+                self.supabase.table('stock_master').update(values).eq('id', stock_id).execute()
+                self.bump_data_version(PRICES_SCOPE)
+            
+            if self.replica is not None:
+                self.replica.apply_update('stock_master', values, stock_id)
         except Exception as e:
             st.caption(f"⚠️ Update stock price error: {str(e)}")
     
+    def bulk_update_live_prices(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Update live prices for many stocks in one bulk upsert
+        
+        Args:
+            updates: List of stock_master rows ({id, ticker, stock_name, asset_type})
+                     with the new live_price. The identifying columns are required
+                     because an upsert row must satisfy the table's NOT NULL columns.
+        
+        Returns:
+            Dict with success, total, saved, failed, chunks, errors
+            (saved counts queued rows when a write-behind queue is attached)
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        records = [{
+            'id': u['id'],
+            'ticker': u['ticker'],
+            'stock_name': u['stock_name'],
+            'asset_type': u['asset_type'],
+            'live_price': u['live_price'],
+            'last_updated': u.get('last_updated', now)
+        } for u in updates if u.get('live_price')]
+        
+        if self.write_behind is None:
+            return self.write_live_prices(records)
+        
+        for record in records:
+            self.write_behind.enqueue_live_price(record)
+            if self.replica is not None:
+                self.replica.apply_update('stock_master', {
+                    'live_price': record['live_price'],
+                    'last_updated': record['last_updated']
+                }, record['id'])
+        return {'success': True, 'total': len(records), 'saved': len(records), 'failed': 0, 'chunks': 0, 'errors': []}
+    
+    def write_live_prices(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Bulk upsert live price rows now (also used by the write-behind flush)
+        
+        Rows that only carry {id, live_price, last_updated} get their NOT NULL
+        identifying columns filled in from stock_master first. No Streamlit calls:
+        this runs on the write-behind thread.
+        """
+        missing = list(dict.fromkeys(
+            r['id'] for r in records if not all(r.get(k) for k in ('ticker', 'stock_name', 'asset_type'))
+        ))
+        if missing:
+            known = self.get_stocks_by_ids(missing)
+            # Stocks deleted in the meantime are dropped rather than re-created
+            unknown = set(missing) - set(known)
+            records = [{**known[r['id']], **r} if r['id'] in known else r
+                       for r in records if r['id'] not in unknown]
+        
+        result = self._bulk_upsert('stock_master', records, on_conflict='id', key_fields=('id',))
+        if result['saved']:
+            self.bump_data_version(PRICES_SCOPE)
+        return result
+    
+    def get_stocks_by_tickers(self, tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up many stocks in stock_master with batched IN queries
+        
+        Returns:
+            Dict of {ticker: {id, ticker, stock_name, asset_type}} (first match per ticker)
+        """
+        stocks = {}
+        unique_tickers = list(dict.fromkeys(tickers))
+        
+        try:
+            # Keep the IN list short enough for the request URL
+            for i in range(0, len(unique_tickers), IN_FILTER_BATCH):
+                response = self.supabase.table('stock_master').select(
+                    'id, ticker, stock_name, asset_type'
+                ).in_('ticker', unique_tickers[i:i + IN_FILTER_BATCH]).execute()
+                
+                for row in response.data:
+                    stocks.setdefault(row['ticker'], row)
+        except Exception as e:
+            st.caption(f"⚠️ Get stocks by tickers error: {str(e)}")
+        
+        return stocks
+    
+    def get_stocks_by_ids(self, stock_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up many stocks in stock_master by id with batched IN queries
+        
+        No Streamlit calls (used by the write-behind flush); errors propagate.
+        
+        Returns:
+            Dict of {stock_id: {id, ticker, stock_name, asset_type, sector}}
+        """
+        stocks = {}
+        unique_ids = list(dict.fromkeys(stock_ids))
+        for i in range(0, len(unique_ids), IN_FILTER_BATCH):
+            response = self.supabase.table('stock_master').select(
+                'id, ticker, stock_name, asset_type, sector'
+            ).in_('id', unique_ids[i:i + IN_FILTER_BATCH]).execute()
+            stocks.update({row['id']: row for row in response.data})
+        return stocks
+    
     def get_transactions_by_stock(self, user_id: str, stock_id: str) -> List[Dict[str, Any]]:
         """Get all transactions for a specific stock"""
         try:
@@ -250,12 +605,26 @@ class SharedDatabaseManager:
     def get_all_unique_stocks(self) -> List[Dict[str, Any]]:
         """Get all unique stocks from stock_master"""
         try:
-            response = self.supabase.table('stock_master').select('*').execute()
+            response = self.supabase.table('stock_master').select(self.PROJECTIONS['stock_row']).execute()
             return response.data
         except Exception as e:
             st.error(f"Error: {str(e)}")
             return []
     
+    def get_stock_names(self) -> List[Dict[str, Any]]:
+        """
+        Ticker, name and asset type of every stock_master row (name resolver)
+        
+        No Streamlit calls: the resolver is built on import worker threads.
+        """
+        try:
+            return self._fetch_all_pages(
+                lambda: self.supabase.table('stock_master').select(self.PROJECTIONS['stock_name_row']).order('ticker')
+            )
+        except Exception as e:
+            logger.warning("Could not read stock names: %s", e)
+            return []
+    
     # ========================================================================
     # SHARED HISTORICAL PRICES (NEW!)
     # ========================================================================
@@ -270,16 +639,111 @@ class SharedDatabaseManager:
         Returns:
             Success boolean
         """
-        try:
-            # Upsert to avoid duplicates
-            self.supabase.table('historical_prices').upsert(
-                prices,
-                on_conflict='stock_id,price_date'
-            ).execute()
-            return True
-        except Exception as e:
-            st.error(f"Error saving historical prices: {str(e)}")
-            return False
+        result = self.save_historical_prices_chunked(prices)
+        
+        if not result['success']:
+            st.error(f"Error saving historical prices: {result['failed']} of {result['total']} records failed ({'; '.join(result['errors'][:3])})")
+        
+        return result['success']
+    
+    def save_historical_prices_chunked(
+        self,
+        prices: List[Dict[str, Any]],
+        chunk_size: Optional[int] = None,
+        max_workers: int = BULK_MAX_WORKERS,
+        max_retries: int = BULK_MAX_RETRIES
+    ) -> Dict[str, Any]:
+        """
+        Upsert historical prices in payload-sized chunks, written concurrently
+        
+        Args:
+            prices: List of {stock_id, price_date, price, source, iso_year, iso_week}
+            chunk_size: Records per request (None = derived from payload size)
+            max_workers: Maximum concurrent upsert requests
+            max_retries: Attempts per chunk before it is reported as failed
+        
+        Returns:
+            Dict with success, total, saved, failed, chunks, errors
+        """
+        # Same (stock_id, price_date) twice in one statement makes Postgres
+        # reject the whole upsert, so keep the last value per key
+        result = self._bulk_upsert(
+            'historical_prices',
+            prices,
+            on_conflict='stock_id,price_date',
+            key_fields=('stock_id', 'price_date'),
+            chunk_size=chunk_size,
+            max_workers=max_workers,
+            max_retries=max_retries
+        )
+        if result['saved']:
+            self.bump_data_version(PRICES_SCOPE)
+        return result
+    
+    def _bulk_upsert(
+        self,
+        table: str,
+        records: List[Dict[str, Any]],
+        on_conflict: str,
+        key_fields: Tuple[str, ...],
+        chunk_size: Optional[int] = None,
+        max_workers: int = BULK_MAX_WORKERS,
+        max_retries: int = BULK_MAX_RETRIES
+    ) -> Dict[str, Any]:
+        """
+        Chunked, parallel upsert with per-chunk retries
+        
+        Runs in worker threads, so nothing in here may touch Streamlit;
+        callers report the returned errors from the script thread.
+        """
+        deduped = {}
+        for record in records:
+            deduped[tuple(record.get(field) for field in key_fields)] = record
+        records = list(deduped.values())
+        
+        result = {'success': True, 'total': len(records), 'saved': 0, 'failed': 0, 'chunks': 0, 'errors': []}
+        if not records:
+            return result
+        
+        size = chunk_size or self._optimal_chunk_size(records)
+        chunks = [records[i:i + size] for i in range(0, len(records), size)]
+        result['chunks'] = len(chunks)
+        
+        def write_chunk(chunk: List[Dict[str, Any]]) -> Optional[str]:
+            last_error = None
+            for attempt in range(max_retries):
+                try:
+                    self.supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute()
+                    if self.replica is not None:
+                        self.replica.write_through(table, chunk)
+                    return None
+                except Exception as e:
+                    last_error = str(e)
+                    if attempt < max_retries - 1:
+                        time.sleep(BULK_RETRY_BACKOFF * (2 ** attempt))
+            return last_error
+        
+        workers = max(1, min(max_workers, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            traced_write = in_current_trace(write_chunk)
+            futures = {executor.submit(traced_write, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                error = future.result()
+                if error is None:
+                    result['saved'] += len(futures[future])
+                else:
+                    result['failed'] += len(futures[future])
+                    result['errors'].append(error)
+        
+        result['success'] = result['failed'] == 0
+        return result
+    
+    @staticmethod
+    def _optimal_chunk_size(records: List[Dict[str, Any]]) -> int:
+        """Records per request so that each payload stays near BULK_TARGET_PAYLOAD_BYTES"""
+        sample = records[:50]
+        avg_bytes = max(1, len(json.dumps(sample, default=str)) // len(sample))
+        return max(BULK_MIN_CHUNK_SIZE, min(BULK_MAX_CHUNK_SIZE, BULK_TARGET_PAYLOAD_BYTES // avg_bytes))
     
     def get_historical_prices_for_stock(
         self,
@@ -289,7 +753,7 @@ class SharedDatabaseManager:
     ) -> List[Dict[str, Any]]:
         """Get historical prices for a stock from shared table"""
         try:
-            response = self.supabase.table('historical_prices').select('*').eq(
+            response = self._price_reader().table('historical_prices').select(self.PROJECTIONS['price_point']).eq(
                 'stock_id', stock_id
             ).gte('price_date', start_date).lte('price_date', end_date).order(
                 'price_date', desc=False
@@ -303,7 +767,7 @@ class SharedDatabaseManager:
     def get_historical_prices_for_stock_silent(self, stock_id: str) -> List[Dict[str, Any]]:
         """Get all historical prices for a stock without logging (for charts)"""
         try:
-            response = self.supabase.table('historical_prices').select('*').eq(
+            response = self._price_reader().table('historical_prices').select(self.PROJECTIONS['price_point']).eq(
                 'stock_id', stock_id
             ).order('price_date', desc=False).execute()
             
@@ -311,6 +775,130 @@ class SharedDatabaseManager:
         except Exception as e:
             return []
     
+    # ========================================================================
+    # PRICE READ VIEWS (ADD_PRICE_VIEWS.sql)
+    # ========================================================================
+    
+    def attach_replica(self, replica):
+        """Serve shared price reads from a local PriceReplica"""
+        self.replica = replica
+    
+    def _price_reader(self):
+        """Client for shared price reads: the local replica when attached, else Supabase"""
+        if self.replica is not None:
+            try:
+                # At most one small delta query per sync interval
+                self.replica.maybe_sync()
+            except Exception as e:
+                logger.warning("Price replica sync failed: %s", e)
+            return self.replica.client
+        return self.supabase
+    
+    def _fetch_all_pages(self, build) -> List[Dict[str, Any]]:
+        """Run build() -> query repeatedly with .range() until a short page comes back"""
+        rows = []
+        offset = 0
+        while True:
+            page = build().range(offset, offset + PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+    
+    def _read_price_view(self, view: str, columns: str, apply_filters) -> List[Dict[str, Any]]:
+        """
+        Read from a materialized price view, falling back to historical_prices
+        
+        Args:
+            view: 'weekly_prices' or 'latest_prices'
+            columns: Columns to select (must exist on both the view and the table)
+            apply_filters: Callable adding filters/ordering to a query builder
+        """
+        reader = self._price_reader()
+        if reader is not self.supabase:
+            return self._fetch_all_pages(lambda: apply_filters(reader.table(view).select(columns)))
+        
+        if self._price_views_available:
+            try:
+                return self._fetch_all_pages(lambda: apply_filters(self.supabase.table(view).select(columns)))
+            except Exception as e:
+                if is_missing_schema_error(e):
+                    logger.warning("Price views unavailable, run ADD_PRICE_VIEWS.sql: %s", e)
+                    self._price_views_available = False
+                else:
+                    logger.warning("Could not read %s, reading historical_prices instead: %s", view, e)
+        
+        def base_table_query():
+            query = self.supabase.table('historical_prices').select(columns)
+            if view == 'latest_prices':
+                # Same rows as the view: PMS/AIF index levels are not prices
+                query = query.or_(f'source.is.null,source.neq.{CAGR_INDEX_SOURCE}')
+            return apply_filters(query)
+        
+        return self._fetch_all_pages(base_table_query)
+    
+    def refresh_price_views(self) -> bool:
+        """Refresh latest_prices and weekly_prices after bulk price writes"""
+        try:
+            self.supabase.rpc('refresh_price_views', {}).execute()
+            self._price_views_available = True
+            # Holdings read current_price through latest_prices
+            self.bump_data_version(PRICES_SCOPE)
+            return True
+        except Exception as e:
+            return False
+    
+    def get_weekly_prices_for_stocks(
+        self,
+        stock_ids: List[str],
+        start_date: str,
+        end_date: str
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get weekly closes for many stocks in batched reads (for 52-week charts)
+        
+        Returns:
+            Dict of {stock_id: [{price_date, price, iso_year, iso_week}, ...]} ordered by date
+        """
+        prices = {stock_id: [] for stock_id in stock_ids}
+        
+        try:
+            for i in range(0, len(stock_ids), IN_FILTER_BATCH):
+                batch = stock_ids[i:i + IN_FILTER_BATCH]
+                rows = self._read_price_view(
+                    'weekly_prices',
+                    'stock_id, ' + self.PROJECTIONS['price_point'],
+                    lambda q: q.in_('stock_id', batch).gte('price_date', start_date).lte(
+                        'price_date', end_date
+                    ).order('stock_id').order('price_date')
+                )
+                for row in rows:
+                    prices[row['stock_id']].append(row)
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+        
+        return prices
+    
+    def get_latest_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        """Get the most recent stored price per stock from latest_prices"""
+        latest = {}
+        
+        try:
+            for i in range(0, len(stock_ids), IN_FILTER_BATCH):
+                batch = stock_ids[i:i + IN_FILTER_BATCH]
+                rows = self._read_price_view(
+                    'latest_prices',
+                    'stock_id, price_date, price',
+                    lambda q: q.in_('stock_id', batch).order('stock_id').order('price_date')
+                )
+                # Base-table fallback returns every row; ascending order keeps the newest
+                for row in rows:
+                    latest[row['stock_id']] = float(row['price'])
+        except Exception as e:
+            st.caption(f"⚠️ Get latest prices error: {str(e)}")
+        
+        return latest
+    
     def get_missing_weeks_for_stock(
         self,
         stock_id: str,
@@ -330,17 +918,176 @@ class SharedDatabaseManager:
         """
         try:
             # Get all cached weeks for this stock in this year
-            response = self.supabase.table('historical_prices').select(
-                'iso_week'
-            ).eq('stock_id', stock_id).eq('iso_year', year).execute()
+            rows = self._read_price_view(
+                'weekly_prices',
+                'iso_week',
+                lambda q: q.eq('stock_id', stock_id).eq('iso_year', year)
+            )
             
-            cached_weeks = [row['iso_week'] for row in response.data]
+            cached_weeks = set(row['iso_week'] for row in rows)
             missing = [w for w in week_numbers if w not in cached_weeks]
             
             return missing
         except Exception as e:
             return week_numbers  # Assume all missing if error
     
+    # ========================================================================
+    # IMPORT DEDUPLICATION (ADD_IMPORT_DEDUP.sql)
+    # ========================================================================
+    
+    def find_imported_file(self, user_id: str, portfolio_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Completed upload of the same file contents into the same portfolio
+        
+        Returns:
+            file_uploads row, or None if the file has not been imported
+        """
+        if not self._import_dedup_available:
+            return None
+        try:
+            response = self.supabase.table('file_uploads').select(
+                'id, file_name, upload_date, rows_imported'
+            ).eq('user_id', user_id).eq('portfolio_id', portfolio_id).eq(
+                'content_hash', content_hash
+            ).eq('processing_status', 'completed').limit(1).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            if is_missing_schema_error(e):
+                logger.warning("Import dedup unavailable, run ADD_IMPORT_DEDUP.sql: %s", e)
+                self._import_dedup_available = False
+            else:
+                # Row fingerprints still catch the duplicates of a re-upload
+                logger.warning("Could not look up earlier imports of %s: %s", content_hash[:12], e)
+            return None
+    
+    def record_file_upload(self, user_id: str, portfolio_id: str, file_name: str, file_size: int,
+                           content_hash: str, status: str, rows_imported: int = 0,
+                           error_message: str = None) -> Dict[str, Any]:
+        """
+        Log an import in file_uploads
+        
+        Only 'completed' uploads are treated as already imported; a 'partial'
+        upload is retried row by row on the next attempt.
+        """
+        record = {
+            'user_id': user_id,
+            'file_name': file_name,
+            'file_type': 'csv',
+            'file_size': file_size,
+            'processing_status': status,
+            'error_message': error_message
+        }
+        if self._import_dedup_available:
+            record.update({
+                'portfolio_id': portfolio_id,
+                'content_hash': content_hash,
+                'rows_imported': rows_imported
+            })
+        try:
+            response = self.supabase.table('file_uploads').insert(record).execute()
+            return {'success': True, 'upload': response.data[0] if response.data else record}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    def find_resumable_upload(self, user_id: str, portfolio_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Newest unfinished import of the same file into the same portfolio
+        
+        Returns:
+            file_uploads row with its chunk checkpoint, or None
+        """
+        if not (self._import_dedup_available and self._import_progress_available):
+            return None
+        try:
+            response = self.supabase.table('file_uploads').select(
+                'id, chunk_rows, chunks_completed, rows_processed, rows_imported'
+            ).eq('user_id', user_id).eq('portfolio_id', portfolio_id).eq(
+                'content_hash', content_hash
+            ).in_('processing_status', list(RESUMABLE_UPLOAD_STATUSES)).order(
+                'upload_date', desc=True
+            ).limit(1).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            if is_missing_schema_error(e):
+                logger.warning("Import checkpoints unavailable, run ADD_IMPORT_PROGRESS.sql: %s", e)
+                self._import_progress_available = False
+            else:
+                logger.warning("Could not look up a resumable import of %s: %s", content_hash[:12], e)
+            return None
+    
+    def update_file_upload(self, upload_id: str, **fields) -> bool:
+        """
+        Update an import's status / counters / checkpoint
+        
+        Checkpoint columns are dropped silently when ADD_IMPORT_PROGRESS.sql
+        has not been run. No Streamlit calls: imports may run off the script thread.
+        """
+        if not self._import_progress_available:
+            for column in ('chunk_rows', 'chunks_completed', 'rows_processed', 'updated_at'):
+                fields.pop(column, None)
+        else:
+            fields['updated_at'] = datetime.now().isoformat()
+        if not fields or not upload_id:
+            return False
+        try:
+            self.supabase.table('file_uploads').update(fields).eq('id', upload_id).execute()
+            return True
+        except Exception as e:
+            logger.warning("Could not update upload %s: %s", upload_id, e)
+            return False
+    
+    def get_file_uploads(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        A user's most recent imports, newest first (import job status)
+        
+        Returns:
+            file_uploads rows; progress columns are None without ADD_IMPORT_PROGRESS.sql
+        """
+        base = 'id, file_name, file_size, upload_date, processing_status, error_message'
+        columns = base + (', rows_imported, rows_processed, updated_at' if self._import_progress_available else '')
+        try:
+            response = self.supabase.table('file_uploads').select(columns).eq(
+                'user_id', user_id
+            ).order('upload_date', desc=True).limit(limit).execute()
+            return response.data
+        except Exception as e:
+            if columns == base or not is_missing_schema_error(e):
+                logger.warning("Could not read uploads for %s: %s", user_id, e)
+                return []
+            self._import_progress_available = False
+            return self.get_file_uploads(user_id, limit)
+    
+    def existing_row_hashes(self, portfolio_id: str, row_hashes: List[str]) -> set:
+        """
+        Subset of row_hashes already stored for a portfolio
+        
+        One set-membership query per IN_FILTER_BATCH hashes.
+        
+        Raises:
+            Exception: on errors other than a missing row_hash column, so the
+            caller fails the chunk instead of importing every row as new
+        """
+        if not self._import_dedup_available or not row_hashes:
+            return set()
+        
+        unique_hashes = list(dict.fromkeys(row_hashes))
+        found = set()
+        try:
+            for i in range(0, len(unique_hashes), IN_FILTER_BATCH):
+                batch = unique_hashes[i:i + IN_FILTER_BATCH]
+                response = self.supabase.table('user_transactions').select('row_hash').eq(
+                    'portfolio_id', portfolio_id
+                ).in_('row_hash', batch).execute()
+                found.update(row['row_hash'] for row in response.data)
+            return found
+        except Exception as e:
+            if not is_missing_schema_error(e):
+                logger.warning("Row fingerprint lookup failed for portfolio %s: %s", portfolio_id, e)
+                raise
+            logger.warning("Import dedup unavailable, run ADD_IMPORT_DEDUP.sql: %s", e)
+            self._import_dedup_available = False
+            return set()
+    
     # ========================================================================
     # USER TRANSACTIONS (UPDATED!)
     # ========================================================================
@@ -364,19 +1111,10 @@ class SharedDatabaseManager:
             if not stock_id:
                 return {'success': False, 'error': 'Could not create stock'}
             
-            # Calculate week info from transaction date
-            try:
-                trans_date = pd.to_datetime(transaction_data['transaction_date'])
-                iso_year = trans_date.isocalendar()[0]
-                iso_week = trans_date.isocalendar()[1]
-                week_label = f"Wk{iso_week} {iso_year}"
-            except Exception as e:
-                # Fallback if isocalendar fails
-                from datetime import datetime
-                trans_date = datetime.strptime(transaction_data['transaction_date'], '%Y-%m-%d')
-                iso_year = trans_date.year
-                iso_week = trans_date.isocalendar()[1]
-                week_label = f"Wk{iso_week} {iso_year}"
+            # Calculate week info from transaction date (precomputed ISO calendar)
+            week = wc.date_to_week_key(transaction_data['transaction_date'])
+            iso_year, iso_week = wc.split_week_key(week)
+            week_label = wc.week_label(week)
             
             # Create transaction with week tracking
             trans_insert = {
@@ -395,66 +1133,224 @@ class SharedDatabaseManager:
                 'week_label': week_label
             }
             
+            # Natural-key fingerprint from imports (see import_dedup.py)
+            if transaction_data.get('row_hash') and self._import_dedup_available:
+                trans_insert['row_hash'] = transaction_data['row_hash']
+            
             response = self.supabase.table('user_transactions').insert(trans_insert).execute()
             
-            # Update holdings
-            self._update_holdings(transaction_data['user_id'], transaction_data['portfolio_id'], stock_id)
+            # Snapshots on or after this date no longer match the ledger
+            self.ledger.invalidate(transaction_data['portfolio_id'], transaction_data['transaction_date'])
+            
+            # Update holdings (deferred and coalesced per stock when write-behind is on);
+            # the recompute bumps the user's data version
+            if self.write_behind is not None:
+                self.write_behind.enqueue_holdings(transaction_data['user_id'], transaction_data['portfolio_id'], stock_id)
+                self.bump_data_version(transaction_data['user_id'])
+            else:
+                self._update_holdings(transaction_data['user_id'], transaction_data['portfolio_id'], stock_id)
             
             return {'success': True, 'transaction': response.data[0]}
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            # The unique row_hash index rejects a row another import stored first
+            duplicate = bool(transaction_data.get('row_hash')) and 'row_hash' in str(e)
+            return {'success': False, 'error': str(e), 'duplicate': duplicate}
+    
+    def add_transactions_bulk(self, transactions: List[Dict[str, Any]], update_holdings: bool = True) -> Dict[str, Any]:
+        """
+        Insert many transactions and update the affected holdings once
+        
+        Stocks are resolved in bulk, week info is computed for the whole batch,
+        rows are inserted in order in payload-sized chunks, and each affected
+        holding is recomputed once at the end instead of after every row.
+        
+        Args:
+            transactions: Same dicts as add_transaction (user_id, portfolio_id,
+                          ticker, stock_name, asset_type, sector, ...; optional row_hash)
+            update_holdings: False leaves the recompute to the caller (e.g. once
+                             after every chunk of a streaming import)
+        
+        Returns:
+            Dict with success, inserted, duplicates, failed, errors and
+            holding_keys (the (user_id, portfolio_id, stock_id) keys touched)
+        """
+        result = {'success': True, 'inserted': 0, 'duplicates': 0, 'failed': 0, 'errors': [], 'holding_keys': []}
+        if not transactions:
+            return result
+        
+        try:
+            stock_ids = self.get_or_create_stocks(transactions)
+        except Exception as e:
+            return {**result, 'success': False, 'failed': len(transactions), 'errors': [str(e)]}
+        
+        weeks = wc.dates_to_week_keys([t['transaction_date'] for t in transactions])
+        
+        records = []
+        for trans, week in zip(transactions, weeks.tolist()):
+            stock_id = stock_ids.get((trans['ticker'], trans['stock_name']))
+            if not stock_id:
+                result['failed'] += 1
+                result['errors'].append(f"Could not create stock {trans['ticker']}")
+                continue
+            iso_year, iso_week = wc.split_week_key(week)
+            record = {
+                'user_id': trans['user_id'],
+                'portfolio_id': trans['portfolio_id'],
+                'stock_id': stock_id,
+                'quantity': trans['quantity'],
+                'price': trans['price'],
+                'transaction_date': trans['transaction_date'],
+                'transaction_type': trans['transaction_type'],
+                'channel': trans.get('channel', 'Direct'),
+                'notes': trans.get('notes', ''),
+                'iso_year': iso_year,
+                'iso_week': iso_week,
+                'week_label': wc.week_label(week)
+            }
+            if trans.get('row_hash') and self._import_dedup_available:
+                record['row_hash'] = trans['row_hash']
+            records.append(record)
+        
+        # Sequential chunks keep ledger_seq in file order; a chunk rejected by
+        # the row_hash index is retried row by row to isolate the duplicates
+        inserted = []
+        size = self._optimal_chunk_size(records) if records else 1
+        for i in range(0, len(records), size):
+            chunk = records[i:i + size]
+            try:
+                self.supabase.table('user_transactions').insert(chunk).execute()
+                inserted.extend(chunk)
+                continue
+            except Exception:
+                pass
+            for record in chunk:
+                try:
+                    self.supabase.table('user_transactions').insert(record).execute()
+                    inserted.append(record)
+                except Exception as e:
+                    if record.get('row_hash') and 'row_hash' in str(e):
+                        result['duplicates'] += 1
+                    else:
+                        result['failed'] += 1
+                        result['errors'].append(str(e))
+        result['inserted'] = len(inserted)
+        
+        # Snapshots on or after the earliest new date no longer match the ledger
+        earliest: Dict[str, str] = {}
+        for record in inserted:
+            pid = record['portfolio_id']
+            earliest[pid] = min(earliest.get(pid, record['transaction_date']), record['transaction_date'])
+        for portfolio_id, from_date in earliest.items():
+            self.ledger.invalidate(portfolio_id, from_date)
+        
+        keys = list(dict.fromkeys((r['user_id'], r['portfolio_id'], r['stock_id']) for r in inserted))
+        result['holding_keys'] = keys
+        if keys and update_holdings:
+            if self.write_behind is not None:
+                for key in keys:
+                    self.write_behind.enqueue_holdings(*key)
+                for user_id in dict.fromkeys(user_id for user_id, _, _ in keys):
+                    self.bump_data_version(user_id)
+            else:
+                holdings = self.recompute_holdings(keys)
+                result['errors'].extend(holdings['errors'])
+        
+        result['success'] = result['failed'] == 0 and not result['errors']
+        return result
     
     def _update_holdings(self, user_id: str, portfolio_id: str, stock_id: str):
         """Update holdings based on transactions"""
-        try:
-            # Get all transactions for this stock
-            response = self.supabase.table('user_transactions').select('*').eq(
-                'user_id', user_id
-            ).eq('portfolio_id', portfolio_id).eq('stock_id', stock_id).execute()
-            
-            transactions = response.data
-            
-            if not transactions:
-                return
-            
-            # Calculate total quantity and average price
-            total_qty = 0
-            total_cost = 0
-            
-            for trans in transactions:
-                qty = float(trans['quantity'])
-                price = float(trans['price'])
+        result = self.recompute_holdings([(user_id, portfolio_id, stock_id)])
+        if not result['success']:
+            st.caption(f"⚠️ Update holdings error: {result['errors'][0]}")
+    
+    def recompute_holdings(self, keys: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+        """
+        Recompute many holdings from their transactions
+        
+        Transactions are read with one batched query per (user, portfolio),
+        holdings are written with one bulk upsert and one delete per
+        (user, portfolio). No Streamlit calls: this runs on the write-behind thread.
+        
+        Args:
+            keys: (user_id, portfolio_id, stock_id) tuples
+        
+        Returns:
+            Dict with success, upserted, deleted, errors
+        """
+        result = {'success': True, 'upserted': 0, 'deleted': 0, 'errors': []}
+        
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for user_id, portfolio_id, stock_id in dict.fromkeys(keys):
+            groups.setdefault((user_id, portfolio_id), []).append(stock_id)
+        
+        upserts = []
+        for (user_id, portfolio_id), stock_ids in groups.items():
+            try:
+                transactions = []
+                for i in range(0, len(stock_ids), IN_FILTER_BATCH):
+                    batch = stock_ids[i:i + IN_FILTER_BATCH]
+                    transactions.extend(self._fetch_all_pages(
+                        lambda: self.supabase.table('user_transactions').select(
+                            'id, stock_id, ' + self.PROJECTIONS['holding_calc']
+                        ).eq('user_id', user_id).eq('portfolio_id', portfolio_id).in_(
+                            'stock_id', batch
+                        ).order('id')
+                    ))
                 
-                if trans['transaction_type'] == 'buy':
-                    total_cost += qty * price
-                    total_qty += qty
-                else:  # sell
-                    total_qty -= qty
-            
-            if total_qty > 0:
-                avg_price = total_cost / total_qty
+                # Calculate total quantity and cost per stock (same rules as the ledger)
+                totals: Dict[str, List[float]] = {}
+                for trans in transactions:
+                    apply_event(totals, trans)
                 
-                # Upsert holding
-                self.supabase.table('holdings').upsert({
-                    'user_id': user_id,
-                    'portfolio_id': portfolio_id,
-                    'stock_id': stock_id,
-                    'total_quantity': total_qty,
-                    'average_price': avg_price
-                }, on_conflict='user_id,portfolio_id,stock_id').execute()
-            else:
-                # Delete holding if quantity = 0
-                self.supabase.table('holdings').delete().eq(
-                    'user_id', user_id
-                ).eq('portfolio_id', portfolio_id).eq('stock_id', stock_id).execute()
+                # Stocks without any transactions are left untouched
+                closed = []
+                for stock_id, (total_qty, total_cost) in totals.items():
+                    if total_qty > 0:
+                        upserts.append({
+                            'user_id': user_id,
+                            'portfolio_id': portfolio_id,
+                            'stock_id': stock_id,
+                            'total_quantity': total_qty,
+                            'average_price': total_cost / total_qty
+                        })
+                    else:
+                        closed.append(stock_id)
+                
+                # Delete holdings whose quantity = 0
+                if closed:
+                    self.supabase.table('holdings').delete().eq(
+                        'user_id', user_id
+                    ).eq('portfolio_id', portfolio_id).in_('stock_id', closed).execute()
+                    result['deleted'] += len(closed)
+            except Exception as e:
+                result['errors'].append(str(e))
         
-        except Exception as e:
-            st.caption(f"⚠️ Update holdings error: {str(e)}")
+        if upserts:
+            written = self._bulk_upsert(
+                'holdings', upserts,
+                on_conflict='user_id,portfolio_id,stock_id',
+                key_fields=('user_id', 'portfolio_id', 'stock_id')
+            )
+            result['upserted'] = written['saved']
+            result['errors'].extend(written['errors'])
+        
+        for user_id in dict.fromkeys(user_id for user_id, _ in groups):
+            self.bump_data_version(user_id)
+        
+        result['success'] = not result['errors']
+        return result
+    
+    def flush_pending_writes(self) -> Dict[str, Any]:
+        """Apply queued write-behind writes now (call before reading them back)"""
+        if self.write_behind is None:
+            return {'applied': {}, 'errors': []}
+        return self.write_behind.flush()
     
     def get_user_holdings(self, user_id: str, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get user holdings with stock details (uses view)"""
         try:
-            query = self.supabase.table('user_holdings_detailed').select('*').eq('user_id', user_id)
+            query = self.supabase.table('user_holdings_detailed').select(self.PROJECTIONS['holding_row']).eq('user_id', user_id)
             
             if portfolio_id:
                 query = query.eq('portfolio_id', portfolio_id)
@@ -484,7 +1380,7 @@ class SharedDatabaseManager:
         """Get user holdings without logging (for charts page)"""
         try:
             # Get holdings from the view
-            query = self.supabase.table('user_holdings_detailed').select('*').eq('user_id', user_id)
+            query = self.supabase.table('user_holdings_detailed').select(self.PROJECTIONS['holding_row']).eq('user_id', user_id)
             
             if portfolio_id:
                 query = query.eq('portfolio_id', portfolio_id)
@@ -512,7 +1408,7 @@ class SharedDatabaseManager:
     def get_user_transactions(self, user_id: str, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get user transactions with stock details (uses view)"""
         try:
-            query = self.supabase.table('user_transactions_detailed').select('*').eq(
+            query = self.supabase.table('user_transactions_detailed').select(self.PROJECTIONS['transaction_row']).eq(
                 'user_id', user_id
             ).order('transaction_date', desc=True)
             
@@ -552,112 +1448,111 @@ class SharedDatabaseManager:
             st.code(traceback.format_exc())
             return []
     
+    def _missing_week_sets(self, user_id: str) -> Tuple[Dict[str, np.ndarray], Dict[str, Dict[str, Any]]]:
+        """
+        Missing week keys per stock for a user's transaction stocks
+        
+        Wanted weeks are the user's transaction weeks plus the last 52 weeks;
+        stored weeks come from the weekly view. The current week and each
+        stock's last stored week are always included, since they may have
+        been stored before the week closed. Both are int yyyyww arrays
+        (week_calendar.py), so missing = set difference per stock.
+        
+        Returns:
+            ({stock_id: missing week keys}, {stock_id: stock row})
+        """
+        st.caption("   🔍 Step 1: Getting user transactions...")
+        
+        transactions = self._fetch_all_pages(
+            lambda: self.supabase.table('user_transactions').select(
+                'stock_id, iso_year, iso_week'
+            ).eq('user_id', user_id).order('id')
+        )
+        
+        if not transactions:
+            st.caption("   ⚠️ No transactions found")
+            return {}, {}
+        
+        df = pd.DataFrame(transactions)
+        stock_ids = df['stock_id'].dropna().unique().tolist()
+        dated = df.dropna(subset=['iso_year', 'iso_week'])
+        transaction_weeks = np.unique(wc.year_week_to_keys(dated['iso_year'], dated['iso_week']))
+        
+        st.caption(f"   ✅ Found {len(stock_ids)} unique stocks")
+        st.caption(f"   ✅ Found {len(transaction_weeks)} transaction weeks")
+        
+        # Last 52 weeks (plus the current one)
+        last_52_weeks = wc.last_n_week_keys(52)
+        st.caption(f"   📅 Last 52 weeks: {wc.week_label(last_52_weeks[0])} to {wc.week_label(last_52_weeks[-1])}")
+        
+        # Combine transaction weeks + last 52 weeks (unique, sorted)
+        all_weeks = np.union1d(transaction_weeks, last_52_weeks)
+        st.caption(f"   ✅ Total weeks to check: {len(all_weeks)} (transaction weeks + last 52 weeks)")
+        
+        # Get stock details (one batched lookup)
+        st.caption("   🔍 Step 2: Getting stock details from stock_master...")
+        stocks = self.get_stocks_by_ids(stock_ids)
+        st.caption(f"   ✅ Retrieved details for {len(stocks)} stocks")
+        
+        # OPTIMIZATION: Get ALL existing weeks for this user's stocks from the weekly view
+        st.caption("   🔍 Step 3: Checking existing prices (bulk query)...")
+        
+        existing_rows = []
+        for i in range(0, len(stock_ids), IN_FILTER_BATCH):
+            batch = stock_ids[i:i + IN_FILTER_BATCH]
+            existing_rows.extend(self._read_price_view(
+                'weekly_prices',
+                'stock_id, iso_year, iso_week',
+                lambda q: q.in_('stock_id', batch).order('stock_id').order('iso_year').order('iso_week')
+            ))
+        
+        existing = pd.DataFrame(existing_rows, columns=['stock_id', 'iso_year', 'iso_week'])
+        existing['week'] = wc.year_week_to_keys(existing['iso_year'], existing['iso_week'])
+        existing_by_stock = {sid: group['week'].to_numpy() for sid, group in existing.groupby('stock_id')}
+        st.caption(f"   ✅ Found {len(existing)} existing price records")
+        
+        st.caption(f"   📊 Checking {len(stock_ids) * len(all_weeks)} combinations ({len(stock_ids)} stocks × {len(all_weeks)} weeks)")
+        # The current week's close (and live_price) move until it ends: always refetch it
+        return planner.missing_week_keys(all_weeks, existing_by_stock, stock_ids, current_week=int(last_52_weeks[-1])), stocks
+    
+    def plan_missing_week_fetches(self, user_id: str, merge_gap: int = planner.MERGE_GAP_WEEKS) -> List[Dict[str, Any]]:
+        """
+        Fetch plan for a user's missing weekly prices
+        
+        Returns:
+            List of {stock_id, ticker, stock_name, asset_type, start_week, end_week,
+            start_date, end_date, missing_weeks}, one per contiguous gap
+        """
+        try:
+            missing_by_stock, stocks = self._missing_week_sets(user_id)
+            plan = planner.build_fetch_plan(missing_by_stock, stocks, merge_gap)
+            
+            summary = planner.summarize_plan(plan, missing_by_stock)
+            st.caption(f"   ✅ {summary['missing_weeks']} missing weeks across {summary['stocks']} stocks → {summary['tasks']} range request(s)")
+            return plan
+        except Exception as e:
+            st.error(f"❌ Error planning missing weeks: {str(e)}")
+            return []
+    
     def get_missing_weeks_for_user(self, user_id: str) -> List[Dict[str, Any]]:
         """
         Get missing weeks for user's transactions
         Returns list of {stock_id, ticker, year, week} that need historical prices
         
-        OPTIMIZED: Fetch transaction weeks + last 52 weeks for all holdings
+        Prefer plan_missing_week_fetches, which returns one task per gap
+        instead of one dict per missing (stock, week).
         """
         try:
-            from datetime import datetime, timedelta
-            
-            st.caption("   🔍 Step 1: Getting user transactions...")
-            
-            # Get all transactions with their weeks
-            response = self.supabase.table('user_transactions').select(
-                'stock_id, iso_year, iso_week'
-            ).eq('user_id', user_id).execute()
-            
-            if not response.data:
-                st.caption("   ⚠️ No transactions found")
-                return []
-            
-            # Get unique stock IDs and transaction weeks
-            stock_ids = set()
-            transaction_weeks = set()
-            
-            for row in response.data:
-                if row['stock_id']:
-                    stock_ids.add(row['stock_id'])
-                if row['iso_year'] and row['iso_week']:
-                    transaction_weeks.add((row['iso_year'], row['iso_week']))
-            
-            stock_ids = list(stock_ids)
-            st.caption(f"   ✅ Found {len(stock_ids)} unique stocks")
-            st.caption(f"   ✅ Found {len(transaction_weeks)} transaction weeks")
-            
-            # Calculate last 52 weeks
-            current_date = datetime.now()
-            start_date = current_date - timedelta(weeks=52)
-            
-            current_year, current_week, _ = current_date.isocalendar()
-            start_year, start_week, _ = start_date.isocalendar()
-            
-            st.caption(f"   📅 Last 52 weeks: {start_year}-W{start_week:02d} to {current_year}-W{current_week:02d}")
-            
-            # Generate all weeks in the last 52 weeks
-            last_52_weeks = []
-            temp_date = start_date
-            while temp_date <= current_date:
-                year, week, _ = temp_date.isocalendar()
-                if (year, week) not in last_52_weeks:
-                    last_52_weeks.append((year, week))
-                temp_date += timedelta(weeks=1)
-            
-            # Combine transaction weeks + last 52 weeks (unique)
-            all_weeks = list(set(transaction_weeks) | set(last_52_weeks))
-            st.caption(f"   ✅ Total weeks to check: {len(all_weeks)} (transaction weeks + last 52 weeks)")
-            
-            # Get stock details
-            st.caption("   🔍 Step 2: Getting stock details from stock_master...")
-            stock_details = {}
-            for stock_id in stock_ids:
-                stock_response = self.supabase.table('stock_master').select(
-                    'id, ticker, stock_name'
-                ).eq('id', stock_id).execute()
-                
-                if stock_response.data:
-                    stock = stock_response.data[0]
-                    stock_details[stock_id] = stock['ticker']
+            missing_by_stock, stocks = self._missing_week_sets(user_id)
             
-            st.caption(f"   ✅ Retrieved details for {len(stock_details)} stocks")
-            
-            # OPTIMIZATION: Get ALL existing prices for this user's stocks in ONE query
-            st.caption("   🔍 Step 3: Checking existing prices (bulk query)...")
-            
-            existing_prices = {}
-            if stock_ids:
-                # Get all existing prices for user's stocks in one query
-                existing_response = self.supabase.table('historical_prices').select(
-                    'stock_id, iso_year, iso_week'
-                ).in_('stock_id', stock_ids).execute()
-                
-                # Build a set of existing (stock_id, year, week) combinations
-                for row in existing_response.data:
-                    key = (row['stock_id'], row['iso_year'], row['iso_week'])
-                    existing_prices[key] = True
-                
-                st.caption(f"   ✅ Found {len(existing_prices)} existing price records")
-            
-            # Check which combinations are missing
             missing_weeks = []
-            total_checks = len(stock_ids) * len(all_weeks)
-            
-            st.caption(f"   📊 Checking {total_checks} combinations ({len(stock_ids)} stocks × {len(all_weeks)} weeks)")
-            
-            for stock_id in stock_ids:
-                ticker = stock_details.get(stock_id, 'Unknown')
-                
-                for year, week in all_weeks:
-                    key = (stock_id, year, week)
-                    if key not in existing_prices:
-                        missing_weeks.append({
-                            'stock_id': stock_id,
-                            'ticker': ticker,
-                            'year': year,
-                            'week': week
-                        })
+            for stock_id, keys in missing_by_stock.items():
+                ticker = stocks.get(stock_id, {}).get('ticker', 'Unknown')
+                years, weeks = wc.keys_to_year_week(keys)
+                missing_weeks.extend(
+                    {'stock_id': stock_id, 'ticker': ticker, 'year': int(year), 'week': int(week)}
+                    for year, week in zip(years, weeks)
+                )
             
             st.caption(f"   ✅ Found {len(missing_weeks)} missing week prices to fetch")
             st.caption(f"   📈 Includes: Transaction weeks + Last 52 weeks")
@@ -670,3 +1565,73 @@ class SharedDatabaseManager:
             st.code(traceback.format_exc())
             return []
 
+
+
+def get_database_config() -> Dict[str, str]:
+    """
+    Backend selection
+    
+    WMS_DB_BACKEND / WMS_SQLITE_PATH environment variables win over the
+    [database] section in secrets, so offline runs need no secrets file.
+    Backends: 'supabase' (default) or 'sqlite' (embedded, see database_local.py)
+    replica_path / WMS_PRICE_REPLICA serves Supabase price reads from a local
+    replica file (see price_replica.py); write_behind_journal /
+    WMS_WRITE_BEHIND_JOURNAL (empty = off, the default) defers live price and
+    holdings writes through a journaled queue (see write_behind.py)
+    """
+    config = {
+        'backend': 'supabase',
+        'path': 'wealth_manager.db',
+        'replica_path': '',
+        'replica_sync_interval': '300',
+        'write_behind_journal': ''
+    }
+    
+    try:
+        config.update({k: str(v) for k, v in st.secrets.get("database", {}).items()})
+    except Exception:
+        pass  # No secrets file - offline run
+    
+    config['backend'] = os.environ.get('WMS_DB_BACKEND', config['backend']).strip().lower()
+    config['path'] = os.environ.get('WMS_SQLITE_PATH', config['path'])
+    config['replica_path'] = os.environ.get('WMS_PRICE_REPLICA', config['replica_path'])
+    config['write_behind_journal'] = os.environ.get('WMS_WRITE_BEHIND_JOURNAL', config['write_behind_journal'])
+    return config
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_db() -> PortfolioRepository:
+    """
+    Process-wide database manager
+    
+    Built once per server process (credential validation, client creation and
+    logging included) and shared by all sessions and cached helpers. Failed
+    construction is not cached, so a fixed secret is picked up on the next rerun.
+    """
+    config = get_database_config()
+    
+    if config['backend'] == 'sqlite':
+        from database_local import LocalDatabaseManager
+        logger.info("Using embedded SQLite backend at %s", config['path'])
+        return LocalDatabaseManager(config['path'])
+    
+    db = SharedDatabaseManager()
+    
+    if config['replica_path']:
+        from price_replica import PriceReplica
+        db.attach_replica(PriceReplica(
+            db.supabase,
+            config['replica_path'],
+            sync_interval=int(config['replica_sync_interval'])
+        ))
+        logger.info("Serving shared price reads from replica at %s", config['replica_path'])
+    
+    if config['write_behind_journal']:
+        from write_behind import WriteBehindQueue
+        db.write_behind = WriteBehindQueue(db, config['write_behind_journal'])
+        # Replays anything a previous process journaled but never flushed
+        db.write_behind.start()
+        atexit.register(db.write_behind.stop)
+        logger.info("Deferring live price and holdings writes via %s", config['write_behind_journal'])
+    
+    return db
@@ -0,0 +1,242 @@
+"""
+Repository Interface
+Persistence contract shared by every database backend:
+- SharedDatabaseManager: remote Supabase (database_shared.py)
+- LocalDatabaseManager: embedded SQLite (database_local.py)
+Pages, fetchers and managers should only rely on the methods listed here
+"""
+
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, List, Any, Tuple
+
+# Errors meaning a migration has not been run (undefined column / table /
+# function, or not in PostgREST's schema cache), as opposed to transient failures
+MISSING_SCHEMA_CODES = ('42703', '42P01', '42883', 'PGRST202', 'PGRST204', 'PGRST205')
+MISSING_SCHEMA_MESSAGES = ('no such table', 'no such column')  # SQLite backend
+
+
+def is_missing_schema_error(error: Exception) -> bool:
+    """
+    True if error says a table, column or function does not exist
+
+    Optional-feature flags are only switched off for these; timeouts and other
+    transient errors must not downgrade the process until restart.
+    """
+    if isinstance(error, NotImplementedError):  # RPC not provided by the local backend
+        return True
+    code = str(getattr(error, 'code', '') or '')
+    text = str(error)
+    return (code in MISSING_SCHEMA_CODES
+            or any(c in text for c in MISSING_SCHEMA_CODES)
+            or any(m in text.lower() for m in MISSING_SCHEMA_MESSAGES))
+
+
+class PortfolioRepository(ABC):
+    """Backend-independent persistence interface for the wealth manager"""
+
+    # ========================================================================
+    # USERS & PORTFOLIOS
+    # ========================================================================
+
+    @abstractmethod
+    def register_user(self, username: str, password: str, full_name: str, email: str = None) -> Dict[str, Any]:
+        """Register new user, returns {'success', 'user' | 'error'}"""
+
+    @abstractmethod
+    def login_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """Return the user row for valid credentials, else None"""
+
+    @abstractmethod
+    def create_portfolio(self, user_id: str, portfolio_name: str) -> Dict[str, Any]:
+        """Create portfolio, returns {'success', 'portfolio' | 'error'}"""
+
+    @abstractmethod
+    def get_user_portfolios(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get user portfolios"""
+
+    # ========================================================================
+    # DATA VERSIONS
+    # ========================================================================
+
+    @abstractmethod
+    def bump_data_version(self, scope: str):
+        """Mark a user's data (or the shared 'prices' scope) as changed"""
+
+    @abstractmethod
+    def get_data_version(self, user_id: str) -> str:
+        """Version stamp to key a user's caches on"""
+
+    # ========================================================================
+    # PDF STORAGE
+    # ========================================================================
+
+    @abstractmethod
+    def save_pdf(self, user_id: str, filename: str, pdf_text: str, ai_summary: str = None) -> Dict[str, Any]:
+        """Save PDF content"""
+
+    @abstractmethod
+    def get_user_pdfs(self, user_id: str, projection: str = 'pdf_list_item') -> List[Dict[str, Any]]:
+        """List a user's PDFs (without pdf_text by default)"""
+
+    @abstractmethod
+    def get_pdf_by_id(self, pdf_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific PDF including its text"""
+
+    @abstractmethod
+    def delete_pdf(self, pdf_id: str, user_id: Optional[str] = None) -> bool:
+        """Delete a PDF"""
+
+    @abstractmethod
+    def get_all_pdfs_text(self, user_id: str) -> str:
+        """Truncated, combined PDF text for AI context"""
+
+    # ========================================================================
+    # SHARED STOCK MASTER & PRICES
+    # ========================================================================
+
+    @abstractmethod
+    def get_or_create_stock(self, ticker: str, stock_name: str, asset_type: str, sector: str = None) -> Optional[str]:
+        """Return stock_id, creating the stock_master row if needed"""
+
+    @abstractmethod
+    def get_or_create_stocks(self, stocks: List[Dict[str, Any]]) -> Dict[Tuple[str, str], str]:
+        """Bulk get_or_create_stock, returns {(ticker, stock_name): stock_id}"""
+
+    @abstractmethod
+    def update_stock_live_price(self, stock_id: str, live_price: float):
+        """Update one stock's live price"""
+
+    @abstractmethod
+    def bulk_update_live_prices(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Update many live prices in one bulk write"""
+
+    @abstractmethod
+    def write_live_prices(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Bulk write live price rows immediately, bypassing any write-behind queue"""
+
+    @abstractmethod
+    def get_stocks_by_tickers(self, tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batched stock_master lookup by ticker"""
+
+    @abstractmethod
+    def get_stocks_by_ids(self, stock_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batched stock_master lookup by id"""
+
+    @abstractmethod
+    def get_all_unique_stocks(self) -> List[Dict[str, Any]]:
+        """All stocks in stock_master"""
+
+    @abstractmethod
+    def get_stock_names(self) -> List[Dict[str, Any]]:
+        """Ticker, stock_name and asset_type of every stock (all pages)"""
+
+    @abstractmethod
+    def save_historical_prices_bulk(self, prices: List[Dict[str, Any]]) -> bool:
+        """Upsert historical prices, returns success"""
+
+    @abstractmethod
+    def save_historical_prices_chunked(self, prices: List[Dict[str, Any]], chunk_size: Optional[int] = None,
+                                       max_workers: int = 4, max_retries: int = 3) -> Dict[str, Any]:
+        """Chunked parallel upsert of historical prices with a result summary"""
+
+    @abstractmethod
+    def get_historical_prices_for_stock(self, stock_id: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Historical prices for one stock in a date range"""
+
+    @abstractmethod
+    def get_historical_prices_for_stock_silent(self, stock_id: str) -> List[Dict[str, Any]]:
+        """All historical prices for one stock (for charts)"""
+
+    @abstractmethod
+    def refresh_price_views(self) -> bool:
+        """Refresh the latest/weekly price views after bulk writes"""
+
+    @abstractmethod
+    def get_weekly_prices_for_stocks(self, stock_ids: List[str], start_date: str, end_date: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Weekly closes for many stocks"""
+
+    @abstractmethod
+    def get_latest_prices(self, stock_ids: List[str]) -> Dict[str, float]:
+        """Most recent stored price per stock"""
+
+    @abstractmethod
+    def get_missing_weeks_for_stock(self, stock_id: str, year: int, week_numbers: List[int]) -> List[int]:
+        """ISO weeks of a year without a stored price"""
+
+    # ========================================================================
+    # IMPORT DEDUPLICATION
+    # ========================================================================
+
+    @abstractmethod
+    def find_imported_file(self, user_id: str, portfolio_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Completed upload with the same content hash into the same portfolio, if any"""
+
+    @abstractmethod
+    def record_file_upload(self, user_id: str, portfolio_id: str, file_name: str, file_size: int,
+                           content_hash: str, status: str, rows_imported: int = 0,
+                           error_message: str = None) -> Dict[str, Any]:
+        """Log an import with its content hash"""
+
+    @abstractmethod
+    def find_resumable_upload(self, user_id: str, portfolio_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Newest unfinished import of the same file, with its chunk checkpoint"""
+
+    @abstractmethod
+    def update_file_upload(self, upload_id: str, **fields) -> bool:
+        """Update an import's status, counters or checkpoint"""
+
+    @abstractmethod
+    def get_file_uploads(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """A user's most recent imports with their status and progress"""
+
+    @abstractmethod
+    def existing_row_hashes(self, portfolio_id: str, row_hashes: List[str]) -> set:
+        """Row hashes already stored for a portfolio (batched set-membership query)"""
+
+    # ========================================================================
+    # USER TRANSACTIONS & HOLDINGS
+    # ========================================================================
+
+    @abstractmethod
+    def add_transaction(self, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Add a transaction and update the affected holding"""
+
+    @abstractmethod
+    def add_transactions_bulk(self, transactions: List[Dict[str, Any]], update_holdings: bool = True) -> Dict[str, Any]:
+        """Add many transactions, updating each affected holding once"""
+
+    @abstractmethod
+    def get_transactions_by_stock(self, user_id: str, stock_id: str) -> List[Dict[str, Any]]:
+        """All of a user's transactions for one stock"""
+
+    @abstractmethod
+    def get_user_holdings(self, user_id: str, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Holdings with stock details"""
+
+    @abstractmethod
+    def get_user_holdings_silent(self, user_id: str, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Holdings with stock details, without UI logging"""
+
+    @abstractmethod
+    def get_user_transactions(self, user_id: str, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Transactions with stock details"""
+
+    @abstractmethod
+    def get_user_transaction_weeks(self, user_id: str) -> List[Tuple[int, int]]:
+        """Unique (iso_year, iso_week) pairs of a user's transactions"""
+
+    @abstractmethod
+    def get_missing_weeks_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """(stock, week) pairs that still need a historical price"""
+
+    @abstractmethod
+    def plan_missing_week_fetches(self, user_id: str, merge_gap: int = 2) -> List[Dict[str, Any]]:
+        """One (stock, start_date, end_date) fetch task per contiguous run of missing weeks"""
+
+    @abstractmethod
+    def recompute_holdings(self, keys: List[Tuple[str, str, str]]) -> Dict[str, Any]:
+        """Recompute holdings for many (user_id, portfolio_id, stock_id) keys in bulk"""
+
+    @abstractmethod
+    def flush_pending_writes(self) -> Dict[str, Any]:
+        """Apply queued write-behind writes now"""
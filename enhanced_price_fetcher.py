@@ -9,6 +9,8 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 import pandas as pd
 
+from symbol_master import resolve_symbol
+
 
 class EnhancedPriceFetcher:
     """
@@ -34,8 +36,8 @@ class EnhancedPriceFetcher:
         
         # Initialize PMS/AIF calculator
         try:
-            from pms_aif_calculator import PMS_AIF_Calculator
-            self.pms_aif_calculator = PMS_AIF_Calculator()
+            from pms_aif_calculator import get_pms_aif_calculator
+            self.pms_aif_calculator = get_pms_aif_calculator()
         except Exception as e:
             self.pms_aif_calculator = None
             st.caption(f"⚠️ PMS/AIF calculator not available: {str(e)}")
@@ -61,11 +63,12 @@ class EnhancedPriceFetcher:
         
         price = None
         source = None
+        symbol, asset_type, listed = resolve_symbol(ticker, asset_type)
         
         if asset_type == 'stock':
-            price, source = self._get_stock_price_with_fallback(ticker)
+            price, source = self._get_stock_price_with_fallback(symbol, listed)
         elif asset_type == 'mutual_fund':
-            price, source = self._get_mf_price_with_fallback(ticker)
+            price, source = self._get_mf_price_with_fallback(symbol)
         elif asset_type in ['pms', 'aif']:
             # PMS/AIF calculated using CAGR
             # Note: Requires investment details (date, amount)
@@ -85,7 +88,7 @@ class EnhancedPriceFetcher:
         
         return price
     
-    def _get_stock_price_with_fallback(self, ticker: str) -> tuple:
+    def _get_stock_price_with_fallback(self, ticker: str, listed: bool = False) -> tuple:
         """
         Stock price fetching with complete fallback:
         1. yfinance NSE (.NS)
@@ -93,6 +96,8 @@ class EnhancedPriceFetcher:
         3. yfinance without suffix
         4. mftool (in case it's a mutual fund misclassified as stock)
         5. AI (OpenAI)
+        
+        Listed stocks (known to the symbol master) skip step 4.
         """
         st.caption(f"      🔄 Fetching {ticker} with fallback chain...")
         
@@ -145,22 +150,25 @@ class EnhancedPriceFetcher:
             st.caption(f"      ⏭️ Skipped (no suffix to remove)")
         
         # Method 4: Try mftool (in case it's a mutual fund)
-        st.caption(f"      [4/5] Trying mftool (in case it's a MF)...")
-        try:
-            from mftool import Mftool
-            mf = Mftool()
-            
-            # Try ticker as scheme code
-            clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
-            quote = mf.get_scheme_quote(clean_ticker)
-            
-            if quote and 'nav' in quote:
-                price = float(quote['nav'])
-                if price > 0:
-                    st.caption(f"      ✅ Found as MF on mftool: ₹{price:,.2f}")
-                    return price, 'mftool'
-        except Exception as e:
-            st.caption(f"      ❌ mftool failed: {str(e)[:50]}")
+        if listed:
+            st.caption(f"      [4/5] ⏭️ Skipped mftool (listed stock)")
+        else:
+            st.caption(f"      [4/5] Trying mftool (in case it's a MF)...")
+            try:
+                from mftool import Mftool
+                mf = Mftool()
+                
+                # Try ticker as scheme code
+                clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
+                quote = mf.get_scheme_quote(clean_ticker)
+                
+                if quote and 'nav' in quote:
+                    price = float(quote['nav'])
+                    if price > 0:
+                        st.caption(f"      ✅ Found as MF on mftool: ₹{price:,.2f}")
+                        return price, 'mftool'
+            except Exception as e:
+                st.caption(f"      ❌ mftool failed: {str(e)[:50]}")
         
         # Method 5: AI Fallback (if available)
         st.caption(f"      [5/5] Trying AI (OpenAI) as last resort...")
@@ -370,13 +378,16 @@ If you cannot find the NAV, return exactly: NOT_FOUND"""
         Get historical prices with complete fallback chain:
         Stock: yfinance NSE → yfinance BSE → yfinance raw → mftool → AI
         MF: mftool → AI
+        Listed stocks (known to the symbol master) go straight to their
+        provider symbol and skip the mftool step
         """
         st.caption(f"      📅 Fetching historical prices for {ticker} ({start_date} to {end_date})...")
+        ticker, asset_type, listed = resolve_symbol(ticker, asset_type)
         
         try:
             if asset_type == 'stock':
                 # Try yfinance with multiple suffixes and date ranges
-                suffixes = ['.NS', '.BO', '']
+                suffixes = [''] if listed else ['.NS', '.BO', '']
                 for idx, suffix in enumerate(suffixes, 1):
                     suffix_name = 'NSE' if suffix == '.NS' else 'BSE' if suffix == '.BO' else 'raw'
                     st.caption(f"      [{idx}/5] Trying yfinance {suffix_name}...")
@@ -455,41 +466,44 @@ If you cannot find the NAV, return exactly: NOT_FOUND"""
                         st.caption(f"      ❌ {suffix_name} failed: {str(e)[:50]}")
                 
                 # Try mftool (in case it's a mutual fund)
-                st.caption(f"      [4/5] Trying mftool (in case it's a MF)...")
-                try:
-                    from mftool import Mftool
-                    mf = Mftool()
+                if listed:
+                    st.caption(f"      [4/5] ⏭️ Skipped mftool (listed stock)")
+                else:
+                    st.caption(f"      [4/5] Trying mftool (in case it's a MF)...")
+                    try:
+                        from mftool import Mftool
+                        mf = Mftool()
                     
-                    clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
-                    hist_data = mf.get_scheme_historical_nav(clean_ticker, as_Dataframe=True)
+                        clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
+                        hist_data = mf.get_scheme_historical_nav(clean_ticker, as_Dataframe=True)
                     
-                    if hist_data is not None and not hist_data.empty:
-                        hist_data['date'] = pd.to_datetime(hist_data.index, format='%d-%m-%Y', dayfirst=True)
+                        if hist_data is not None and not hist_data.empty:
+                            hist_data['date'] = pd.to_datetime(hist_data.index, format='%d-%m-%Y', dayfirst=True)
                         
-                        # Filter by date range
-                        start_dt = pd.to_datetime(start_date)
-                        end_dt = pd.to_datetime(end_date)
+                            # Filter by date range
+                            start_dt = pd.to_datetime(start_date)
+                            end_dt = pd.to_datetime(end_date)
                         
-                        filtered = hist_data[(hist_data['date'] >= start_dt) & (hist_data['date'] <= end_dt)]
+                            filtered = hist_data[(hist_data['date'] >= start_dt) & (hist_data['date'] <= end_dt)]
                         
-                        if not filtered.empty:
-                            prices = []
-                            for idx, row in filtered.iterrows():
-                                prices.append({
-                                    'asset_symbol': ticker,
-                                    'asset_type': 'mutual_fund',
-                                    'price': float(row['nav']),
-                                    'price_date': row['date'].strftime('%Y-%m-%d'),
-                                    'volume': None
-                                })
-                            st.caption(f"      ✅ Found {len(prices)} historical NAVs on mftool")
-                            return prices
+                            if not filtered.empty:
+                                prices = []
+                                for idx, row in filtered.iterrows():
+                                    prices.append({
+                                        'asset_symbol': ticker,
+                                        'asset_type': 'mutual_fund',
+                                        'price': float(row['nav']),
+                                        'price_date': row['date'].strftime('%Y-%m-%d'),
+                                        'volume': None
+                                    })
+                                st.caption(f"      ✅ Found {len(prices)} historical NAVs on mftool")
+                                return prices
+                            else:
+                                st.caption(f"      ❌ mftool: No data in date range")
                         else:
-                            st.caption(f"      ❌ mftool: No data in date range")
-                    else:
-                        st.caption(f"      ❌ mftool: No historical data")
-                except Exception as e:
-                    st.caption(f"      ❌ mftool failed: {str(e)[:50]}")
+                            st.caption(f"      ❌ mftool: No historical data")
+                    except Exception as e:
+                        st.caption(f"      ❌ mftool failed: {str(e)[:50]}")
             
             elif asset_type == 'mutual_fund':
                 # Try mftool
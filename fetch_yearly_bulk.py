@@ -1,12 +1,19 @@
 """
 Optimized Yearly Bulk Price Fetcher
-Fetches entire year of weekly prices in ONE API call per ticker
+Fetches entire year of weekly prices in ONE API call per ticker,
+or one range request per gap of a missing-week fetch plan
 """
 
+import numpy as np
 import yfinance as yf
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple
 import streamlit as st
+import week_calendar as wc
+from symbol_master import resolve_symbol
+from pms_aif_calculator import CAGR_INDEX_SOURCE, get_pms_aif_calculator
+
+CAGR_ASSET_TYPES = ('pms', 'aif')  # priced from CAGR, not from a provider
 
 
 def fetch_yearly_prices_for_all_tickers(holdings: List[Dict], start_date: datetime, end_date: datetime) -> Dict[str, Dict[Tuple[int, int], float]]:
@@ -20,156 +27,268 @@ def fetch_yearly_prices_for_all_tickers(holdings: List[Dict], start_date: dateti
         end_date: End date for historical data
     
     Returns:
-        Dict of {ticker: {(year, week): price}}
+        Dict of {ticker: {(year, week): price}}; PMS/AIF get their scheme index
     """
-    all_prices = {}
+    schemes = {h['ticker']: h['asset_type'] for h in holdings if h.get('asset_type') in CAGR_ASSET_TYPES}
+    all_prices = _index_prices(_cagr_index(schemes, wc.week_keys_between(start_date, end_date)))
     
     st.caption(f"📊 Fetching yearly data for {len(holdings)} holdings...")
     
     for idx, holding in enumerate(holdings, 1):
         ticker = holding['ticker']
         asset_type = holding.get('asset_type', 'stock')
+        if asset_type in CAGR_ASSET_TYPES:
+            continue
         
         st.caption(f"   [{idx}/{len(holdings)}] Fetching {ticker} ({asset_type})...")
         
-        weekly_prices = {}
-        
-        try:
-            if asset_type == 'stock':
-                # STOCKS: Use yfinance with NSE/BSE
-                yf_ticker = f"{ticker}.NS" if not ticker.endswith(('.NS', '.BO')) else ticker
+        weekly_prices = fetch_weekly_prices_for_range(ticker, asset_type, start_date, end_date)
+        if weekly_prices:
+            all_prices[ticker] = weekly_prices
+    
+    return all_prices
+
+
+def fetch_weekly_prices_for_range(ticker: str, asset_type: str, start_date, end_date) -> Dict[Tuple[int, int], float]:
+    """
+    Fetch weekly prices for one ticker over a date range in ONE API call
+    
+    Aliases the symbol master knows are fetched under their provider symbol.
+    
+    Args:
+        ticker: Ticker as stored in stock_master
+        asset_type: stock, mutual_fund, pms or aif
+        start_date: Start date (datetime or 'YYYY-MM-DD')
+        end_date: End date, inclusive
+    
+    Returns:
+        Dict of {(year, week): price}
+    """
+    weekly_prices = {}
+    ticker, asset_type, _ = resolve_symbol(ticker, asset_type)
+    
+    try:
+        if asset_type == 'stock':
+            # STOCKS: Use yfinance with NSE/BSE
+            yf_ticker = f"{ticker}.NS" if not ticker.endswith(('.NS', '.BO')) else ticker
+            stock = yf.Ticker(yf_ticker)
+
+            # Fetch ENTIRE YEAR of weekly data in ONE call
+            hist = stock.history(start=start_date, end=end_date, interval='1wk')
+
+            if hist.empty:
+                # Try BSE
+                st.caption(f"      Trying BSE...")
+                yf_ticker = f"{ticker}.BO" if not ticker.endswith(('.NS', '.BO')) else ticker.replace('.NS', '.BO')
                 stock = yf.Ticker(yf_ticker)
-                
-                # Fetch ENTIRE YEAR of weekly data in ONE call
                 hist = stock.history(start=start_date, end=end_date, interval='1wk')
-                
-                if hist.empty:
-                    # Try BSE
-                    st.caption(f"      Trying BSE...")
-                    yf_ticker = f"{ticker}.BO" if not ticker.endswith(('.NS', '.BO')) else ticker.replace('.NS', '.BO')
-                    stock = yf.Ticker(yf_ticker)
-                    hist = stock.history(start=start_date, end=end_date, interval='1wk')
-                
-                if not hist.empty:
-                    # Convert to weekly prices
-                    for date, row in hist.iterrows():
-                        year, week, _ = date.isocalendar()
-                        price = float(row['Close'])
-                        if price > 0:
-                            weekly_prices[(year, week)] = price
-                    
-                    all_prices[ticker] = weekly_prices
-                    st.caption(f"      ✅ Got {len(weekly_prices)} weeks of data")
-                else:
-                    st.caption(f"      ⚠️ No data found")
-            
-            elif asset_type == 'mutual_fund':
-                # MUTUAL FUNDS: Use mftool for current NAV, replicate for weeks
-                try:
-                    from mftool import Mftool
-                    mf = Mftool()
-                    
-                    # Get current NAV
-                    clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
-                    quote = mf.get_scheme_quote(clean_ticker)
-                    
-                    if quote and 'nav' in quote:
-                        current_nav = float(quote['nav'])
-                        
-                        # For MF, use current NAV for all weeks (MF NAVs don't change much weekly)
-                        temp_date = start_date
-                        while temp_date <= end_date:
-                            year, week, _ = temp_date.isocalendar()
-                            weekly_prices[(year, week)] = current_nav
-                            temp_date += timedelta(weeks=1)
-                        
-                        all_prices[ticker] = weekly_prices
-                        st.caption(f"      ✅ MF NAV: ₹{current_nav:,.2f} (applied to all weeks)")
-                    else:
-                        st.caption(f"      ⚠️ MF NAV not found")
-                except Exception as e:
-                    st.caption(f"      ❌ MF Error: {str(e)[:50]}")
-            
-            elif asset_type in ['pms', 'aif']:
-                # PMS/AIF: Use CAGR calculation or fixed NAV
-                # For now, skip - these need special handling with transaction context
-                st.caption(f"      ℹ️ PMS/AIF: Requires CAGR calculation (skipped for bulk fetch)")
-            
+
+            if not hist.empty:
+                # Convert to weekly prices (vectorized ISO week keys)
+                years, weeks = wc.keys_to_year_week(wc.dates_to_week_keys(hist.index))
+                for year, week, price in zip(years.tolist(), weeks.tolist(), hist['Close'].astype(float).tolist()):
+                    if price > 0:
+                        weekly_prices[(year, week)] = price
+
+                st.caption(f"      ✅ Got {len(weekly_prices)} weeks of data")
             else:
-                st.caption(f"      ⚠️ Unknown asset type: {asset_type}")
-                
-        except Exception as e:
-            st.caption(f"      ❌ Error: {str(e)[:50]}")
+                st.caption(f"      ⚠️ No data found")
+
+        elif asset_type == 'mutual_fund':
+            # MUTUAL FUNDS: Use mftool for current NAV, replicate for weeks
+            try:
+                from mftool import Mftool
+                mf = Mftool()
+
+                # Get current NAV
+                clean_ticker = ticker.replace('.NS', '').replace('.BO', '').replace('MF_', '')
+                quote = mf.get_scheme_quote(clean_ticker)
+
+                if quote and 'nav' in quote:
+                    current_nav = float(quote['nav'])
+
+                    # For MF, use current NAV for all weeks (MF NAVs don't change much weekly)
+                    for key in wc.week_keys_between(start_date, end_date):
+                        weekly_prices[wc.split_week_key(key)] = current_nav
+
+                    st.caption(f"      ✅ MF NAV: ₹{current_nav:,.2f} (applied to all weeks)")
+                else:
+                    st.caption(f"      ⚠️ MF NAV not found")
+            except Exception as e:
+                st.caption(f"      ❌ MF Error: {str(e)[:50]}")
+
+        elif asset_type in ['pms', 'aif']:
+            # PMS/AIF prices are synthetic: a scheme index compounded at the
+            # SEBI CAGR (see fetch_pms_aif_prices_for_plan)
+            st.caption(f"      ℹ️ PMS/AIF: computed from CAGR, not fetched")
+
+        else:
+            st.caption(f"      ⚠️ Unknown asset type: {asset_type}")
+
+    except Exception as e:
+        st.caption(f"      ❌ Error: {str(e)[:50]}")
+    
+    return weekly_prices
+
+
+def fetch_prices_for_plan(plan: List[Dict]) -> Dict[str, Dict[Tuple[int, int], float]]:
+    """
+    Fill every gap of a missing-week fetch plan with one range request each
+    
+    Args:
+        plan: Tasks from db.plan_missing_week_fetches (ticker, asset_type,
+              start_date, end_date, missing_weeks)
+    
+    Returns:
+        Dict of {ticker: {(year, week): price}}, only weeks inside the planned ranges
+        (PMS/AIF tasks are left to fetch_pms_aif_prices_for_plan)
+    """
+    all_prices = {}
+    plan = [task for task in plan if task.get('asset_type') not in CAGR_ASSET_TYPES]
+    
+    st.caption(f"📊 Filling {len(plan)} gap(s) with one range request each...")
+    
+    for idx, task in enumerate(plan, 1):
+        ticker = task['ticker']
+        asset_type = task.get('asset_type') or 'stock'
+        
+        st.caption(f"   [{idx}/{len(plan)}] {ticker}: {task['start_date']} → {task['end_date']} ({task['missing_weeks']} weeks)")
+        
+        # yfinance treats end as exclusive
+        end_exclusive = datetime.strptime(task['end_date'], '%Y-%m-%d') + timedelta(days=1)
+        weekly_prices = fetch_weekly_prices_for_range(ticker, asset_type, task['start_date'], end_exclusive)
+        
+        # Drop weeks the provider returned outside the gap (e.g. a partial week before start)
+        in_range = {
+            week: price for week, price in weekly_prices.items()
+            if task['start_week'] <= wc.week_key(*week) <= task['end_week']
+        }
+        if in_range:
+            all_prices.setdefault(ticker, {}).update(in_range)
+    
+    return all_prices
+
+
+def fetch_pms_aif_prices_for_plan(plan: List[Dict]) -> Dict[str, Dict[Tuple[int, int], float]]:
+    """
+    Fill the PMS/AIF gaps of a missing-week fetch plan with their scheme index
+    
+    The index depends only on the scheme's SEBI CAGR, so the shared
+    historical_prices rows are the same whoever's plan writes them. Users'
+    lots are applied when reading (PMS_AIF_Calculator.apply_lots).
+    
+    Args:
+        plan: Tasks from db.plan_missing_week_fetches
+    
+    Returns:
+        Dict of {ticker: {(year, week): index level}}, only weeks inside the planned ranges
+    """
+    tasks = [task for task in plan if task.get('asset_type') in CAGR_ASSET_TYPES]
+    if not tasks:
+        return {}
+    
+    st.caption(f"🏦 Computing CAGR index for {len({task['ticker'] for task in tasks})} PMS/AIF scheme(s)...")
+    keys = np.unique(np.concatenate([
+        wc.week_keys_between(wc.week_key_to_monday(task['start_week']), wc.week_key_to_monday(task['end_week']))
+        for task in tasks
+    ]))
+    index = _cagr_index({task['ticker']: task['asset_type'] for task in tasks}, keys)
     
+    all_prices = {}
+    for task in tasks:
+        in_range = index[(index['asset_symbol'] == task['ticker'])
+                         & (index['week_key'] >= task['start_week']) & (index['week_key'] <= task['end_week'])]
+        for ticker, weekly_prices in _index_prices(in_range).items():
+            all_prices.setdefault(ticker, {}).update(weekly_prices)
+    
+    st.caption(f"   ✅ {sum(len(weeks) for weeks in all_prices.values())} PMS/AIF weekly index values computed")
     return all_prices
 
 
+def _cagr_index(schemes: Dict[str, str], keys):
+    """Weekly scheme index of {ticker: asset_type} over keys, with a week_key column"""
+    index = get_pms_aif_calculator().weekly_index(schemes, keys)
+    return index.assign(week_key=wc.year_week_to_keys(index['iso_year'], index['iso_week']))
+
+
+def _index_prices(index) -> Dict[str, Dict[Tuple[int, int], float]]:
+    """weekly_index rows -> {ticker: {(year, week): price}}"""
+    return {
+        ticker: dict(zip(zip(weeks['iso_year'].astype(int), weeks['iso_week'].astype(int)), weeks['price']))
+        for ticker, weeks in index.groupby('asset_symbol')
+    }
+
+
 def save_yearly_prices_to_db(db, all_prices: Dict[str, Dict[Tuple[int, int], float]]):
     """
     Save all fetched yearly prices to database in bulk
     AND update current/live prices in stock_master
     
+    All tickers are resolved with one lookup, every weekly record goes through
+    the chunked parallel writer, and live prices are written as one bulk upsert.
+    
     Args:
         db: Database manager instance
         all_prices: Dict of {ticker: {(year, week): price}}
+    
+    PMS/AIF prices are their scheme index (source 'cagr_index'), not a
+    per-unit price, so they never touch the shared live_price.
     """
     st.caption(f"💾 Saving prices to database...")
     
-    total_saved = 0
-    current_prices_updated = 0
+    stocks = db.get_stocks_by_tickers(list(all_prices.keys()))
+    
+    price_records = []
+    live_price_updates = []
     
     for ticker, weekly_prices in all_prices.items():
-        # Get stock_id
-        stock_response = db.supabase.table('stock_master').select('id').eq(
-            'ticker', ticker
-        ).execute()
-        
-        if not stock_response.data:
+        stock = stocks.get(ticker)
+        if not stock or not weekly_prices:
             continue
         
-        stock_id = stock_response.data[0]['id']
+        stock_id = stock['id']
+        is_index = stock.get('asset_type') in CAGR_ASSET_TYPES
         
-        # Prepare bulk insert for historical prices
-        price_records = []
-        latest_price = None
-        latest_week = (0, 0)
+        # ISO Monday of every week in one lookup (%W-based parsing was off by a week in some years)
+        weeks = list(weekly_prices.keys())
+        mondays = wc.week_keys_to_mondays([wc.week_key(year, week) for year, week in weeks])
         
-        for (year, week), price in weekly_prices.items():
-            # Calculate Monday of that week
-            week_monday = datetime.strptime(f'{year}-W{week:02d}-1', '%Y-W%W-%w')
-            
+        for ((year, week), price), week_monday in zip(weekly_prices.items(), mondays):
             price_records.append({
                 'stock_id': stock_id,
-                'price_date': week_monday.strftime('%Y-%m-%d'),
+                'price_date': str(week_monday),
                 'price': price,
                 'volume': None,
-                'source': 'yfinance_yearly',
+                'source': CAGR_INDEX_SOURCE if is_index else 'yfinance_yearly',
                 'iso_year': year,
                 'iso_week': week
             })
-            
-            # Track latest price (most recent week)
-            if (year, week) > latest_week:
-                latest_week = (year, week)
-                latest_price = price
         
-        if price_records:
-            db.save_historical_prices_bulk(price_records)
-            total_saved += len(price_records)
-            st.caption(f"   ✅ {ticker}: Saved {len(price_records)} weeks")
-            
-            # Update live_price in stock_master with the most recent week's price
-            if latest_price:
-                try:
-                    db.supabase.table('stock_master').update({
-                        'live_price': latest_price
-                    }).eq('id', stock_id).execute()
-                    current_prices_updated += 1
-                    st.caption(f"      💰 Updated live price: ₹{latest_price:,.2f}")
-                except Exception as e:
-                    st.caption(f"      ⚠️ Could not update live price: {str(e)[:50]}")
+        # Update live_price in stock_master with the most recent week's price
+        if is_index:
+            continue
+        latest_week = max(weekly_prices.keys())
+        live_price_updates.append({**stock, 'live_price': weekly_prices[latest_week]})
+    
+    total_saved = 0
+    if price_records:
+        result = db.save_historical_prices_chunked(price_records)
+        total_saved = result['saved']
+        st.caption(f"   ✅ Saved {result['saved']} weekly prices for {len({r['stock_id'] for r in price_records})} tickers in {result['chunks']} chunk(s)")
+        if result['failed']:
+            st.caption(f"   ⚠️ {result['failed']} records failed after retries: {result['errors'][0][:80]}")
+    
+    current_prices_updated = 0
+    if live_price_updates:
+        result = db.bulk_update_live_prices(live_price_updates)
+        current_prices_updated = result['saved']
+        if result['failed']:
+            st.caption(f"   ⚠️ Could not update {result['failed']} live prices: {result['errors'][0][:80]}")
+    
+    # Keep latest_prices / weekly_prices in step with the new rows
+    if total_saved or current_prices_updated:
+        db.refresh_price_views()
     
     st.caption(f"✅ Total saved: {total_saved} price records")
     st.caption(f"💰 Updated {current_prices_updated} live prices")
     return total_saved
-
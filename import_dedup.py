@@ -0,0 +1,84 @@
+"""
+Import Deduplication
+- File fingerprint: SHA-256 of the uploaded bytes, stored in file_uploads, so
+  re-uploading the same CSV into the same portfolio is skipped outright
+- Row fingerprint: hash of the natural key (portfolio, ticker, date, type,
+  quantity, price) plus its occurrence number within the file, so identical
+  rows that really are separate trades survive while a re-import matches them
+- Fingerprints are computed for the whole DataFrame at once and checked with
+  one set-membership query per batch before any per-row work
+"""
+
+import hashlib
+from typing import BinaryIO, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+ROW_HASH_CHARS = 32  # 128 bits of SHA-256; keeps .in_() filters as short as UUID batches
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def file_fingerprint(data: Union[bytes, bytearray, memoryview]) -> str:
+    """SHA-256 hex digest of a file's contents"""
+    return hashlib.sha256(bytes(data)).hexdigest()
+
+
+def stream_fingerprint(stream: BinaryIO, block_size: int = HASH_BLOCK_BYTES) -> str:
+    """
+    SHA-256 of a seekable binary stream, read in blocks
+
+    Same digest as file_fingerprint; the stream is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(block_size), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def natural_keys(df: pd.DataFrame, portfolio_id: str) -> pd.Series:
+    """
+    Canonical natural key of every CSV row
+
+    Values are normalized the way the importer stores them (trimmed upper-case
+    ticker, ISO date, buy/sell, fixed-precision numbers), so cosmetic
+    differences between two exports of the same trades do not matter.
+    """
+    def column(name):
+        return df[name] if name in df.columns else pd.Series([None] * len(df), index=df.index)
+
+    ticker = column('ticker').fillna('').astype(str).str.strip().str.upper()
+    dates = pd.to_datetime(column('date'), errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+    is_buy = column('transaction_type').fillna('').astype(str).str.lower().str.contains('buy')
+    trade = pd.Series(np.where(is_buy, 'buy', 'sell'), index=df.index)
+    # Always float, so a chunk with a blank cell hashes '10' the same as one without
+    quantity = pd.to_numeric(column('quantity'), errors='coerce').astype(float).round(6).astype(str).fillna('')
+    price = pd.to_numeric(column('price'), errors='coerce').fillna(0).astype(float).round(4).astype(str)
+
+    return str(portfolio_id) + '|' + ticker + '|' + dates + '|' + trade + '|' + quantity + '|' + price
+
+
+def row_fingerprints(df: pd.DataFrame, portfolio_id: str,
+                     occurrences: Optional[Dict[str, int]] = None) -> pd.Series:
+    """
+    Row hash for every CSV row, aligned with df.index
+
+    The n-th repeat of the same natural key in a file gets its own hash, so a
+    file with two identical buys imports both, and importing it again skips both.
+
+    Args:
+        df: CSV rows
+        portfolio_id: Target portfolio
+        occurrences: {natural key: rows seen so far}, carried across the chunks
+                     of one file so hashes match a whole-file read; updated in place
+    """
+    keys = natural_keys(df, portfolio_id)
+    occurrence = keys.groupby(keys).cumcount()
+    if occurrences is not None:
+        occurrence = occurrence + keys.map(occurrences).fillna(0).astype(int)
+        occurrences.update((occurrence + 1).groupby(keys).max().to_dict())
+    return (keys + '#' + occurrence.astype(str)).map(
+        lambda key: hashlib.sha256(key.encode('utf-8')).hexdigest()[:ROW_HASH_CHARS]
+    )
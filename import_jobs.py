@@ -0,0 +1,174 @@
+"""
+Background Import Jobs
+- Uploads are spooled to a temp file and imported on a worker pool, so
+  navigating away or st.rerun() no longer kills an import and the upload page
+  stays responsive
+- Job state is persisted in file_uploads (processing_status, rows_processed,
+  rows_imported, error_message) after every chunk; pages poll it
+- Several files import concurrently, up to IMPORT_WORKERS at a time per process
+- Jobs left 'queued'/'processing' by a dead process show as interrupted and
+  resume from their last chunk when the same file is uploaded again
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, BinaryIO, Callable, Optional
+
+import streamlit as st
+
+from import_dedup import stream_fingerprint
+from smart_ticker_detector import smart_price_fetch_batch
+from streaming_import import import_csv_stream
+
+logger = logging.getLogger(__name__)
+
+IMPORT_WORKERS = int(os.environ.get('WMS_IMPORT_WORKERS', '2'))
+SPOOL_MEMORY_BYTES = 8 * 1024 * 1024  # uploads above this are spooled to disk
+COPY_BLOCK_BYTES = 1024 * 1024
+ACTIVE_STATUSES = ('queued', 'processing')
+
+
+class ImportJobManager:
+    """Runs import_csv_stream on worker threads and tracks live progress"""
+
+    def __init__(self, db, fetch_price: Callable[[str, str, str], Optional[float]],
+                 max_workers: int = IMPORT_WORKERS):
+        self.db = db
+        self.fetch_price = fetch_price
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        # upload_id -> {fraction, message, user_id, done, result}; finished
+        # entries stay until the process exits so results can be shown once
+        self._live: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    # ========================================================================
+    # SUBMIT
+    # ========================================================================
+
+    def submit(self, uploaded_file: BinaryIO, file_name: str, user_id: str, portfolio_id: str,
+               fetch_prices: bool = True) -> Dict[str, Any]:
+        """
+        Queue one CSV for import
+
+        Args:
+            uploaded_file: Readable binary stream (Streamlit UploadedFile); copied
+                           before returning, so it may be discarded afterwards
+            file_name: Original file name
+            user_id: Owner
+            portfolio_id: Target portfolio
+            fetch_prices: Fetch historical prices for rows without one
+
+        Returns:
+            Dict with success, status ('queued', 'already_imported', 'running')
+            and upload_id
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        try:
+            uploaded_file.seek(0)
+            shutil.copyfileobj(uploaded_file, spool, COPY_BLOCK_BYTES)
+            file_size = spool.tell()
+            content_hash = stream_fingerprint(spool)
+
+            previous = self.db.find_imported_file(user_id, portfolio_id, content_hash)
+            if previous:
+                spool.close()
+                return {'success': True, 'status': 'already_imported', 'upload_id': previous['id'],
+                        'previous': previous}
+
+            # Reuse the checkpoint row of an interrupted run of the same file
+            checkpoint = self.db.find_resumable_upload(user_id, portfolio_id, content_hash)
+            if checkpoint and self.is_running(checkpoint['id']):
+                spool.close()
+                return {'success': True, 'status': 'running', 'upload_id': checkpoint['id']}
+
+            if checkpoint:
+                upload_id = checkpoint['id']
+                self.db.update_file_upload(upload_id, processing_status='queued', error_message=None)
+            else:
+                created = self.db.record_file_upload(
+                    user_id, portfolio_id, file_name, file_size, content_hash, 'queued'
+                )
+                if not created['success'] or not created['upload'].get('id'):
+                    spool.close()
+                    return {'success': False, 'error': created.get('error', 'Could not record upload')}
+                upload_id = created['upload']['id']
+        except Exception as e:
+            spool.close()
+            return {'success': False, 'error': str(e)}
+
+        with self._lock:
+            self._live[upload_id] = {
+                'user_id': user_id, 'file_name': file_name, 'fraction': 0.0,
+                'message': 'Queued', 'done': False, 'result': None
+            }
+        fetch_price = self.fetch_price if fetch_prices else (lambda ticker, asset_type, date: None)
+        batch_fetch = smart_price_fetch_batch if fetch_prices else None
+        self._executor.submit(self._run, upload_id, spool, file_name, user_id, portfolio_id, fetch_price, batch_fetch)
+        return {'success': True, 'status': 'queued', 'upload_id': upload_id}
+
+    def _run(self, upload_id: str, spool, file_name: str, user_id: str, portfolio_id: str, fetch_price, batch_fetch):
+        """Worker thread: no Streamlit calls beyond what the price fetcher drops"""
+        def on_progress(fraction: float, message: str):
+            with self._lock:
+                self._live[upload_id].update(fraction=fraction, message=message)
+
+        result = None
+        try:
+            result = import_csv_stream(
+                self.db, spool, file_name, user_id, portfolio_id, fetch_price,
+                on_progress=on_progress, upload_id=upload_id, batch_fetch=batch_fetch
+            )
+        except Exception as e:
+            logger.exception("Import job %s failed", upload_id)
+            self.db.update_file_upload(upload_id, processing_status='failed', error_message=str(e)[:500])
+            result = {'success': False, 'status': 'failed', 'error': str(e)}
+        finally:
+            spool.close()
+            with self._lock:
+                self._live[upload_id].update(done=True, fraction=1.0, result=result)
+
+    # ========================================================================
+    # STATUS
+    # ========================================================================
+
+    def is_running(self, upload_id: str) -> bool:
+        with self._lock:
+            job = self._live.get(upload_id)
+            return bool(job) and not job['done']
+
+    def has_active_jobs(self, user_id: str) -> bool:
+        with self._lock:
+            return any(job['user_id'] == user_id and not job['done'] for job in self._live.values())
+
+    def jobs(self, user_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        A user's recent imports: persisted state merged with live progress
+
+        Returns:
+            file_uploads rows plus fraction, message and result (when run by
+            this process); active rows without a live worker get status 'interrupted'
+        """
+        rows = self.db.get_file_uploads(user_id, limit)
+        with self._lock:
+            live = {upload_id: dict(job) for upload_id, job in self._live.items()}
+
+        for row in rows:
+            job = live.get(row['id'])
+            if job:
+                row.update(fraction=job['fraction'], message=job['message'], result=job['result'])
+            elif row.get('processing_status') in ACTIVE_STATUSES:
+                row['processing_status'] = 'interrupted'
+        return rows
+
+
+@st.cache_resource
+def get_import_jobs() -> ImportJobManager:
+    """One job manager (and worker pool) per server process"""
+    from database_shared import get_shared_db
+    from enhanced_price_fetcher import EnhancedPriceFetcher
+
+    return ImportJobManager(get_shared_db(), EnhancedPriceFetcher().get_historical_price)
@@ -0,0 +1,283 @@
+"""
+Transaction Ledger with Periodic Holdings Snapshots
+- user_transactions is read as an ordered event log per portfolio
+  (transaction_date, then ledger_seq insertion order)
+- portfolio_snapshots checkpoints positions and cost basis every
+  SNAPSHOT_INTERVAL events, so any as-of query is the nearest snapshot plus a
+  short replay instead of a scan of the whole history
+- Backdated transactions drop the snapshots they invalidate
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, List, Any, Iterable
+
+from db_repository import is_missing_schema_error
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = 250  # events replayed before a new snapshot is written
+EVENT_PAGE_SIZE = 1000  # PostgREST max rows per response
+EVENT_COLUMNS = 'stock_id, quantity, price, transaction_type, transaction_date, ledger_seq'
+
+
+def apply_event(positions: Dict[str, List[float]], event: Dict[str, Any]):
+    """
+    Apply one transaction to {stock_id: [quantity, cost]}
+
+    Same rules as the holdings table: buys add quantity and cost, sells only
+    reduce quantity, and average price is cost / quantity.
+    """
+    qty = float(event['quantity'])
+    position = positions.setdefault(event['stock_id'], [0.0, 0.0])
+
+    if event['transaction_type'] == 'buy':
+        position[0] += qty
+        position[1] += qty * float(event['price'])
+    else:  # sell
+        position[0] -= qty
+
+
+def _as_date_str(value) -> str:
+    if value is None:
+        return date.today().isoformat()
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+class PortfolioLedger:
+    """Point-in-time positions for portfolios, backed by snapshots"""
+
+    def __init__(self, db, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        self.db = db
+        self.snapshot_interval = snapshot_interval
+        # Flipped off when a read shows ADD_LEDGER.sql has not been run;
+        # queries then replay from the first event
+        self._snapshots_available = True
+
+    # ========================================================================
+    # SNAPSHOTS
+    # ========================================================================
+
+    def _latest_snapshot(self, portfolio_id: str, as_of: str) -> Optional[Dict[str, Any]]:
+        if not self._snapshots_available:
+            return None
+        try:
+            response = self.db.supabase.table('portfolio_snapshots').select(
+                'as_of_date, event_count, positions'
+            ).eq('portfolio_id', portfolio_id).lte('as_of_date', as_of).order(
+                'as_of_date', desc=True
+            ).limit(1).execute()
+            return response.data[0] if response.data else None
+        except Exception as e:
+            if is_missing_schema_error(e):
+                logger.warning("portfolio_snapshots unavailable, run ADD_LEDGER.sql: %s", e)
+                self._snapshots_available = False
+            else:
+                logger.warning("Could not read snapshot for %s, replaying full history: %s", portfolio_id, e)
+            return None
+
+    def _write_snapshot(self, portfolio_id: str, user_id: str, as_of: str,
+                        event_count: int, positions: Dict[str, List[float]]):
+        if not self._snapshots_available:
+            return
+        try:
+            self.db.supabase.table('portfolio_snapshots').upsert({
+                'portfolio_id': portfolio_id,
+                'user_id': user_id,
+                'as_of_date': as_of,
+                'event_count': event_count,
+                # Closed positions are kept: their cost still counts if they reopen
+                'positions': positions
+            }, on_conflict='portfolio_id,as_of_date').execute()
+        except Exception as e:
+            logger.warning("Could not write snapshot for %s: %s", portfolio_id, e)
+
+    def invalidate(self, portfolio_id: str, from_date: str):
+        """Drop snapshots that a transaction dated from_date would change"""
+        if not self._snapshots_available:
+            return
+        try:
+            self.db.supabase.table('portfolio_snapshots').delete().eq(
+                'portfolio_id', portfolio_id
+            ).gte('as_of_date', _as_date_str(from_date)).execute()
+        except Exception as e:
+            logger.warning("Could not invalidate snapshots for %s: %s", portfolio_id, e)
+
+    # ========================================================================
+    # REPLAY
+    # ========================================================================
+
+    def _events(self, portfolio_id: str, after: Optional[str], through: str) -> List[Dict[str, Any]]:
+        """Events with after < transaction_date <= through, in ledger order"""
+        events = []
+        offset = 0
+        while True:
+            query = self.db.supabase.table('user_transactions').select(EVENT_COLUMNS).eq(
+                'portfolio_id', portfolio_id
+            ).lte('transaction_date', through)
+            if after:
+                query = query.gt('transaction_date', after)
+            page = query.order('transaction_date').order('ledger_seq').range(
+                offset, offset + EVENT_PAGE_SIZE - 1
+            ).execute().data
+            events.extend(page)
+            if len(page) < EVENT_PAGE_SIZE:
+                return events
+            offset += EVENT_PAGE_SIZE
+
+    def _replay(self, portfolio_id: str, user_id: Optional[str], dates: List[str]) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Positions at each of the given dates (sorted) from one replay
+
+        Starts from the newest snapshot at or before the first date and writes
+        a new snapshot at a date boundary whenever SNAPSHOT_INTERVAL events have
+        been replayed since the last one, so the next query starts closer.
+        """
+        snapshot = self._latest_snapshot(portfolio_id, dates[0])
+        positions = {sid: list(pos) for sid, pos in (snapshot['positions'] if snapshot else {}).items()}
+        count = snapshot['event_count'] if snapshot else 0
+        since_snapshot = 0
+
+        events = self._events(portfolio_id, snapshot['as_of_date'][:10] if snapshot else None, dates[-1])
+
+        results = {}
+        pending = list(dates)
+        for i, event in enumerate(events):
+            event_date = str(event['transaction_date'])[:10]
+            while pending and pending[0] < event_date:
+                results[pending.pop(0)] = {sid: list(pos) for sid, pos in positions.items()}
+
+            apply_event(positions, event)
+            count += 1
+            since_snapshot += 1
+
+            # Only checkpoint once every event of this date has been applied
+            last_of_date = i + 1 == len(events) or str(events[i + 1]['transaction_date'])[:10] != event_date
+            if user_id and last_of_date and since_snapshot >= self.snapshot_interval:
+                self._write_snapshot(portfolio_id, user_id, event_date, count, positions)
+                since_snapshot = 0
+
+        for remaining in pending:
+            results[remaining] = {sid: list(pos) for sid, pos in positions.items()}
+        return results
+
+    # ========================================================================
+    # QUERIES
+    # ========================================================================
+
+    def positions_as_of(self, portfolio_id: str, as_of=None, user_id: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """
+        Open positions of a portfolio at the end of a date
+
+        Args:
+            portfolio_id: Portfolio to replay
+            as_of: Date (str/date), defaults to today
+            user_id: Owner; when given, long replays leave a snapshot behind
+
+        Returns:
+            Dict of {stock_id: {quantity, cost, average_price}}
+        """
+        as_of = _as_date_str(as_of)
+        positions = self._replay(portfolio_id, user_id, [as_of])[as_of]
+        return {
+            sid: {'quantity': qty, 'cost': cost, 'average_price': cost / qty}
+            for sid, (qty, cost) in positions.items() if qty > 0
+        }
+
+    def holdings_as_of(self, user_id: str, as_of=None, portfolio_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Holdings a user had at the end of a date, shaped like get_user_holdings rows
+
+        Returns:
+            List of {portfolio_id, stock_id, ticker, stock_name, asset_type, sector,
+            total_quantity, average_price}
+        """
+        portfolio_ids = [portfolio_id] if portfolio_id else [
+            p['id'] for p in self.db.get_user_portfolios(user_id)
+        ]
+
+        rows = []
+        for pid in portfolio_ids:
+            for stock_id, position in self.positions_as_of(pid, as_of, user_id).items():
+                rows.append({
+                    'portfolio_id': pid,
+                    'stock_id': stock_id,
+                    'total_quantity': position['quantity'],
+                    'average_price': position['average_price']
+                })
+
+        stocks = self.db.get_stocks_by_ids([r['stock_id'] for r in rows])
+        for row in rows:
+            stock = stocks.get(row['stock_id'], {})
+            for field in ('ticker', 'stock_name', 'asset_type', 'sector'):
+                row[field] = stock.get(field)
+        return rows
+
+    def positions_series(self, portfolio_id: str, dates: Iterable, user_id: Optional[str] = None) -> Dict[str, Dict[str, List[float]]]:
+        """{date: {stock_id: [quantity, cost]}} for many dates from a single replay"""
+        dates = sorted({_as_date_str(d) for d in dates})
+        if not dates:
+            return {}
+        return self._replay(portfolio_id, user_id, dates)
+
+    def value_history(self, user_id: str, start_date, end_date=None) -> List[Dict[str, Any]]:
+        """
+        Weekly invested amount and market value across a user's portfolios
+
+        Positions are taken at each week's Sunday and valued at that week's
+        stored close (last known close carried forward). PMS/AIF closes are
+        the user's lots applied to the stored scheme index.
+
+        Returns:
+            List of {date, invested, value}
+        """
+        start = datetime.strptime(_as_date_str(start_date), '%Y-%m-%d').date()
+        end = datetime.strptime(_as_date_str(end_date), '%Y-%m-%d').date()
+        sundays = []
+        day = start + timedelta(days=6 - start.weekday())
+        while day <= end:
+            sundays.append(day.isoformat())
+            day += timedelta(days=7)
+        if not sundays:
+            return []
+
+        totals = {d: {} for d in sundays}
+        for portfolio in self.db.get_user_portfolios(user_id):
+            for d, positions in self.positions_series(portfolio['id'], sundays, user_id).items():
+                for sid, (qty, cost) in positions.items():
+                    merged = totals[d].setdefault(sid, [0.0, 0.0])
+                    merged[0] += qty
+                    merged[1] += cost
+
+        stock_ids = list({sid for positions in totals.values() for sid in positions})
+        weekly = self.db.get_weekly_prices_for_stocks(stock_ids, (start - timedelta(days=7)).isoformat(), end.isoformat())
+
+        # PMS/AIF closes are the shared scheme index; turn them into this user's per-unit NAVs
+        stocks = self.db.get_stocks_by_ids(stock_ids)
+        if any(stock.get('asset_type') in ('pms', 'aif') for stock in stocks.values()):
+            from pms_aif_calculator import get_pms_aif_calculator
+            weekly = get_pms_aif_calculator().apply_lots(self.db.get_user_transactions(user_id), weekly)
+
+        # Walk each stock's closes forward alongside the (sorted) Sundays
+        closes = {sid: sorted((str(r['price_date'])[:10], float(r['price'])) for r in rows)
+                  for sid, rows in weekly.items()}
+        cursor = {sid: -1 for sid in closes}
+
+        history = []
+        for d in sundays:
+            invested = value = 0.0
+            for sid, series in closes.items():
+                while cursor[sid] + 1 < len(series) and series[cursor[sid] + 1][0] <= d:
+                    cursor[sid] += 1
+
+            for sid, (qty, cost) in totals[d].items():
+                if qty <= 0:
+                    continue
+                invested += cost
+                idx = cursor.get(sid, -1)
+                price = closes[sid][idx][1] if idx >= 0 else cost / qty
+                value += qty * price
+            history.append({'date': d, 'invested': invested, 'value': value})
+        return history
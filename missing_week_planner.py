@@ -0,0 +1,110 @@
+"""
+Missing-Week Fetch Planner
+- Missing weeks per stock = wanted week keys minus stored week keys (NumPy set difference),
+  plus the current (partial) week and the last stored week, which are refetched
+- Consecutive missing weeks are coalesced into ranges (small gaps bridged)
+- Output is a fetch plan: one (stock, start, end) task per range, so a fetcher
+  makes one range request per gap instead of one request per week
+"""
+
+from typing import Dict, List, Any, Iterable, Optional
+
+import numpy as np
+
+import week_calendar as wc
+
+# Bridge gaps of up to this many already-stored weeks: one slightly larger
+# range request is cheaper than two requests
+MERGE_GAP_WEEKS = 2
+
+
+def missing_week_keys(wanted: np.ndarray, existing_by_stock: Dict[str, np.ndarray],
+                      stock_ids: Iterable[str], current_week: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Wanted week keys that have no stored price, per stock
+
+    Args:
+        wanted: Sorted unique int week keys every stock should have
+        existing_by_stock: {stock_id: int week keys already stored}
+        stock_ids: Stocks to check
+        current_week: Week key still in progress; when given, it and each
+                      stock's last stored week (possibly stored mid-week) are
+                      refetched even though a price exists
+
+    Returns:
+        {stock_id: sorted missing week keys} (stocks with nothing missing omitted)
+    """
+    wanted = np.unique(np.asarray(wanted, dtype=np.int32))
+    missing = {}
+    for stock_id in stock_ids:
+        existing = np.asarray(existing_by_stock.get(stock_id, np.empty(0, dtype=np.int32)), dtype=np.int32)
+        gap = np.setdiff1d(wanted, existing)
+        if current_week is not None:
+            stale = [current_week] + ([int(existing.max())] if len(existing) else [])
+            gap = np.union1d(gap, np.asarray(stale, dtype=np.int32))
+        if len(gap):
+            missing[stock_id] = gap
+    return missing
+
+
+def coalesce_ranges(keys: np.ndarray, merge_gap: int = MERGE_GAP_WEEKS) -> List[tuple]:
+    """
+    Contiguous (first_key, last_key, weeks) ranges covering sorted week keys
+
+    Adjacency is measured in calendar weeks (202052 -> 202053 -> 202101), so
+    ranges run across year ends correctly.
+    """
+    keys = np.unique(np.asarray(keys, dtype=np.int32))
+    if not len(keys):
+        return []
+
+    # Position of each key in the calendar's week sequence
+    positions = np.searchsorted(wc.WEEK_KEYS, keys)
+    breaks = np.nonzero(np.diff(positions) > merge_gap + 1)[0] + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(keys)])) - 1
+
+    return [(int(keys[s]), int(keys[e]), int(e - s + 1)) for s, e in zip(starts, ends)]
+
+
+def build_fetch_plan(missing_by_stock: Dict[str, np.ndarray], stocks: Dict[str, Dict[str, Any]],
+                     merge_gap: int = MERGE_GAP_WEEKS) -> List[Dict[str, Any]]:
+    """
+    One fetch task per coalesced gap
+
+    Args:
+        missing_by_stock: Output of missing_week_keys
+        stocks: {stock_id: {ticker, stock_name, asset_type}}
+
+    Returns:
+        List of {stock_id, ticker, stock_name, asset_type, start_week, end_week,
+        start_date, end_date, missing_weeks}; start_date is the first week's ISO
+        Monday and end_date the last week's Sunday
+    """
+    plan = []
+    for stock_id, keys in missing_by_stock.items():
+        stock = stocks.get(stock_id, {})
+        for first, last, count in coalesce_ranges(keys, merge_gap):
+            start_monday, end_monday = wc.week_keys_to_mondays([first, last])
+            plan.append({
+                'stock_id': stock_id,
+                'ticker': stock.get('ticker', 'Unknown'),
+                'stock_name': stock.get('stock_name'),
+                'asset_type': stock.get('asset_type'),
+                'start_week': first,
+                'end_week': last,
+                'start_date': str(start_monday),
+                'end_date': str(end_monday + np.timedelta64(6, 'D')),
+                'missing_weeks': count,
+            })
+    return plan
+
+
+def summarize_plan(plan: List[Dict[str, Any]], missing_by_stock: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, int]:
+    """Counts for progress messages"""
+    return {
+        'tasks': len(plan),
+        'stocks': len({t['stock_id'] for t in plan}),
+        'missing_weeks': int(sum(len(k) for k in missing_by_stock.values())) if missing_by_stock
+                         else sum(t['missing_weeks'] for t in plan),
+    }
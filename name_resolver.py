@@ -0,0 +1,147 @@
+"""
+Name -> Ticker Resolver
+- In-memory character-trigram index over security names from stock_master
+  and the symbol master, so a CSV row with "Reliance Industries Ltd" and a
+  blank or odd ticker resolves locally instead of through the AI fallback
+- Scores are the Dice coefficient of the two names' trigram sets; a query
+  touches only the posting lists of its own trigrams (one numpy bincount)
+- Built once per process and rebuilt after RESOLVER_TTL_SECONDS, so tickers
+  created by recent imports become resolvable
+"""
+
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Iterable, Optional, Tuple
+
+import numpy as np
+
+from symbol_master import get_symbol_master
+
+RESOLVER_TTL_SECONDS = 600
+RESOLVE_MIN_SCORE = 0.75  # accept a match automatically from this score...
+RESOLVE_MARGIN = 0.05     # ...when it beats the next different ticker by this much
+
+# Legal-form words that differ between exports of the same company name
+STOPWORDS = frozenset({'LTD', 'LIMITED', 'PVT', 'PRIVATE', 'THE', 'CO', 'CORP', 'CORPN', 'INC', 'COMPANY'})
+
+Match = namedtuple('Match', ['ticker', 'asset_type', 'name', 'score'])
+
+
+def normalize_name(name) -> str:
+    """'Reliance Industries Ltd.' -> 'RELIANCE INDUSTRIES'"""
+    text = re.sub(r'[^A-Z0-9]+', ' ', str(name).upper().replace('&', ' AND '))
+    return ' '.join(word for word in text.split() if word not in STOPWORDS)
+
+
+def trigrams(name: str) -> set:
+    """Character trigrams of a normalized name, padded so word edges count"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameResolver:
+    """Trigram index of (name, ticker, asset_type) records"""
+
+    def __init__(self, records: Iterable[Tuple[str, str, str]] = ()):
+        self._tickers: List[str] = []
+        self._asset_types: List[str] = []
+        self._names: List[str] = []
+        sizes = []
+        postings: Dict[str, List[int]] = {}
+        seen = set()
+
+        for name, ticker, asset_type in records:
+            normalized = normalize_name(name) if name else ''
+            if not normalized or not ticker or (normalized, ticker) in seen:
+                continue
+            seen.add((normalized, ticker))
+            doc = len(self._tickers)
+            grams = trigrams(normalized)
+            for gram in grams:
+                postings.setdefault(gram, []).append(doc)
+            self._tickers.append(ticker)
+            self._asset_types.append(asset_type)
+            self._names.append(name)
+            sizes.append(len(grams))
+
+        self._postings = {gram: np.asarray(docs, dtype=np.int32) for gram, docs in postings.items()}
+        self._sizes = np.asarray(sizes, dtype=np.float64)
+        self._asset_type_array = np.asarray(self._asset_types, dtype=object)
+        self.tickers = frozenset(self._tickers)
+
+    def __len__(self) -> int:
+        return len(self._tickers)
+
+    def search(self, name: str, k: int = 5, asset_type: Optional[str] = None) -> List[Match]:
+        """
+        Top-k securities for a name, best first (one entry per ticker)
+
+        Args:
+            name: Free-text security name
+            k: Candidates to return
+            asset_type: Only consider this asset type
+        """
+        grams = trigrams(normalize_name(name))
+        hits = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not hits or not len(self):
+            return []
+
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self))
+        scores = 2.0 * overlap / (len(grams) + self._sizes)
+        if asset_type:
+            scores[self._asset_type_array != asset_type] = 0.0
+
+        # A ticker can carry several names (NSE and BSE spelling); take a few
+        # extra candidates so k distinct tickers survive de-duplication
+        candidates = min(len(scores), k * 3)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        matches = {}
+        for doc in top:
+            if scores[doc] <= 0 or len(matches) == k:
+                break
+            ticker = self._tickers[doc]
+            if ticker not in matches:
+                matches[ticker] = Match(ticker, self._asset_types[doc], self._names[doc], round(float(scores[doc]), 4))
+        return list(matches.values())
+
+    def resolve(self, name: str, asset_type: Optional[str] = None,
+                min_score: float = RESOLVE_MIN_SCORE) -> Optional[Match]:
+        """Best match if it is confident (>= min_score and clear of the runner-up), else None"""
+        matches = self.search(name, k=2, asset_type=asset_type)
+        if not matches or matches[0].score < min_score:
+            return None
+        if len(matches) > 1 and matches[0].score - matches[1].score < RESOLVE_MARGIN:
+            return None
+        return matches[0]
+
+    def resolve_many(self, names: Iterable[str], min_score: float = RESOLVE_MIN_SCORE) -> Dict[str, Optional[Match]]:
+        """resolve() once per distinct name"""
+        return {name: self.resolve(name, min_score=min_score) for name in dict.fromkeys(names)}
+
+
+def build_name_resolver(db=None) -> NameResolver:
+    """Index symbol master names plus (when db is given) every stock_master name"""
+    records = [(entry.name, entry.symbol, entry.asset_type) for entry in get_symbol_master().entries()]
+    if db is not None:
+        records.extend((row.get('stock_name'), row.get('ticker'), row.get('asset_type'))
+                       for row in db.get_stock_names())
+    return NameResolver(records)
+
+
+_resolver: Optional[NameResolver] = None
+_resolver_built = 0.0
+_resolver_lock = threading.Lock()
+
+
+def get_name_resolver(db) -> NameResolver:
+    """Process-wide resolver, rebuilt after RESOLVER_TTL_SECONDS (safe from worker threads)"""
+    global _resolver, _resolver_built
+    with _resolver_lock:
+        if _resolver is None or time.time() - _resolver_built > RESOLVER_TTL_SECONDS:
+            _resolver = build_name_resolver(db)
+            _resolver_built = time.time()
+        return _resolver
@@ -3,13 +3,16 @@ PMS and AIF Value Calculator
 Calculates current value and 52-week historical values using CAGR from SEBI
 """
 
+import threading
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
-import requests
-from bs4 import BeautifulSoup
-import re
+
+import week_calendar as wc
+from sebi_dataset import get_sebi_dataset
 
 
 class PMS_AIF_Calculator:
@@ -126,10 +129,12 @@ class PMS_AIF_Calculator:
         Returns:
             Dict with cagr and period or None
         """
-        # Check cache first
+        # Check cache first (entries from an older SEBI download are stale)
+        fetched_at = get_sebi_dataset('aif' if is_aif else 'pms').fetched_at
         cache_key = f"{ticker}_{is_aif}"
-        if cache_key in self.sebi_cache:
-            return self.sebi_cache[cache_key]
+        cached = self.sebi_cache.get(cache_key)
+        if cached and cached[0] == fetched_at:
+            return cached[1]
         
         try:
             if is_aif:
@@ -137,12 +142,12 @@ class PMS_AIF_Calculator:
             else:
                 data = self._fetch_pms_from_sebi(ticker)
             
-            if data:
+            if data is not None:
                 # Extract best available CAGR
                 cagr_result = self._extract_best_cagr(data)
                 
                 if cagr_result:
-                    self.sebi_cache[cache_key] = cagr_result
+                    self.sebi_cache[cache_key] = (fetched_at, cagr_result)
                     return cagr_result
             
             return None
@@ -205,51 +210,14 @@ class PMS_AIF_Calculator:
         return None
     
     def _fetch_pms_from_sebi(self, ticker: str) -> Optional[pd.DataFrame]:
-        """Fetch PMS data from SEBI website"""
-        try:
-            url = "https://www.sebi.gov.in/sebiweb/other/OtherAction.do?doPmr=yes"
-            
-            # Try to read tables from SEBI page
-            tables = pd.read_html(url)
-            
-            if tables:
-                for table in tables:
-                    # Look for the table with Registration No. column
-                    if 'Registration No.' in table.columns:
-                        # Search by registration code
-                        matches = table[table['Registration No.'].astype(str).str.contains(ticker, na=False, case=False)]
-                        
-                        if not matches.empty:
-                            return matches
-            
-            return None
-            
-        except Exception as e:
-            st.caption(f"⚠️ SEBI PMS fetch error: {str(e)}")
-            return None
+        """PMS rows for a registration code or manager name (cached SEBI table)"""
+        matches = get_sebi_dataset('pms').lookup(ticker)
+        return matches if not matches.empty else None
     
     def _fetch_aif_from_sebi(self, ticker: str) -> Optional[pd.DataFrame]:
-        """Fetch AIF data from SEBI website"""
-        try:
-            # AIF data URL (update if SEBI changes it)
-            url = "https://www.sebi.gov.in/sebiweb/other/OtherAction.do?doRecognisedFpi=yes&intmId=10"
-            
-            tables = pd.read_html(url)
-            
-            if tables:
-                for table in tables:
-                    # Search for ticker in all columns
-                    for col in table.columns:
-                        if table[col].astype(str).str.contains(ticker, na=False, case=False).any():
-                            matches = table[table[col].astype(str).str.contains(ticker, na=False, case=False)]
-                            if not matches.empty:
-                                return matches
-            
-            return None
-            
-        except Exception as e:
-            st.caption(f"⚠️ SEBI AIF fetch error: {str(e)}")
-            return None
+        """AIF rows for a registration code or scheme name (cached SEBI table)"""
+        matches = get_sebi_dataset('aif').lookup(ticker)
+        return matches if not matches.empty else None
     
     def _generate_weekly_values(
         self,
@@ -274,39 +242,12 @@ class PMS_AIF_Calculator:
         Returns:
             List of dicts with price_date, price (total NAV), asset_symbol, asset_type
         """
-        weekly_values = []
-        
         try:
-            current_dt = datetime.now()
-            
-            # Generate weekly dates (Mondays)
-            weekly_dates = pd.date_range(
-                end=current_dt,
-                periods=weeks,
-                freq='W-MON'
-            )
-            
-            for week_date in weekly_dates:
-                # Calculate years from investment date to this week
-                years_to_week = (week_date - investment_date).days / 365.25
-                
-                if years_to_week < 0:
-                    # Before investment date - no value
-                    continue
-                
-                # Calculate total portfolio value at this week using CAGR
-                # This is the NAV (Net Asset Value) for the entire PMS/AIF investment
-                nav_at_week = initial_investment * ((1 + cagr) ** years_to_week)
-                
-                weekly_values.append({
-                    'asset_symbol': ticker,
-                    'asset_type': asset_type,
-                    'price': round(nav_at_week, 2),  # Total NAV
-                    'price_date': week_date.strftime('%Y-%m-%d'),
-                    'volume': None
-                })
-            
-            return weekly_values
+            lot = pd.DataFrame({
+                'asset_symbol': [ticker], 'asset_type': [asset_type], 'units': [1.0],
+                'amount': [initial_investment], 'date': [pd.Timestamp(investment_date)], 'cagr': [cagr]
+            })
+            return nav_records(weekly_nav_frame(lot, weeks))
             
         except Exception as e:
             st.caption(f"⚠️ Error generating weekly values: {str(e)}")
@@ -369,6 +310,232 @@ class PMS_AIF_Calculator:
                 'weekly_values': []
             }
 
+    def _scheme_cagrs(self, asset_types: pd.Series) -> pd.DataFrame:
+        """
+        One CAGR per scheme, read from the cached SEBI datasets
+
+        Args:
+            asset_types: 'pms' / 'aif' indexed by ticker
+
+        Returns:
+            Frame indexed by ticker: cagr_used, cagr_period, source
+        """
+        cagr = {}
+        for ticker, asset_type in asset_types.items():
+            cagr_data = self._get_sebi_cagr(ticker, asset_type == 'aif')
+            if cagr_data and cagr_data.get('cagr'):
+                cagr[ticker] = (cagr_data['cagr'], cagr_data['period'], f"SEBI ({cagr_data['period']})")
+            else:
+                estimate = self.conservative_aif_cagr if asset_type == 'aif' else self.conservative_pms_cagr
+                cagr[ticker] = (estimate, 'Conservative Estimate', 'Estimated (SEBI data unavailable)')
+        return pd.DataFrame.from_dict(cagr, orient='index', columns=['cagr_used', 'cagr_period', 'source'])
+
+    def _holding_lots(self, holdings: List[Dict[str, Any]], transactions: List[Dict[str, Any]]):
+        """
+        PMS/AIF holdings with their scheme CAGR, plus their buy lots
+
+        Returns:
+            (held indexed by ticker: asset_type, stock_id, quantity, cost_price,
+            cagr_used, cagr_period, source, remaining;
+            lots: asset_symbol, asset_type, stock_id, units, amount, date, cagr),
+            or (None, None) when there are no PMS/AIF holdings. remaining is the
+            share of bought units still held (sells shrink every lot alike).
+        """
+        held = pd.DataFrame(holdings)
+        if held.empty or 'asset_type' not in held.columns:
+            return None, None
+        held = held[held['asset_type'].astype(str).str.lower().isin(['pms', 'aif'])]
+        if held.empty:
+            return None, None
+
+        # The same scheme held in several portfolios is one position
+        quantity = pd.to_numeric(held['total_quantity'], errors='coerce').fillna(0.0)
+        held = held.assign(
+            asset_type=held['asset_type'].str.lower(),
+            quantity=quantity,
+            cost=quantity * pd.to_numeric(held['average_price'], errors='coerce').fillna(0.0)
+        ).groupby('ticker').agg(
+            asset_type=('asset_type', 'first'), stock_id=('stock_id', 'first'),
+            quantity=('quantity', 'sum'), cost=('cost', 'sum')
+        )
+        held['cost_price'] = (held['cost'] / held['quantity']).where(held['quantity'] > 0, 0.0)
+
+        held = held[['asset_type', 'stock_id', 'quantity', 'cost_price']].join(self._scheme_cagrs(held['asset_type']))
+
+        buys = pd.DataFrame(transactions, columns=['ticker', 'quantity', 'price', 'transaction_date', 'transaction_type'])
+        buys = buys[buys['ticker'].isin(held.index) & (buys['transaction_type'].astype(str).str.lower() == 'buy')]
+        units = pd.to_numeric(buys['quantity'], errors='coerce').fillna(0.0)
+        lots = pd.DataFrame({
+            'asset_symbol': buys['ticker'],
+            'asset_type': buys['ticker'].map(held['asset_type']),
+            'stock_id': buys['ticker'].map(held['stock_id']),
+            'units': units,
+            'amount': units * pd.to_numeric(buys['price'], errors='coerce').fillna(0.0),
+            'date': pd.to_datetime(buys['transaction_date'], errors='coerce'),
+            'cagr': buys['ticker'].map(held['cagr_used'])
+        }).dropna(subset=['date'])
+
+        bought = lots.groupby('asset_symbol')['units'].sum()
+        held['remaining'] = held['quantity'] / bought.reindex(held.index).replace(0, np.nan)
+        return held, lots
+
+    def value_holdings(
+        self,
+        holdings: List[Dict[str, Any]],
+        transactions: List[Dict[str, Any]],
+        as_of: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """
+        Value every PMS/AIF holding of a portfolio in one pass
+
+        Each buy lot compounds at its scheme's CAGR from its own purchase date;
+        units sold since reduce every lot of the holding in proportion.
+        Holdings without buy transactions are valued at cost.
+
+        Args:
+            holdings: Holding rows (ticker, stock_id, asset_type, total_quantity, average_price)
+            transactions: Transaction rows of the same portfolio (any asset type)
+            as_of: Valuation date (default now)
+
+        Returns:
+            One row per PMS/AIF holding: ticker, asset_type, stock_id, quantity,
+            invested, current_value, current_price, absolute_gain,
+            percentage_gain, cagr_used, cagr_period, source
+        """
+        columns = ['ticker', 'asset_type', 'stock_id', 'quantity', 'invested', 'current_value', 'current_price',
+                   'absolute_gain', 'percentage_gain', 'cagr_used', 'cagr_period', 'source']
+        held, lots = self._holding_lots(holdings, transactions)
+        if held is None:
+            return pd.DataFrame(columns=columns)
+
+        # All lots compounded at once
+        as_of = pd.Timestamp(as_of or datetime.now())
+        years = ((as_of - lots['date']).dt.days / 365.25).clip(lower=0)
+        lots = lots.assign(value=lots['amount'] * np.power(1.0 + lots['cagr'], years))
+        totals = lots.groupby('asset_symbol')[['units', 'amount', 'value']].sum()
+
+        result = held.join(totals)
+        no_lots = result['units'].isna() | (result['units'] <= 0)
+        remaining = result['remaining'].where(~no_lots, 1.0)
+        at_cost = result['quantity'] * result['cost_price']
+        result['invested'] = (result['amount'] * remaining).where(~no_lots, at_cost)
+        result['current_value'] = (result['value'] * remaining).where(~no_lots, at_cost)
+        result.loc[no_lots, 'source'] = 'No purchase lots - valued at cost'
+        result['current_price'] = (result['current_value'] / result['quantity']).where(
+            result['quantity'] > 0, result['current_value']
+        )
+        result['absolute_gain'] = result['current_value'] - result['invested']
+        result['percentage_gain'] = (result['absolute_gain'] / result['invested'] * 100).where(result['invested'] > 0, 0.0)
+
+        return result.rename_axis('ticker').reset_index()[columns]
+
+    def weekly_navs(
+        self,
+        holdings: List[Dict[str, Any]],
+        transactions: List[Dict[str, Any]],
+        weeks: Optional[int] = 52,
+        end: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """
+        Weekly per-unit NAVs of every PMS/AIF holding, computed from the lots
+
+        These are one user's NAVs and are not stored; historical_prices holds
+        the shared weekly_index instead. Lots are scaled by the share of units
+        still held, so the value column tracks the current position. Holdings
+        without buy lots get no rows.
+
+        Returns:
+            weekly_nav_frame() columns plus stock_id and source ('cagr')
+        """
+        held, lots = self._holding_lots(holdings, transactions)
+        if held is None or lots.empty:
+            return weekly_nav_frame(pd.DataFrame(columns=NAV_LOT_COLUMNS), weeks, end).assign(stock_id=None, source='cagr')
+
+        remaining = lots['asset_symbol'].map(held['remaining']).fillna(1.0)
+        lots = lots.assign(units=lots['units'] * remaining, amount=lots['amount'] * remaining)
+        navs = weekly_nav_frame(lots, weeks, end)
+        return navs.assign(stock_id=navs['asset_symbol'].map(held['stock_id']), source='cagr')
+
+    def weekly_index(self, schemes: Dict[str, str], keys) -> pd.DataFrame:
+        """
+        Weekly index of PMS/AIF schemes, the series stored in historical_prices
+
+        The index depends only on the scheme's CAGR, never on whose lots hold
+        it, so one shared series serves every user; apply_lots turns it into
+        a user's per-unit NAV when reading.
+
+        Args:
+            schemes: {ticker: 'pms' or 'aif'}
+            keys: ISO week keys to compute
+
+        Returns:
+            weekly_index_frame() columns, one row per scheme per week
+        """
+        asset_types = pd.Series(schemes, dtype=object)
+        cagrs = self._scheme_cagrs(asset_types) if schemes else pd.DataFrame(columns=['cagr_used'])
+        return weekly_index_frame(pd.DataFrame({
+            'asset_symbol': asset_types.index,
+            'asset_type': asset_types.to_numpy(),
+            'cagr': cagrs['cagr_used'].to_numpy(dtype=float)
+        }), keys)
+
+    def apply_lots(
+        self,
+        transactions: List[Dict[str, Any]],
+        weekly: Dict[str, List[Dict[str, Any]]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Turn stored PMS/AIF index rows into the user's per-unit NAVs
+
+        Each buy lot grows by index(week) / index(lot date), so a week's NAV
+        is the value of the lots bought by then over their units. The lot-date
+        level is read off the stored row's own curve (the CAGR it was written
+        with, see implied_cagr), never the current SEBI CAGR, so weeks stored
+        before a CAGR change stay consistent. Weeks before a scheme's first
+        lot are dropped.
+
+        Args:
+            transactions: The user's transaction rows (stock_id, asset_type,
+                          quantity, price, transaction_date, transaction_type)
+            weekly: {stock_id: [{price_date, price, ...}]} as read from historical_prices
+
+        Returns:
+            weekly with the PMS/AIF series replaced; other stock ids untouched
+        """
+        buys = pd.DataFrame(transactions, columns=['stock_id', 'asset_type', 'quantity', 'price',
+                                                   'transaction_date', 'transaction_type'])
+        buys = buys[buys['asset_type'].astype(str).str.lower().isin(['pms', 'aif'])
+                    & buys['stock_id'].isin(list(weekly))
+                    & (buys['transaction_type'].astype(str).str.lower() == 'buy')]
+        if buys.empty:
+            return weekly
+
+        units = pd.to_numeric(buys['quantity'], errors='coerce').fillna(0.0)
+        lots = pd.DataFrame({
+            'stock_id': buys['stock_id'],
+            'units': units,
+            'amount': units * pd.to_numeric(buys['price'], errors='coerce').fillna(0.0),
+            'date': pd.to_datetime(buys['transaction_date'], errors='coerce')
+        }).dropna(subset=['date'])
+
+        result = dict(weekly)
+        for stock_id, stock_lots in lots.groupby('stock_id'):
+            rows = [row for row in weekly[stock_id] if float(row['price']) > 0]
+            if not rows:
+                continue
+            weeks = pd.to_datetime([str(row['price_date'])[:10] for row in rows]).to_numpy('datetime64[D]')
+            levels = np.array([float(row['price']) for row in rows])
+            lot_dates = stock_lots['date'].to_numpy('datetime64[D]')
+            active = weeks[:, None] >= lot_dates[None, :]
+
+            # weeks x lots: index level at each lot's date on that week's curve
+            anchors = cagr_index(implied_cagr(levels, weeks)[:, None], lot_dates[None, :])
+            values = levels * np.where(active, stock_lots['amount'].to_numpy(dtype=float) / anchors, 0.0).sum(axis=1)
+            held_units = np.where(active, stock_lots['units'].to_numpy(dtype=float), 0.0).sum(axis=1)
+            result[stock_id] = [{**row, 'price': round(value / held_units_, 2)}
+                                for row, value, held_units_ in zip(rows, values, held_units) if held_units_ > 0]
+        return result
+
 
 def fetch_pms_cagr_from_sebi(registration_code: str) -> Optional[Dict[str, Any]]:
     """
@@ -381,56 +548,36 @@ def fetch_pms_cagr_from_sebi(registration_code: str) -> Optional[Dict[str, Any]]
         Dict with CAGR data or None
     """
     try:
-        url = "https://www.sebi.gov.in/sebiweb/other/OtherAction.do?doPmr=yes"
+        matches = get_sebi_dataset('pms').lookup(registration_code)
+        if matches.empty:
+            return None
         
-        # Try to read the PMS table from SEBI
-        tables = pd.read_html(url)
+        record = matches.iloc[0]
         
-        if not tables:
-            return None
+        # Extract CAGR values
+        result = {
+            'ticker': registration_code,
+            'name': record.get('Portfolio Manager', 'Unknown'),
+            'strategy': record.get('Strategy', 'N/A')
+        }
         
-        # Find the main PMS table (usually the largest one)
-        pms_table = max(tables, key=lambda x: len(x))
+        # Extract performance metrics
+        performance_cols = {
+            '5Y CAGR': '5y_cagr',
+            '3Y CAGR': '3y_cagr',
+            '1Y Return': '1y_return'
+        }
         
-        # Search by registration code
-        if 'Registration No.' in pms_table.columns:
-            matches = pms_table[
-                pms_table['Registration No.'].astype(str).str.contains(
-                    registration_code, 
-                    na=False, 
-                    case=False
-                )
-            ]
-            
-            if not matches.empty:
-                record = matches.iloc[0]
-                
-                # Extract CAGR values
-                result = {
-                    'ticker': registration_code,
-                    'name': record.get('Portfolio Manager', 'Unknown'),
-                    'strategy': record.get('Strategy', 'N/A')
-                }
-                
-                # Extract performance metrics
-                performance_cols = {
-                    '5Y CAGR': '5y_cagr',
-                    '3Y CAGR': '3y_cagr',
-                    '1Y Return': '1y_return'
-                }
-                
-                for col, key in performance_cols.items():
-                    if col in record:
-                        value_str = str(record[col]).strip()
-                        if value_str and value_str != 'N/A':
-                            try:
-                                result[key] = float(value_str.replace('%', '').strip()) / 100
-                            except:
-                                pass
-                
-                return result
+        for col, key in performance_cols.items():
+            if col in record:
+                value_str = str(record[col]).strip()
+                if value_str and value_str != 'N/A':
+                    try:
+                        result[key] = float(value_str.replace('%', '').strip()) / 100
+                    except:
+                        pass
         
-        return None
+        return result
         
     except Exception as e:
         return None
@@ -492,44 +639,155 @@ def generate_52_week_values(
     Returns:
         List of weekly NAV records
     """
-    weekly_values = []
-    
-    invest_dt = pd.to_datetime(investment_date)
-    current_dt = datetime.now()
-    
-    # Generate 52 weekly dates (Mondays)
-    weekly_dates = pd.date_range(
-        end=current_dt,
-        periods=52,
-        freq='W-MON'
-    )
-    
-    for week_date in weekly_dates:
-        # Calculate years from investment to this week
-        years_to_week = (week_date - invest_dt).days / 365.25
-        
-        if years_to_week < 0:
-            # Before investment - no value
-            continue
-        
-        # Calculate total NAV at this week using CAGR
-        nav_at_week = initial_investment * ((1 + cagr) ** years_to_week)
-        
-        weekly_values.append({
-            'asset_symbol': ticker,
-            'asset_type': asset_type,
-            'price': round(nav_at_week, 2),  # Total NAV
-            'price_date': week_date.strftime('%Y-%m-%d'),
-            'volume': None
-        })
-    
-    return weekly_values
+    lot = pd.DataFrame({
+        'asset_symbol': [ticker], 'asset_type': [asset_type], 'units': [1.0],
+        'amount': [initial_investment], 'date': [pd.to_datetime(investment_date)], 'cagr': [cagr]
+    })
+    return nav_records(weekly_nav_frame(lot, 52))
+
+
+# ============================================================================
+# VECTORISED WEEKLY NAVS
+# ============================================================================
+
+NAV_LOT_COLUMNS = ['asset_symbol', 'asset_type', 'units', 'amount', 'date', 'cagr']
+NAV_COLUMNS = ['asset_symbol', 'asset_type', 'price_date', 'price', 'value', 'volume', 'iso_year', 'iso_week']
+
+
+def weekly_nav_frame(lots: pd.DataFrame, weeks: Optional[int] = 52, end: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    Weekly NAVs for many lots over many weeks as one lots x weeks array
+
+    Every lot compounds from its own date (value = amount x (1 + cagr)^years)
+    and lots sharing an asset_symbol are summed into one path.
+
+    Args:
+        lots: One row per lot with NAV_LOT_COLUMNS (units: units bought)
+        weeks: ISO weeks ending with the week of end (None = from the earliest lot)
+        end: Last date (default today)
+
+    Returns:
+        Frame with NAV_COLUMNS: one row per holding per ISO Monday on or after
+        its first lot; price is value per unit held, rounded to paise
+    """
+    if lots.empty:
+        return pd.DataFrame(columns=NAV_COLUMNS)
+    if weeks is None:
+        keys = wc.week_keys_between(pd.to_datetime(lots['date']).min(), pd.Timestamp(end or datetime.now()))
+    else:
+        keys = wc.last_n_week_keys(weeks - 1, end)
+    mondays = wc.week_keys_to_mondays(keys)
+
+    lot_dates = pd.to_datetime(lots['date']).to_numpy('datetime64[D]')
+    days = (mondays[None, :] - lot_dates[:, None]).astype(np.int64)
+    active = days >= 0
+    growth = np.power(1.0 + lots['cagr'].to_numpy(dtype=float)[:, None], np.maximum(days, 0) / 365.25)
+    values = np.where(active, lots['amount'].to_numpy(dtype=float)[:, None] * growth, 0.0)
+    units = np.where(active, lots['units'].to_numpy(dtype=float)[:, None], 0.0)
+
+    # Lots -> holdings: sum rows sharing a symbol
+    codes, symbols = pd.factorize(lots['asset_symbol'])
+    holding_values = np.zeros((len(symbols), len(mondays)))
+    holding_units = np.zeros((len(symbols), len(mondays)))
+    np.add.at(holding_values, codes, values)
+    np.add.at(holding_units, codes, units)
+
+    holding, week = np.nonzero(holding_units > 0)
+    years, week_numbers = wc.keys_to_year_week(keys[week])
+    asset_types = lots.groupby(codes)['asset_type'].first().to_numpy()
+    value = holding_values[holding, week]
+    return pd.DataFrame({
+        'asset_symbol': symbols.to_numpy()[holding],
+        'asset_type': asset_types[holding],
+        'price_date': pd.DatetimeIndex(mondays[week]).strftime('%Y-%m-%d'),
+        'price': np.round(value / holding_units[holding, week], 2),
+        'value': np.round(value, 2),
+        'volume': None,
+        'iso_year': years,
+        'iso_week': week_numbers
+    })
+
+
+def nav_records(navs: pd.DataFrame) -> List[Dict[str, Any]]:
+    """weekly_nav_frame rows as the per-week dicts the older callers expect"""
+    return navs[['asset_symbol', 'asset_type', 'price', 'price_date', 'volume']].to_dict('records')
+
+
+# ============================================================================
+# SHARED SCHEME INDEX
+# ============================================================================
+
+INDEX_COLUMNS = ['asset_symbol', 'asset_type', 'price_date', 'price', 'volume', 'iso_year', 'iso_week']
+CAGR_INDEX_BASE = 100.0
+CAGR_INDEX_BASE_DATE = np.datetime64('2000-01-03', 'D')  # an ISO Monday
+CAGR_INDEX_SOURCE = 'cagr_index'  # historical_prices.source of index rows
+
+
+def cagr_index(cagr, dates) -> np.ndarray:
+    """Index level on dates: CAGR_INDEX_BASE compounded at cagr from CAGR_INDEX_BASE_DATE"""
+    days = (np.asarray(dates, dtype='datetime64[D]') - CAGR_INDEX_BASE_DATE).astype(np.int64)
+    return CAGR_INDEX_BASE * np.power(1.0 + np.asarray(cagr, dtype=float), days / 365.25)
+
+
+def implied_cagr(levels, dates) -> np.ndarray:
+    """CAGR each stored index level was compounded at (inverse of cagr_index)"""
+    years = (np.asarray(dates, dtype='datetime64[D]') - CAGR_INDEX_BASE_DATE).astype(np.int64) / 365.25
+    return np.power(np.asarray(levels, dtype=float) / CAGR_INDEX_BASE, 1.0 / years) - 1.0
+
+
+def weekly_index_frame(schemes: pd.DataFrame, keys) -> pd.DataFrame:
+    """
+    Index of many schemes over many weeks as one schemes x weeks array
+
+    Args:
+        schemes: One row per scheme with asset_symbol, asset_type, cagr
+        keys: ISO week keys
+
+    Returns:
+        Frame with INDEX_COLUMNS: one row per scheme per ISO Monday
+    """
+    keys = np.asarray(keys, dtype=np.int32)
+    if schemes.empty or not len(keys):
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    mondays = wc.week_keys_to_mondays(keys)
+    levels = cagr_index(schemes['cagr'].to_numpy(dtype=float)[:, None], mondays[None, :])
+
+    scheme, week = (axis.ravel() for axis in np.indices(levels.shape))
+    years, week_numbers = wc.keys_to_year_week(keys[week])
+    return pd.DataFrame({
+        'asset_symbol': schemes['asset_symbol'].to_numpy()[scheme],
+        'asset_type': schemes['asset_type'].to_numpy()[scheme],
+        'price_date': pd.DatetimeIndex(mondays[week]).strftime('%Y-%m-%d'),
+        'price': np.round(levels[scheme, week], 4),
+        'volume': None,
+        'iso_year': years,
+        'iso_week': week_numbers
+    })
 
 
 # ============================================================================
 # SIMPLIFIED API FOR USE IN APP
 # ============================================================================
 
+_calculator: Optional[PMS_AIF_Calculator] = None
+_calculator_lock = threading.Lock()
+
+
+def get_pms_aif_calculator() -> PMS_AIF_Calculator:
+    """Process-wide calculator, so its SEBI CAGR cache survives across calls"""
+    global _calculator
+    if _calculator is None:
+        with _calculator_lock:
+            if _calculator is None:
+                _calculator = PMS_AIF_Calculator()
+    return _calculator
+
+
+def value_holdings(holdings: List[Dict[str, Any]], transactions: List[Dict[str, Any]]) -> pd.DataFrame:
+    """PMS_AIF_Calculator.value_holdings on the shared calculator"""
+    return get_pms_aif_calculator().value_holdings(holdings, transactions)
+
+
 def get_pms_current_value(ticker: str, investment_date: str, investment_amount: float, quantity: float = 1.0) -> Dict[str, Any]:
     """
     Simple API to get PMS current value
@@ -537,7 +795,7 @@ def get_pms_current_value(ticker: str, investment_date: str, investment_amount:
     Returns:
         Dict with current_price (per unit) and calculation details
     """
-    calculator = PMS_AIF_Calculator()
+    calculator = get_pms_aif_calculator()
     result = calculator.calculate_pms_aif_value(ticker, investment_date, investment_amount, is_aif=False)
     
     # Calculate per-unit price
@@ -561,7 +819,7 @@ def get_aif_current_value(ticker: str, investment_date: str, investment_amount:
     Returns:
         Dict with current_price (per unit) and calculation details
     """
-    calculator = PMS_AIF_Calculator()
+    calculator = get_pms_aif_calculator()
     result = calculator.calculate_pms_aif_value(ticker, investment_date, investment_amount, is_aif=True)
     
     # Calculate per-unit price
@@ -0,0 +1,217 @@
+"""
+Local Read Replica for Shared Price Data
+- Keeps stock_master and historical_prices in an embedded SQLite file
+- Pulls only the delta since a persisted high-water mark, at most once per sync interval
+- Chart, 52-week and missing-week reads are served locally (see SharedDatabaseManager)
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, List, Any
+
+from database_local import SQLiteClient
+from db_repository import is_missing_schema_error
+
+logger = logging.getLogger(__name__)
+
+REPLICA_SYNC_INTERVAL = 300  # seconds between delta queries
+REPLICA_PAGE_SIZE = 1000  # PostgREST max rows per response
+EPOCH_WATERMARK = '1970-01-01T00:00:00+00:00'
+# Each sync re-reads this far below the watermark: created_at is the writing
+# transaction's start time, so a concurrent upsert that commits late can land
+# below rows already synced (re-read rows are idempotent upserts)
+REPLICA_OVERLAP_SECONDS = 300
+
+REPLICA_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replica_state (
+    table_name TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    watermark_id TEXT,
+    synced_at TEXT
+);
+"""
+
+STOCK_MASTER_COLUMNS = 'id, ticker, stock_name, asset_type, sector, live_price, last_updated, created_at'
+HISTORICAL_PRICE_COLUMNS = 'id, stock_id, price_date, price, volume, source, iso_year, iso_week, created_at'
+# Needs ADD_PRICE_UPDATED_AT.sql; without it only inserted rows are synced
+HISTORICAL_PRICE_KEYSET = 'updated_at'
+
+# Replicated tables and how to upsert them locally
+REPLICATED_TABLES = {
+    'stock_master': 'id',
+    'historical_prices': 'stock_id,price_date',
+}
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Server timestamp -> aware datetime (naive values are taken as UTC)"""
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _rewind(watermark: str) -> str:
+    """Watermark moved back by REPLICA_OVERLAP_SECONDS"""
+    if watermark == EPOCH_WATERMARK:
+        return watermark
+    try:
+        return (_parse_timestamp(watermark) - timedelta(seconds=REPLICA_OVERLAP_SECONDS)).isoformat()
+    except ValueError:
+        return EPOCH_WATERMARK
+
+
+class PriceReplica:
+    """
+    Embedded replica of the shared, mostly append-only price tables
+
+    historical_prices is synced with an (updated_at, id) keyset so rows written
+    by one bulk upsert (same timestamp) are never skipped or looped over, and
+    upserts that overwrite a week (current-week re-prices, PMS/AIF index
+    rewrites) are pulled again. Before ADD_PRICE_UPDATED_AT.sql has run it
+    falls back to created_at, which only sees new rows.
+    stock_master is small and also changes through live_price updates, so it
+    syncs on created_at OR last_updated. Both restart REPLICA_OVERLAP_SECONDS
+    below their watermark to pick up late commits. Writes made through this
+    process are applied locally as well (write_through), so reads see them immediately.
+    """
+
+    def __init__(self, remote, path: str = 'price_replica.db', sync_interval: int = REPLICA_SYNC_INTERVAL):
+        self.remote = remote
+        self.path = path
+        self.sync_interval = sync_interval
+        self.client = SQLiteClient(path)
+        self.client.execute_script(REPLICA_STATE_SCHEMA)
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._keyset = HISTORICAL_PRICE_KEYSET
+
+    # ========================================================================
+    # SYNC
+    # ========================================================================
+
+    def maybe_sync(self) -> Optional[Dict[str, int]]:
+        """Sync if the interval has elapsed; never blocks behind a running sync"""
+        if time.time() - self._last_sync < self.sync_interval:
+            return None
+        if not self._sync_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sync()
+        finally:
+            self._sync_lock.release()
+
+    def sync(self) -> Dict[str, int]:
+        """Pull all pending deltas now"""
+        with self._sync_lock:
+            return self._sync()
+
+    def _sync(self) -> Dict[str, int]:
+        # stock_master first: local historical_prices rows reference it
+        pulled = {
+            'stock_master': self._sync_stock_master(),
+            'historical_prices': self._sync_historical_prices(),
+        }
+        self._last_sync = time.time()
+        return pulled
+
+    def _sync_stock_master(self) -> int:
+        watermark, _ = self._get_watermark('stock_master')
+        since = _rewind(watermark)
+        rows = []
+        offset = 0
+        while True:
+            page = self.remote.table('stock_master').select(STOCK_MASTER_COLUMNS).or_(
+                f'created_at.gt."{since}",last_updated.gt."{since}"'
+            ).order('id').range(offset, offset + REPLICA_PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < REPLICA_PAGE_SIZE:
+                break
+            offset += REPLICA_PAGE_SIZE
+
+        if rows:
+            self.client.table('stock_master').upsert(rows, on_conflict='id').execute()
+            newest = max((r[column] for r in rows for column in ('created_at', 'last_updated') if r.get(column)),
+                         key=_parse_timestamp, default=watermark)
+            if _parse_timestamp(newest) > _parse_timestamp(watermark):
+                self._set_watermark('stock_master', newest, None)
+        return len(rows)
+
+    def _sync_historical_prices(self) -> int:
+        try:
+            return self._pull_historical_prices()
+        except Exception as e:
+            if self._keyset == 'created_at' or not is_missing_schema_error(e):
+                raise
+            logger.warning("historical_prices.updated_at missing (run ADD_PRICE_UPDATED_AT.sql); "
+                           "replica only syncs new price rows: %s", e)
+            self._keyset = 'created_at'
+            return self._pull_historical_prices()
+
+    def _pull_historical_prices(self) -> int:
+        stored, _ = self._get_watermark('historical_prices')
+        column = self._keyset
+        columns = HISTORICAL_PRICE_COLUMNS + (', updated_at' if column == 'updated_at' else '')
+        # Keyset scan from the overlap point; the stored watermark only moves forward
+        watermark, watermark_id = _rewind(stored), None
+        pulled = 0
+        while True:
+            query = self.remote.table('historical_prices').select(columns)
+            if watermark_id:
+                query = query.or_(
+                    f'{column}.gt."{watermark}",and({column}.eq."{watermark}",id.gt.{watermark_id})'
+                )
+            else:
+                query = query.gt(column, watermark)
+            page = query.order(column).order('id').limit(REPLICA_PAGE_SIZE).execute().data
+
+            if page:
+                self.client.table('historical_prices').upsert(
+                    page, on_conflict=REPLICATED_TABLES['historical_prices']
+                ).execute()
+                watermark, watermark_id = page[-1][column], page[-1]['id']
+                if _parse_timestamp(watermark) >= _parse_timestamp(stored):
+                    self._set_watermark('historical_prices', watermark, watermark_id)
+                pulled += len(page)
+
+            if len(page) < REPLICA_PAGE_SIZE:
+                return pulled
+
+    def _get_watermark(self, table: str):
+        rows = self.client.table('replica_state').select('watermark, watermark_id').eq(
+            'table_name', table
+        ).execute().data
+        if rows:
+            return rows[0]['watermark'], rows[0]['watermark_id']
+        return EPOCH_WATERMARK, None
+
+    def _set_watermark(self, table: str, watermark: str, watermark_id: Optional[str]):
+        self.client.table('replica_state').upsert({
+            'table_name': table,
+            'watermark': watermark,
+            'watermark_id': watermark_id,
+            'synced_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }, on_conflict='table_name').execute()
+
+    # ========================================================================
+    # WRITE-THROUGH
+    # ========================================================================
+
+    def write_through(self, table: str, records: List[Dict[str, Any]]):
+        """Apply rows this process just wrote to the server (read-your-writes)"""
+        if table not in REPLICATED_TABLES or not records:
+            return
+        try:
+            self.client.table(table).upsert(records, on_conflict=REPLICATED_TABLES[table]).execute()
+        except Exception:
+            # e.g. a price for a stock the replica has not pulled yet - next sync brings it
+            self._last_sync = 0.0
+    
+    def apply_update(self, table: str, values: Dict[str, Any], row_id: str):
+        """Apply a partial update of one replicated row by id"""
+        if table not in REPLICATED_TABLES:
+            return
+        try:
+            self.client.table(table).update(values).eq('id', row_id).execute()
+        except Exception:
+            self._last_sync = 0.0
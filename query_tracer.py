@@ -0,0 +1,315 @@
+"""
+Query Tracing for the Database Layer
+- Wraps the Supabase client so every table/rpc call records table, operation,
+  row count, payload bytes and latency
+- Wraps SharedDatabaseManager methods so each query knows which method issued it
+- Aggregates per page rerun and logs queries slower than a threshold
+- Developer panel with a query waterfall (enable with WMS_QUERY_PANEL=1)
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, List, Any
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('WMS_SLOW_QUERY_MS', '500'))
+SLOW_QUERY_LOG_SIZE = 200  # most recent slow queries kept for the panel
+
+# Builder methods that set the operation (and carry the request payload)
+TRACED_OPERATIONS = ('select', 'insert', 'upsert', 'update', 'delete')
+WRITE_OPERATIONS = ('insert', 'upsert', 'update')
+
+_local = threading.local()
+slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+# ============================================================================
+# PER-RERUN TRACE
+# ============================================================================
+
+class QueryTrace:
+    """Queries and method calls recorded during one page rerun"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.started = time.perf_counter()
+        self.queries: List[Dict[str, Any]] = []
+        self.methods: List[Dict[str, Any]] = []
+
+    def offset_ms(self, moment: float) -> float:
+        return (moment - self.started) * 1000
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals plus (method, table, operation) groups issued more than once"""
+        groups: Dict[tuple, int] = {}
+        for q in self.queries:
+            key = (q['method'], q['table'], q['operation'])
+            groups[key] = groups.get(key, 0) + 1
+
+        return {
+            'queries': len(self.queries),
+            'total_ms': sum(q['latency_ms'] for q in self.queries),
+            'rows': sum(q['rows'] for q in self.queries),
+            'bytes': sum(q['bytes'] for q in self.queries),
+            'slow': sum(1 for q in self.queries if q['slow']),
+            'repeated': sorted(
+                ({'method': k[0], 'table': k[1], 'operation': k[2], 'count': n}
+                 for k, n in groups.items() if n > 1),
+                key=lambda g: -g['count']
+            ),
+        }
+
+
+def start_trace(label: str = '') -> QueryTrace:
+    """Start collecting queries for the current thread (one Streamlit rerun)"""
+    _local.trace = QueryTrace(label)
+    _local.methods = []
+    return _local.trace
+
+
+def end_trace() -> Optional[QueryTrace]:
+    """Stop collecting and return the finished trace"""
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace
+
+
+def current_trace() -> Optional[QueryTrace]:
+    return getattr(_local, 'trace', None)
+
+
+def in_current_trace(func):
+    """
+    Bind func to the calling thread's trace and method, for use in worker threads
+    
+    Thread pools do not inherit thread-locals, so without this queries made by
+    e.g. bulk upsert workers would be missing from the rerun's trace.
+    """
+    trace = current_trace()
+    methods = list(getattr(_local, 'methods', None) or [])
+
+    @functools.wraps(func)
+    def bound(*args, **kwargs):
+        _local.trace, _local.methods = trace, list(methods)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.trace, _local.methods = None, []
+    return bound
+
+
+def _current_method() -> str:
+    stack = getattr(_local, 'methods', None)
+    return stack[-1] if stack else '-'
+
+
+def _payload_bytes(payload: Any) -> int:
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _record(table: str, operation: str, started: float, rows: int, payload: Any, error: Optional[str]):
+    latency_ms = (time.perf_counter() - started) * 1000
+    slow = latency_ms >= SLOW_QUERY_MS
+    trace = current_trace()
+    if trace is None and not slow:
+        return
+
+    entry = {
+        'method': _current_method(),
+        'table': table,
+        'operation': operation,
+        'rows': rows,
+        'bytes': _payload_bytes(payload) if payload is not None else 0,
+        'latency_ms': latency_ms,
+        'slow': slow,
+        'error': error,
+    }
+
+    if trace is not None:
+        entry['start_ms'] = trace.offset_ms(started)
+        trace.queries.append(entry)
+
+    if slow:
+        slow_queries.append({**entry, 'at': time.strftime('%H:%M:%S')})
+        logger.warning("Slow query %.0f ms: %s %s via %s (%d rows)",
+                       latency_ms, entry['operation'], table, entry['method'], rows)
+
+
+# ============================================================================
+# CLIENT WRAPPERS
+# ============================================================================
+
+class TracedQuery:
+    """Query builder proxy that times execute() and remembers the operation"""
+
+    def __init__(self, query, table: str, operation: str = 'select', payload: Any = None):
+        self._query = query
+        self._table = table
+        self._operation = operation
+        self._payload = payload
+
+    def _wrap(self, result, operation: str, payload: Any):
+        if hasattr(result, 'execute'):
+            return TracedQuery(result, self._table, operation, payload)
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        operation = name if name in TRACED_OPERATIONS else self._operation
+
+        if not callable(attr):
+            # e.g. the .not_ property, which returns a builder
+            return self._wrap(attr, operation, self._payload)
+
+        def call(*args, **kwargs):
+            payload = args[0] if name in WRITE_OPERATIONS and args else self._payload
+            return self._wrap(attr(*args, **kwargs), operation, payload)
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+        try:
+            response = self._query.execute()
+        except Exception as e:
+            _record(self._table, self._operation, started, 0, self._payload, str(e)[:120])
+            raise
+
+        data = getattr(response, 'data', None)
+        rows = len(data) if isinstance(data, list) else int(data is not None)
+        # Reads are sized by what came back, writes by what was sent
+        payload = self._payload if self._operation in WRITE_OPERATIONS else data
+        _record(self._table, self._operation, started, rows, payload, None)
+        return response
+
+
+class TracedClient:
+    """Supabase client proxy routing table/rpc calls through TracedQuery"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, table_name: str):
+        return TracedQuery(self._client.table(table_name), table_name)
+
+    def from_(self, table_name: str):
+        return self.table(table_name)
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None):
+        return TracedQuery(self._client.rpc(fn, params or {}), fn, 'rpc', params)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def traced_methods(cls):
+    """
+    Class decorator: attribute every query to the manager method that issued it
+
+    Wraps each public method defined on the class itself; subclasses inherit
+    the wrapped versions. Private helpers are not wrapped, so their queries are
+    attributed to the public method that called them.
+    """
+    def wrap(name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = getattr(_local, 'methods', None)
+            if stack is None:
+                stack = _local.methods = []
+            trace = current_trace()
+            started = time.perf_counter()
+            stack.append(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stack.pop()
+                if trace is not None and not stack:
+                    trace.methods.append({
+                        'method': name,
+                        'start_ms': trace.offset_ms(started),
+                        'latency_ms': (time.perf_counter() - started) * 1000,
+                    })
+        return wrapper
+
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, (staticmethod, classmethod)):
+            continue
+        if callable(attr) and not name.startswith('_'):
+            setattr(cls, name, wrap(name, attr))
+    return cls
+
+
+# ============================================================================
+# DEVELOPER PANEL
+# ============================================================================
+
+def query_panel_enabled() -> bool:
+    """WMS_QUERY_PANEL=1 or [debug] query_panel = true in secrets"""
+    if os.environ.get('WMS_QUERY_PANEL', '').strip() in ('1', 'true', 'yes'):
+        return True
+    try:
+        return bool(st.secrets.get('debug', {}).get('query_panel', False))
+    except Exception:
+        return False
+
+
+def render_query_panel(trace: Optional[QueryTrace]):
+    """Summary, waterfall and slow-query log for one rerun"""
+    if trace is None:
+        return
+
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    summary = trace.summary()
+    with st.expander(f"🔬 Query trace: {summary['queries']} queries, {summary['total_ms']:.0f} ms", expanded=False):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Queries", summary['queries'])
+        col2.metric("DB time", f"{summary['total_ms']:.0f} ms")
+        col3.metric("Rows", f"{summary['rows']:,}")
+        col4.metric("Payload", f"{summary['bytes'] / 1024:,.1f} KB")
+
+        if summary['repeated']:
+            st.caption("⚠️ Repeated queries (possible N+1):")
+            st.dataframe(pd.DataFrame(summary['repeated']), use_container_width=True, hide_index=True)
+
+        if trace.queries:
+            labels = [f"{i + 1}. {q['method']} · {q['operation']} {q['table']}" for i, q in enumerate(trace.queries)]
+            fig = go.Figure(go.Bar(
+                y=labels,
+                x=[max(q['latency_ms'], 0.5) for q in trace.queries],
+                base=[q['start_ms'] for q in trace.queries],
+                orientation='h',
+                marker_color=['#d62728' if q['slow'] or q['error'] else '#1f77b4' for q in trace.queries],
+                customdata=[[q['rows'], q['bytes'], q['latency_ms']] for q in trace.queries],
+                hovertemplate='%{y}<br>%{customdata[2]:.1f} ms, %{customdata[0]} rows, %{customdata[1]} bytes<extra></extra>'
+            ))
+            fig.update_layout(
+                title="Query waterfall (ms since rerun start)",
+                height=max(250, 22 * len(labels) + 80),
+                yaxis=dict(autorange='reversed'),
+                xaxis_title="ms",
+                margin=dict(l=10, r=10, t=40, b=10)
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.dataframe(pd.DataFrame(trace.queries), use_container_width=True, hide_index=True)
+
+        if trace.methods:
+            st.caption("Slowest manager calls:")
+            methods = pd.DataFrame(trace.methods).sort_values('latency_ms', ascending=False).head(15)
+            st.dataframe(methods, use_container_width=True, hide_index=True)
+
+        if slow_queries:
+            st.caption(f"🐢 Slow query log (≥ {SLOW_QUERY_MS:.0f} ms, all sessions):")
+            st.dataframe(pd.DataFrame(list(slow_queries)[::-1]), use_container_width=True, hide_index=True)
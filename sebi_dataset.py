@@ -0,0 +1,224 @@
+"""
+SEBI PMS / AIF Dataset Cache
+- Each SEBI page is downloaded and parsed at most once per refresh period
+  (SEBI_REFRESH_SECONDS), not once per ticker
+- The parsed table is persisted in a local SQLite file, so restarts reuse it;
+  if a refresh fails, the last persisted copy keeps serving lookups
+- Lookups go through dict indexes on registration number and normalized
+  manager / scheme name, built once per load
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from name_resolver import normalize_name
+
+logger = logging.getLogger(__name__)
+
+SEBI_URLS = {
+    'pms': "https://www.sebi.gov.in/sebiweb/other/OtherAction.do?doPmr=yes",
+    # AIF data URL (update if SEBI changes it)
+    'aif': "https://www.sebi.gov.in/sebiweb/other/OtherAction.do?doRecognisedFpi=yes&intmId=10",
+}
+SEBI_CACHE_PATH = os.environ.get('WMS_SEBI_CACHE', 'sebi_cache.db')
+SEBI_REFRESH_SECONDS = int(os.environ.get('WMS_SEBI_REFRESH_HOURS', '24')) * 3600
+SEBI_RETRY_SECONDS = 300  # retry interval while there is no copy at all
+
+# INP000005000 (PMS), IN/AIF3/20-21/0812 (AIF)
+REGISTRATION_PATTERN = r'INP\d{9}|IN/AIF\d/\d{2}-\d{2}/\d+'
+NAME_COLUMN_WORDS = ('NAME', 'MANAGER', 'SCHEME', 'STRATEGY', 'FUND')
+
+DATASET_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sebi_dataset_state (
+    kind TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    row_count INTEGER
+);
+"""
+
+
+class SebiDataset:
+    """One SEBI table with registration-number and name indexes"""
+
+    def __init__(self, kind: str, table: pd.DataFrame, fetched_at: float, expires_at: Optional[float] = None):
+        self.kind = kind
+        self.table = table.reset_index(drop=True)
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at  # None: fetched_at + the store's refresh period
+        self.by_registration: Dict[str, List[int]] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        self._build_indexes()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _build_indexes(self):
+        if self.table.empty:
+            return
+        cells = self.table.astype(str)
+
+        # Registration numbers: the registration column when there is one,
+        # otherwise any cell holding one (AIF pages vary in layout)
+        reg_columns = [c for c in cells.columns if 'REGISTRATION' in str(c).upper()] or list(cells.columns)
+        for column in reg_columns:
+            found = cells[column].str.upper().str.extract(f'({REGISTRATION_PATTERN})', expand=False).dropna()
+            for row, code in found.items():
+                self.by_registration.setdefault(code, []).append(row)
+
+        for column in cells.columns:
+            if any(word in str(column).upper() for word in NAME_COLUMN_WORDS) and 'REGISTRATION' not in str(column).upper():
+                for row, name in cells[column].map(normalize_name).items():
+                    if name:
+                        self.by_name.setdefault(name, []).append(row)
+
+        for rows in self.by_registration.values():
+            rows[:] = list(dict.fromkeys(rows))
+        for rows in self.by_name.values():
+            rows[:] = list(dict.fromkeys(rows))
+
+    def lookup(self, query: str) -> pd.DataFrame:
+        """Rows for a registration number (or a text containing one), else for an exact normalized name"""
+        text = str(query).strip().upper()
+        code = re.search(REGISTRATION_PATTERN, text)
+        rows = self.by_registration.get(code.group(0), []) if code else []
+        if not rows:
+            rows = self.by_name.get(normalize_name(text), [])
+        return self.table.iloc[rows]
+
+
+def _flatten_columns(table: pd.DataFrame) -> pd.DataFrame:
+    """read_html MultiIndex headers -> 'Top Sub' strings"""
+    if isinstance(table.columns, pd.MultiIndex):
+        table.columns = [' '.join(dict.fromkeys(str(part) for part in column if 'Unnamed' not in str(part))).strip()
+                         for column in table.columns]
+    else:
+        table.columns = [str(column) for column in table.columns]
+    return table.loc[:, ~pd.Index(table.columns).duplicated()]
+
+
+def download_table(kind: str) -> pd.DataFrame:
+    """Parse a SEBI page into one table: every table with a registration column, else the largest"""
+    tables = [_flatten_columns(table) for table in pd.read_html(SEBI_URLS[kind])]
+    if not tables:
+        return pd.DataFrame()
+    registered = [t for t in tables if any('REGISTRATION' in c.upper() for c in t.columns)]
+    table = pd.concat(registered, ignore_index=True) if registered else max(tables, key=len)
+    return table.astype(str).replace({'nan': ''})
+
+
+class SebiDatasetStore:
+    """Persisted copies of the SEBI tables plus the in-process indexed datasets"""
+
+    def __init__(self, path: str = SEBI_CACHE_PATH, refresh_seconds: int = SEBI_REFRESH_SECONDS,
+                 retry_seconds: int = SEBI_RETRY_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self._datasets: Dict[str, SebiDataset] = {}
+        self._lock = threading.Lock()  # guards _datasets only, never held across a download
+        self._download_locks = {kind: threading.Lock() for kind in SEBI_URLS}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.executescript(DATASET_STATE_SCHEMA)
+        return conn
+
+    def _load_persisted(self, kind: str) -> Optional[SebiDataset]:
+        try:
+            with self._connect() as conn:
+                state = conn.execute('SELECT fetched_at FROM sebi_dataset_state WHERE kind = ?', (kind,)).fetchone()
+                if not state:
+                    return None
+                table = pd.read_sql(f'SELECT * FROM sebi_{kind}', conn)
+            return SebiDataset(kind, table, state[0])
+        except Exception as e:
+            logger.warning("Could not read cached SEBI %s table: %s", kind, e)
+            return None
+
+    def _persist(self, kind: str, table: pd.DataFrame, fetched_at: float):
+        try:
+            with self._connect() as conn:
+                table.to_sql(f'sebi_{kind}', conn, if_exists='replace', index=False)
+                conn.execute('INSERT OR REPLACE INTO sebi_dataset_state (kind, fetched_at, row_count) VALUES (?, ?, ?)',
+                             (kind, fetched_at, len(table)))
+        except Exception as e:
+            logger.warning("Could not persist SEBI %s table: %s", kind, e)
+
+    def _is_fresh(self, dataset: Optional[SebiDataset]) -> bool:
+        if dataset is None:
+            return False
+        expires_at = dataset.expires_at or dataset.fetched_at + self.refresh_seconds
+        return time.time() < expires_at
+
+    def _current(self, kind: str) -> Optional[SebiDataset]:
+        """In-process dataset, else the persisted copy (remembered for next time)"""
+        with self._lock:
+            dataset = self._datasets.get(kind)
+        if dataset is None:
+            dataset = self._load_persisted(kind)
+            if dataset is not None:
+                with self._lock:
+                    dataset = self._datasets.setdefault(kind, dataset)
+        return dataset
+
+    def get(self, kind: str) -> SebiDataset:
+        """
+        Indexed dataset for 'pms' or 'aif', refreshed when older than refresh_seconds
+
+        Only one thread downloads a kind at a time. While it does, other
+        lookups keep using the stale copy; they wait only when there is no
+        copy at all. Never raises: a failed download falls back to the last
+        persisted copy (retried after the refresh period), then to an empty
+        dataset (retried after retry_seconds).
+        """
+        dataset = self._current(kind)
+        if self._is_fresh(dataset):
+            return dataset
+
+        download_lock = self._download_locks[kind]
+        if not download_lock.acquire(blocking=dataset is None):
+            return dataset  # another thread is refreshing it
+        try:
+            # Refreshed by another thread while this one waited
+            dataset = self._current(kind)
+            if self._is_fresh(dataset):
+                return dataset
+
+            try:
+                table = download_table(kind)
+                fetched_at = time.time()
+                self._persist(kind, table, fetched_at)
+                dataset = SebiDataset(kind, table, fetched_at)
+            except Exception as e:
+                logger.warning("SEBI %s download failed: %s", kind, e)
+                if dataset is None:
+                    dataset = SebiDataset(kind, pd.DataFrame(), time.time(), time.time() + self.retry_seconds)
+                else:
+                    # Keep serving the stale copy; try again after another period
+                    dataset.expires_at = time.time() + self.refresh_seconds
+
+            with self._lock:
+                self._datasets[kind] = dataset
+            return dataset
+        finally:
+            download_lock.release()
+
+
+_store: Optional[SebiDatasetStore] = None
+_store_lock = threading.Lock()
+
+
+def get_sebi_dataset(kind: str) -> SebiDataset:
+    """Process-wide indexed SEBI dataset ('pms' or 'aif')"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SebiDatasetStore()
+    return _store.get(kind)
@@ -1,16 +1,37 @@
 """
 Smart Ticker Detection System
 Auto-detects if ticker is NSE/BSE stock, Mutual Fund, PMS, or AIF
+
+Price lookups are memoized by (ticker, date); smart_price_fetch_batch triages
+many pairs at once with one yfinance download per exchange and date window
+and one NAV history per mutual fund scheme.
 """
 
+import threading
+import time
 import yfinance as yf
 import pandas as pd
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+
+from symbol_master import lookup_symbol
+
+PRICE_MEMO_TTL_SECONDS = 300  # current prices and misses; dated prices never expire
+PRICE_MEMO_MAX_ENTRIES = 50000
+BATCH_WINDOW_GAP_DAYS = 31  # dates further apart than this get separate downloads
+MF_MATCH_DAYS = 7  # a NAV within this many days of the target date counts
+
+_price_memo: Dict[Tuple[str, Optional[str]], Tuple[Dict[str, Any], float]] = {}
+_price_memo_lock = threading.Lock()
+_mftool_client = None
+
 
 def detect_ticker_type(ticker: str) -> str:
     """
     Detect what type of asset the ticker represents
     
+    Known codes are answered by the symbol master; the heuristics below only
+    classify symbols it does not list.
+    
     Args:
         ticker: The ticker symbol
     
@@ -19,6 +40,10 @@ def detect_ticker_type(ticker: str) -> str:
     """
     ticker_str = str(ticker).strip().upper()
     
+    known = lookup_symbol(ticker_str)
+    if known:
+        return known.asset_type
+    
     # PMS detection
     if (ticker_str.startswith('INP') or 
         ticker_str.endswith('_PMS') or 
@@ -42,6 +67,39 @@ def detect_ticker_type(ticker: str) -> str:
     return 'stock'
 
 
+def _memo_key(ticker: str, date: Optional[str]) -> Tuple[str, Optional[str]]:
+    return str(ticker).strip().upper(), date or None
+
+
+def _memo_get(key: Tuple[str, Optional[str]]) -> Optional[Dict[str, Any]]:
+    with _price_memo_lock:
+        cached = _price_memo.get(key)
+    if not cached:
+        return None
+    result, stored_at = cached
+    if (key[1] is None or not result.get('price')) and time.time() - stored_at > PRICE_MEMO_TTL_SECONDS:
+        return None
+    return result
+
+
+def _memo_put(key: Tuple[str, Optional[str]], result: Dict[str, Any]):
+    with _price_memo_lock:
+        if len(_price_memo) >= PRICE_MEMO_MAX_ENTRIES:
+            # Drop the oldest tenth (dicts keep insertion order)
+            for stale in list(_price_memo)[:PRICE_MEMO_MAX_ENTRIES // 10]:
+                del _price_memo[stale]
+        _price_memo[key] = (result, time.time())
+
+
+def _mftool():
+    """One Mftool client per process (it loads the AMFI scheme list on creation)"""
+    global _mftool_client
+    if _mftool_client is None:
+        from mftool import Mftool
+        _mftool_client = Mftool()
+    return _mftool_client
+
+
 def smart_price_fetch(ticker: str, date: str = None) -> Dict[str, Any]:
     """
     Smart detection and price fetching for any ticker
@@ -54,10 +112,21 @@ def smart_price_fetch(ticker: str, date: str = None) -> Dict[str, Any]:
     Returns:
         dict with price, source, type, and exchange
     """
-    ticker_str = str(ticker).strip()
+    key = _memo_key(ticker, date)
+    cached = _memo_get(key)
+    if cached is not None:
+        return cached
     
+    result = _smart_price_fetch(str(ticker).strip(), date)
+    _memo_put(key, result)
+    return result
+
+
+def _smart_price_fetch(ticker_str: str, date: Optional[str]) -> Dict[str, Any]:
+    """Uncached smart_price_fetch"""
     # Check type first
-    ticker_type = detect_ticker_type(ticker_str)
+    known = lookup_symbol(ticker_str)
+    ticker_type = known.asset_type if known else detect_ticker_type(ticker_str)
     
     if ticker_type == 'pms':
         return {'ticker': ticker_str, 'price': None, 'source': 'manual', 'type': 'pms', 'message': 'PMS requires manual entry'}
@@ -65,14 +134,17 @@ def smart_price_fetch(ticker: str, date: str = None) -> Dict[str, Any]:
     if ticker_type == 'aif':
         return {'ticker': ticker_str, 'price': None, 'source': 'manual', 'type': 'aif', 'message': 'AIF requires manual entry'}
     
+    if ticker_type == 'mutual_fund':
+        return try_mutual_fund(known.symbol if known else ticker_str, date)
+    
     # For stocks and numeric tickers, try multiple sources
     if ticker_type in ['stock', 'numeric_unknown']:
-        result = try_stock_sources(ticker_str, date)
+        result = try_stock_sources(known.symbol if known else ticker_str, date)
         if result['price']:
             return result
         
-        # If numeric, also try mutual fund
-        if ticker_str.isdigit():
+        # If numeric and not a listed stock, also try mutual fund
+        if ticker_str.isdigit() and not known:
             result = try_mutual_fund(ticker_str, date)
             if result['price']:
                 return result
@@ -81,11 +153,14 @@ def smart_price_fetch(ticker: str, date: str = None) -> Dict[str, Any]:
 
 
 def try_stock_sources(ticker: str, date: str = None) -> Dict[str, Any]:
-    """Try to fetch stock price from NSE and BSE"""
+    """Try to fetch stock price from NSE and BSE ('X.BO' symbols skip NSE)"""
+    base = ticker[:-3] if ticker.endswith(('.NS', '.BO')) else ticker
     
     # Try NSE first
     try:
-        nse_ticker = f"{ticker}.NS"
+        if ticker.endswith('.BO'):
+            raise LookupError('BSE-only symbol')
+        nse_ticker = f"{base}.NS"
         stock = yf.Ticker(nse_ticker)
         
         if date:
@@ -107,7 +182,7 @@ def try_stock_sources(ticker: str, date: str = None) -> Dict[str, Any]:
     
     # Try BSE
     try:
-        bse_ticker = f"{ticker}.BO"
+        bse_ticker = f"{base}.BO"
         stock = yf.Ticker(bse_ticker)
         
         if date:
@@ -133,8 +208,7 @@ def try_stock_sources(ticker: str, date: str = None) -> Dict[str, Any]:
 def try_mutual_fund(ticker: str, date: str = None) -> Dict[str, Any]:
     """Try to fetch mutual fund NAV"""
     try:
-        from mftool import Mftool
-        mf = Mftool()
+        mf = _mftool()
         
         # For current NAV
         if not date:
@@ -150,33 +224,244 @@ def try_mutual_fund(ticker: str, date: str = None) -> Dict[str, Any]:
         else:
             # For historical NAV
             hist_data = mf.get_scheme_historical_nav(ticker, as_Dataframe=True)
-            if hist_data is not None and not hist_data.empty:
-                hist_data['date'] = pd.to_datetime(hist_data.index, format='%d-%m-%Y', dayfirst=True)
-                target_date = pd.to_datetime(date)
-                
-                # Find closest date
-                hist_data['date_diff'] = abs(hist_data['date'] - target_date)
-                closest = hist_data.loc[hist_data['date_diff'].idxmin()]
-                
-                if closest['date_diff'].days <= 7:  # Within a week
-                    return {
-                        'ticker': ticker,
-                        'price': float(closest['nav']),
-                        'source': 'mftool',
-                        'type': 'mutual_fund',
-                        'date_match': 'approximate'
-                    }
+            nav = _closest_nav(_nav_series(hist_data), date)
+            if nav:
+                return {
+                    'ticker': ticker,
+                    'price': nav,
+                    'source': 'mftool',
+                    'type': 'mutual_fund',
+                    'date_match': 'approximate'
+                }
     except Exception:
         pass
     
     return {'ticker': ticker, 'price': None, 'source': 'not_found', 'type': 'mutual_fund'}
 
 
+def _nav_series(hist_data) -> Optional[pd.Series]:
+    """mftool historical NAV frame (index dd-mm-yyyy) -> float Series by date"""
+    if hist_data is None or hist_data.empty:
+        return None
+    navs = pd.Series(
+        pd.to_numeric(hist_data['nav'], errors='coerce').values,
+        index=pd.to_datetime(hist_data.index, format='%d-%m-%Y', dayfirst=True)
+    ).dropna()
+    return navs.sort_index()
+
+
+def _closest_nav(navs: Optional[pd.Series], date: str) -> Optional[float]:
+    """NAV on the date nearest to date, if within MF_MATCH_DAYS"""
+    if navs is None or navs.empty:
+        return None
+    target = pd.to_datetime(date)
+    diffs = abs(navs.index - target)
+    nearest = diffs.argmin()
+    if diffs[nearest].days > MF_MATCH_DAYS:
+        return None
+    return float(navs.iloc[nearest])
+
+
+# ============================================================================
+# BATCH
+# ============================================================================
+
+def smart_price_fetch_batch(requests: Iterable[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+    """
+    smart_price_fetch for many (ticker, date) pairs at once
+    
+    Tickers are classified once each; stock prices come from one yfinance
+    download per exchange and date window (NSE first, BSE for the misses),
+    mutual fund NAVs from one history per scheme. Memoized results are
+    reused and new ones memoized.
+    
+    Args:
+        requests: (ticker, 'YYYY-MM-DD' or None for current price) pairs
+    
+    Returns:
+        Dict of {(ticker, date): result} with the same result dicts as
+        smart_price_fetch, keyed exactly as requested
+    """
+    results = {}
+    pending: Dict[Tuple[str, Optional[str]], List[Tuple[str, Optional[str]]]] = {}
+    for request in dict.fromkeys(requests):
+        key = _memo_key(*request)
+        cached = _memo_get(key)
+        if cached is not None:
+            results[request] = cached
+        else:
+            pending.setdefault(key, []).append(request)
+    
+    if pending:
+        fetched = _fetch_batch(list(pending))
+        for key, requested in pending.items():
+            _memo_put(key, fetched[key])
+            for request in requested:
+                results[request] = fetched[key]
+    
+    return results
+
+
+def _fetch_batch(keys: List[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+    """Uncached batch: classify, then stocks by exchange, then mutual funds"""
+    results = {}
+    classified = {}
+    for ticker in dict.fromkeys(ticker for ticker, _ in keys):
+        known = lookup_symbol(ticker)
+        classified[ticker] = (known, known.asset_type if known else detect_ticker_type(ticker))
+    
+    stock_keys, mf_keys = [], []
+    for ticker, date in keys:
+        known, ticker_type = classified[ticker]
+        if ticker_type in ('pms', 'aif'):
+            label = ticker_type.upper()
+            results[(ticker, date)] = {'ticker': ticker, 'price': None, 'source': 'manual', 'type': ticker_type,
+                                       'message': f'{label} requires manual entry'}
+        elif ticker_type == 'mutual_fund':
+            mf_keys.append((ticker, date))
+        else:
+            stock_keys.append((ticker, date))
+    
+    # Stocks: NSE for everything not known to be BSE-only, then BSE for misses
+    base = {}
+    for ticker, _ in stock_keys:
+        known = classified[ticker][0]
+        symbol = known.symbol if known else ticker
+        base[ticker] = (symbol[:-3] if symbol.endswith(('.NS', '.BO')) else symbol, symbol.endswith('.BO'))
+    
+    nse = {key: f"{base[key[0]][0]}.NS" for key in stock_keys if not base[key[0]][1]}
+    for key, price in _download_prices(nse).items():
+        results[key] = {'ticker': key[0], 'price': price, 'source': 'yfinance_nse', 'type': 'stock', 'exchange': 'NSE'}
+    
+    bse = {key: f"{base[key[0]][0]}.BO" for key in stock_keys if key not in results}
+    for key, price in _download_prices(bse).items():
+        results[key] = {'ticker': key[0], 'price': price, 'source': 'yfinance_bse', 'type': 'stock', 'exchange': 'BSE'}
+    
+    # Unlisted numeric codes may still be AMFI scheme codes
+    for key in stock_keys:
+        if key in results:
+            continue
+        if key[0].isdigit() and not classified[key[0]][0]:
+            mf_keys.append(key)
+        else:
+            results[key] = {'ticker': key[0], 'price': None, 'source': 'unknown', 'type': 'unknown'}
+    
+    mf_symbol = {ticker: (classified[ticker][0].symbol if classified[ticker][0] else ticker) for ticker, _ in mf_keys}
+    navs = _mutual_fund_prices(mf_keys, mf_symbol)
+    for key in mf_keys:
+        if navs.get(key):
+            results[key] = {'ticker': key[0], 'price': navs[key], 'source': 'mftool', 'type': 'mutual_fund'}
+        elif classified[key[0]][1] == 'mutual_fund':
+            results[key] = {'ticker': key[0], 'price': None, 'source': 'not_found', 'type': 'mutual_fund'}
+        else:
+            results[key] = {'ticker': key[0], 'price': None, 'source': 'unknown', 'type': 'unknown'}
+    
+    return results
+
+
+def _date_windows(dates: Iterable[str], gap_days: int = BATCH_WINDOW_GAP_DAYS) -> List[Tuple[str, str]]:
+    """Sorted dates -> (first, last) runs with no gap above gap_days"""
+    ordered = sorted(set(dates))
+    if not ordered:
+        return []
+    windows = []
+    start = previous = ordered[0]
+    for date in ordered[1:]:
+        if (pd.Timestamp(date) - pd.Timestamp(previous)).days > gap_days:
+            windows.append((start, previous))
+            start = date
+        previous = date
+    windows.append((start, previous))
+    return windows
+
+
+def _download_closes(symbols: List[str], **kwargs) -> pd.DataFrame:
+    """Daily closes, one column per yfinance symbol, index 'YYYY-MM-DD'"""
+    try:
+        data = yf.download(symbols, progress=False, auto_adjust=True, threads=True, **kwargs)
+    except Exception:
+        return pd.DataFrame()
+    if data is None or data.empty or 'Close' not in data:
+        return pd.DataFrame()
+    closes = data['Close']
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(symbols[0])
+    closes.index = pd.DatetimeIndex(closes.index).tz_localize(None).strftime('%Y-%m-%d')
+    return closes
+
+
+def _download_prices(symbols: Dict[Tuple[str, Optional[str]], str]) -> Dict[Tuple[str, Optional[str]], float]:
+    """
+    Close for each (ticker, date) -> yfinance symbol, exact trading day only
+    (like try_stock_sources); current prices use the latest close
+    """
+    prices = {}
+    current = [key for key in symbols if key[1] is None]
+    if current:
+        closes = _download_closes(sorted({symbols[key] for key in current}), period='5d')
+        for key in current:
+            column = closes.get(symbols[key])
+            if column is not None and column.notna().any():
+                prices[key] = float(column.dropna().iloc[-1])
+    
+    dated = [key for key in symbols if key[1] is not None]
+    for start, end in _date_windows(key[1] for key in dated):
+        in_window = [key for key in dated if start <= key[1] <= end]
+        closes = _download_closes(
+            sorted({symbols[key] for key in in_window}),
+            start=start, end=(pd.Timestamp(end) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        )
+        for key in in_window:
+            column = closes.get(symbols[key])
+            price = column.get(key[1]) if column is not None else None
+            if price is not None and pd.notna(price) and price > 0:
+                prices[key] = float(price)
+    return prices
+
+
+def _mutual_fund_prices(keys: List[Tuple[str, Optional[str]]], scheme_codes: Dict[str, str]) -> Dict[Tuple[str, Optional[str]], float]:
+    """NAV per (ticker, date): one quote or one history download per scheme"""
+    navs = {}
+    if not keys:
+        return navs
+    try:
+        mf = _mftool()
+    except Exception:
+        return navs
+    
+    by_scheme: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+    for key in keys:
+        by_scheme.setdefault(scheme_codes[key[0]], []).append(key)
+    
+    for code, scheme_keys in by_scheme.items():
+        try:
+            if any(date is None for _, date in scheme_keys):
+                quote = mf.get_scheme_quote(code)
+                if quote and 'nav' in quote:
+                    for key in scheme_keys:
+                        if key[1] is None:
+                            navs[key] = float(quote['nav'])
+            dated = [key for key in scheme_keys if key[1] is not None]
+            if dated:
+                history = _nav_series(mf.get_scheme_historical_nav(code, as_Dataframe=True))
+                for key in dated:
+                    nav = _closest_nav(history, key[1])
+                    if nav:
+                        navs[key] = nav
+        except Exception:
+            continue
+    return navs
+
+
 def normalize_ticker(ticker: str, asset_type: str = None) -> str:
     """
     Normalize ticker based on detected type
     FIXED: Prevents double suffix (e.g., RELIANCE.NS.NS)
     
+    This is the ticker stored in stock_master, so aliases the symbol master
+    knows (BSE code, ISIN...) are kept as written; the fetchers map them to
+    the provider symbol through resolve_symbol.
+    
     Args:
         ticker: Original ticker
         asset_type: Optional pre-determined asset type
@@ -0,0 +1,233 @@
+"""
+Streaming CSV Import
+- Reads an upload IMPORT_CHUNK_ROWS rows at a time, so memory stays flat no
+  matter how large the tradebook is
+- Broker tradebooks and CAMS / KFintech statements are recognized from their
+  header and mapped onto the importer's columns (broker_adapters)
+- Each chunk is normalized, deduplicated, priced and bulk-written on its own
+  (csv_ingest + import_dedup + add_transactions_bulk)
+- A checkpoint in file_uploads is committed after every chunk; re-running the
+  same file resumes after the last committed chunk
+- No Streamlit calls: progress goes through a callback, so the same import
+  can run on a worker thread
+"""
+
+from typing import Dict, Any, BinaryIO, Callable, Optional
+
+import pandas as pd
+
+import csv_ingest
+from broker_adapters import sniff
+from import_dedup import row_fingerprints, stream_fingerprint
+from name_resolver import get_name_resolver
+
+IMPORT_CHUNK_ROWS = 5000  # rows per chunk; each chunk is one checkpoint
+MAX_REPORTED_ISSUES = 200  # per-row issues kept for the report (all are counted)
+
+ProgressCallback = Callable[[float, str], None]
+
+
+def _source_size(source: BinaryIO) -> int:
+    position = source.tell()
+    source.seek(0, 2)
+    size = source.tell()
+    source.seek(position)
+    return size
+
+
+def import_csv_stream(
+    db,
+    source: BinaryIO,
+    file_name: str,
+    user_id: str,
+    portfolio_id: str,
+    fetch_price: Callable[[str, str, str], Optional[float]],
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    on_progress: Optional[ProgressCallback] = None,
+    upload_id: Optional[str] = None,
+    batch_fetch: Optional[Callable] = None
+) -> Dict[str, Any]:
+    """
+    Import one transaction CSV chunk by chunk
+
+    Args:
+        db: Database manager
+        source: Seekable binary stream (Streamlit UploadedFile, open file, BytesIO)
+        file_name: Shown in file_uploads and used as the default channel
+        user_id: Owner
+        portfolio_id: Target portfolio
+        fetch_price: (ticker, asset_type, date) -> historical price or None
+        chunk_rows: Rows per chunk
+        on_progress: Called with (fraction of bytes read, message)
+        upload_id: file_uploads row created by the caller (background jobs);
+                   resumed from its checkpoint if it has one
+        batch_fetch: Bulk (ticker, date) price lookup tried before fetch_price
+                     (smart_price_fetch_batch)
+
+    Returns:
+        Dict with success, status ('completed', 'partial', 'already_imported'),
+        format (detected layout), total_rows, imported, duplicates, skipped
+        (no ticker, or not a trade), errors, issues (DataFrame), price_lookups,
+        price_missing, resumed_from_chunk, db_errors
+    """
+    summary = {
+        'success': True, 'status': 'completed', 'format': 'Standard', 'total_rows': 0, 'imported': 0,
+        'duplicates': 0, 'skipped': 0, 'errors': 0, 'price_lookups': 0,
+        'price_missing': 0, 'resumed_from_chunk': 0, 'db_errors': [],
+        'issues': pd.DataFrame(columns=csv_ingest.ERROR_COLUMNS)
+    }
+
+    def progress(fraction: float, message: str):
+        if on_progress:
+            on_progress(min(max(fraction, 0.0), 1.0), message)
+
+    # Fingerprint in blocks; an identical completed import is skipped outright
+    content_hash = stream_fingerprint(source)
+    file_size = _source_size(source)
+
+    previous = db.find_imported_file(user_id, portfolio_id, content_hash)
+    if previous:
+        summary.update({
+            'status': 'already_imported',
+            'previous': previous,
+            'total_rows': previous.get('rows_imported') or 0,
+            'duplicates': previous.get('rows_imported') or 0
+        })
+        if upload_id:
+            db.update_file_upload(upload_id, processing_status='skipped', error_message='Already imported')
+        return summary
+
+    # Resume an unfinished run of the same file (only with the same chunking);
+    # counts in the summary cover this run only
+    start_chunk = 0
+    checkpoint = db.find_resumable_upload(user_id, portfolio_id, content_hash)
+    resumable = (checkpoint and checkpoint.get('chunk_rows') == chunk_rows
+                 and upload_id in (None, checkpoint['id']))
+    if resumable:
+        start_chunk = checkpoint.get('chunks_completed') or 0
+        upload_id = checkpoint['id']
+        db.update_file_upload(upload_id, processing_status='processing')
+    elif upload_id:
+        db.update_file_upload(upload_id, processing_status='processing', chunk_rows=chunk_rows, chunks_completed=0)
+    else:
+        created = db.record_file_upload(user_id, portfolio_id, file_name, file_size, content_hash, 'processing')
+        upload_id = created['upload'].get('id') if created['success'] else None
+        db.update_file_upload(upload_id, chunk_rows=chunk_rows, chunks_completed=0)
+    summary['resumed_from_chunk'] = start_chunk
+
+    default_channel = file_name.replace('.csv', '')
+    resolver = lambda: get_name_resolver(db)
+    occurrences: Dict[str, int] = {}
+    price_cache: Dict[tuple, float] = {}
+    stock_keys = set()
+    holding_keys = []
+    issues = []
+    reported = 0
+    # The checkpoint only moves past chunks that were written without failures,
+    # so a resumed run retries the first failed chunk and everything after it
+    checkpoint_clean = True
+
+    broker_format, preamble_lines = sniff(source)
+    if broker_format:
+        summary['format'] = broker_format.name
+
+    reader = pd.read_csv(source, chunksize=chunk_rows, skiprows=preamble_lines)
+    for chunk_no, chunk in enumerate(reader):
+        chunk = csv_ingest.normalize_columns(chunk)
+        done_fraction = source.tell() / file_size if file_size else 1.0
+        summary['total_rows'] += len(chunk)
+        if broker_format:
+            # Non-trade rows are dropped before hashing, so they never count as new
+            chunk, ignored = broker_format.adapt(chunk)
+            if chunk_no >= start_chunk:
+                summary['skipped'] += ignored
+
+        # Hashes of committed chunks still advance the occurrence counters
+        row_hashes = row_fingerprints(chunk, portfolio_id, occurrences)
+
+        if chunk_no < start_chunk:
+            # Stocks of committed chunks still need their holdings recomputed
+            committed = csv_ingest.ingest_frame(chunk, default_channel, resolver)['batch']
+            stock_keys.update(zip(committed['ticker'], committed['stock_name'], committed['asset_type']))
+            progress(done_fraction, f"Skipping committed chunk {chunk_no + 1}")
+            continue
+
+        try:
+            existing = db.existing_row_hashes(portfolio_id, row_hashes.tolist())
+        except Exception as e:
+            # Without the lookup every row would look new: fail the chunk and
+            # keep the checkpoint before it, so a resumed run retries it
+            summary['errors'] += len(chunk)
+            summary['db_errors'].append(f"Chunk {chunk_no + 1}: duplicate check failed: {e}")
+            checkpoint_clean = False
+            db.update_file_upload(upload_id, rows_processed=summary['total_rows'], rows_imported=summary['imported'])
+            progress(done_fraction, f"Chunk {chunk_no + 1}: duplicate check failed, skipped")
+            continue
+        new_rows = chunk[~row_hashes.isin(existing)]
+        summary['duplicates'] += len(chunk) - len(new_rows)
+
+        ingest = csv_ingest.ingest_frame(new_rows, default_channel, resolver)
+        batch = ingest['batch']
+        summary['skipped'] += ingest['skipped']
+        summary['errors'] += ingest['dropped']
+        if reported < MAX_REPORTED_ISSUES and not ingest['errors'].empty:
+            issues.append(ingest['errors'].head(MAX_REPORTED_ISSUES - reported))
+            reported += len(issues[-1])
+
+        prices = csv_ingest.fill_missing_prices(
+            batch, fetch_price,
+            on_progress=lambda done, total: progress(done_fraction, f"Chunk {chunk_no + 1}: fetching prices {done}/{total}"),
+            cache=price_cache,
+            batch_fetch=batch_fetch
+        )
+        summary['price_lookups'] += prices['requested']
+        summary['price_missing'] += prices['missing']
+
+        records = batch.drop(columns='needs_price').assign(
+            user_id=user_id,
+            portfolio_id=portfolio_id,
+            notes=f"Imported from {file_name}",
+            row_hash=row_hashes.loc[batch.index]
+        ).to_dict('records')
+        written = db.add_transactions_bulk(records, update_holdings=False)
+
+        summary['imported'] += written['inserted']
+        summary['duplicates'] += written['duplicates']
+        summary['errors'] += written['failed']
+        summary['db_errors'].extend(written['errors'][:3])
+        holding_keys.extend(written['holding_keys'])
+
+        checkpoint_clean = checkpoint_clean and written['failed'] == 0 and not written['errors']
+        progress_fields = {'rows_processed': summary['total_rows'], 'rows_imported': summary['imported']}
+        if checkpoint_clean:
+            progress_fields['chunks_completed'] = chunk_no + 1
+        db.update_file_upload(upload_id, **progress_fields)
+        progress(done_fraction, f"Chunk {chunk_no + 1}: {summary['imported']} imported, "
+                                f"{summary['duplicates']} duplicates")
+
+    # Holdings once for every stock in the file, including committed chunks
+    if stock_keys:
+        stock_ids = db.get_or_create_stocks([
+            {'ticker': ticker, 'stock_name': name, 'asset_type': asset_type}
+            for ticker, name, asset_type in stock_keys
+        ])
+        holding_keys.extend((user_id, portfolio_id, sid) for sid in stock_ids.values())
+    if holding_keys:
+        progress(1.0, "Updating holdings...")
+        holdings = db.recompute_holdings(list(dict.fromkeys(holding_keys)))
+        summary['db_errors'].extend(holdings['errors'][:3])
+
+    if summary['errors'] or summary['db_errors']:
+        summary['status'] = 'partial'
+        summary['success'] = False
+    db.update_file_upload(
+        upload_id,
+        processing_status=summary['status'],
+        rows_imported=summary['imported'] + summary['duplicates'],
+        error_message=summary['db_errors'][0][:500] if summary['db_errors'] else None
+    )
+
+    if issues:
+        summary['issues'] = pd.concat(issues, ignore_index=True)
+    progress(1.0, f"{file_name}: {summary['imported']} imported")
+    return summary
@@ -0,0 +1,193 @@
+"""
+Symbol Master
+- One hash index from every known code or alias (NSE symbol, BSE code and
+  security id, ISIN, AMFI scheme code, SEBI registration number) to the
+  canonical (asset_type, provider symbol) of the security
+- Built from exchange / AMFI / SEBI lists dropped into SYMBOL_DIR; nothing is
+  downloaded at runtime, and a missing file just leaves that source out
+- detect_ticker_type and the price fetchers consult it first; their string
+  heuristics only run for symbols it does not know
+- Stored tickers are not rewritten: an alias stays the stock_master ticker
+  and is mapped to the provider symbol only when fetching (resolve_symbol)
+
+Provider symbols: NSE-listed stocks 'RELIANCE.NS', BSE-only stocks
+'500325.BO', mutual funds the AMFI scheme code, PMS/AIF the SEBI
+registration number.
+"""
+
+import logging
+import os
+import threading
+from collections import namedtuple
+from typing import Dict, List, Optional, Iterable, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_DIR = os.environ.get('WMS_SYMBOL_DIR', 'symbol_data')
+
+# Accepted file names per source, as downloaded and as renamed
+NSE_FILES = ('EQUITY_L.csv', 'nse_equity.csv')
+BSE_FILES = ('Equity.csv', 'bse_equity.csv')
+AMFI_FILES = ('NAVAll.txt', 'amfi_schemes.txt')
+SEBI_PMS_FILES = ('sebi_pms.csv',)
+SEBI_AIF_FILES = ('sebi_aif.csv',)
+
+EXCHANGE_SUFFIXES = ('.NS', '.BO')
+
+Symbol = namedtuple('Symbol', ['asset_type', 'symbol', 'name', 'isin'])
+
+
+def _key(code) -> str:
+    return str(code).strip().upper()
+
+
+class SymbolMaster:
+    """Alias -> Symbol index; first source to claim an alias keeps it (NSE, BSE, AMFI, SEBI)"""
+
+    def __init__(self):
+        self._index: Dict[str, Symbol] = {}
+        self._nse_by_isin: Dict[str, Symbol] = {}  # joins BSE codes to NSE listings
+        self.counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def add(self, entry: Symbol, aliases: Iterable) -> None:
+        for alias in aliases:
+            if alias is None or (isinstance(alias, float) and pd.isna(alias)):
+                continue
+            key = _key(alias)
+            if key and key not in ('-', 'NAN'):
+                self._index.setdefault(key, entry)
+
+    def lookup(self, ticker) -> Optional[Symbol]:
+        """
+        Symbol for any known code or alias (case-insensitive), else None
+
+        A stored ticker may carry an exchange suffix normalize_ticker added to
+        an alias (INE002A01018.NS); the bare code is tried when the full one
+        is not known.
+        """
+        if ticker is None:
+            return None
+        key = _key(ticker)
+        known = self._index.get(key)
+        if known is None and key.endswith(EXCHANGE_SUFFIXES):
+            known = self._index.get(key[:-3])
+        return known
+
+    def entries(self) -> List[Symbol]:
+        """Every distinct security (each appears once however many aliases it has)"""
+        return list(dict.fromkeys(self._index.values()))
+
+    # ========================================================================
+    # LOADERS
+    # ========================================================================
+
+    @classmethod
+    def load(cls, directory: str = SYMBOL_DIR) -> 'SymbolMaster':
+        """Build from whatever source files exist in directory"""
+        master = cls()
+        loaders = [
+            ('nse', NSE_FILES, master._load_nse),
+            ('bse', BSE_FILES, master._load_bse),
+            ('amfi', AMFI_FILES, master._load_amfi),
+            ('pms', SEBI_PMS_FILES, lambda path: master._load_sebi(path, 'pms')),
+            ('aif', SEBI_AIF_FILES, lambda path: master._load_sebi(path, 'aif')),
+        ]
+        for source, names, loader in loaders:
+            path = next((os.path.join(directory, n) for n in names if os.path.exists(os.path.join(directory, n))), None)
+            if not path:
+                continue
+            before = len(master)
+            try:
+                loader(path)
+            except Exception as e:
+                logger.warning("Symbol master: could not load %s: %s", path, e)
+            master.counts[source] = len(master) - before
+        return master
+
+    @staticmethod
+    def _read_csv(path: str) -> pd.DataFrame:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        df.columns = pd.Index(df.columns).str.strip().str.upper()
+        return df.apply(lambda column: column.str.strip())
+
+    def _load_nse(self, path: str) -> None:
+        """NSE EQUITY_L.csv: SYMBOL, NAME OF COMPANY, ISIN NUMBER"""
+        df = self._read_csv(path)
+        for symbol, name, isin in zip(df['SYMBOL'], df['NAME OF COMPANY'], df['ISIN NUMBER']):
+            entry = Symbol('stock', f"{_key(symbol)}.NS", name, isin)
+            self.add(entry, (symbol, entry.symbol, isin))
+            self._nse_by_isin[_key(isin)] = entry
+
+    def _load_bse(self, path: str) -> None:
+        """BSE Equity.csv: Security Code, Security Id, Security Name, ISIN No"""
+        df = self._read_csv(path)
+        isin_column = 'ISIN NO' if 'ISIN NO' in df.columns else 'ISIN'
+        for code, security_id, name, isin in zip(df['SECURITY CODE'], df['SECURITY ID'],
+                                                 df['SECURITY NAME'], df[isin_column]):
+            # Dual-listed stocks resolve to their NSE symbol
+            entry = self._nse_by_isin.get(_key(isin)) or Symbol('stock', f"{_key(code)}.BO", name, isin)
+            self.add(entry, (code, f"{_key(code)}.BO", security_id, f"{_key(security_id)}.BO", isin))
+
+    def _load_amfi(self, path: str) -> None:
+        """
+        AMFI NAVAll.txt: 'Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div
+        Reinvestment;Scheme Name;Net Asset Value;Date' rows between fund-house
+        heading lines
+        """
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                parts = line.strip().split(';')
+                if len(parts) < 4 or not parts[0].strip().isdigit():
+                    continue
+                code, isin_growth, isin_reinvest, name = (p.strip() for p in parts[:4])
+                entry = Symbol('mutual_fund', code, name, isin_growth if isin_growth not in ('', '-') else None)
+                self.add(entry, (code, isin_growth, isin_reinvest))
+
+    def _load_sebi(self, path: str, asset_type: str) -> None:
+        """SEBI intermediary list: a name column and a registration number column"""
+        df = self._read_csv(path)
+        reg_column = next(c for c in df.columns if 'REGISTRATION' in c)
+        name_column = next((c for c in df.columns if 'NAME' in c), reg_column)
+        for reg_no, name in zip(df[reg_column], df[name_column]):
+            entry = Symbol(asset_type, _key(reg_no), name, None)
+            self.add(entry, (reg_no,))
+
+
+_master: Optional[SymbolMaster] = None
+_master_lock = threading.Lock()
+
+
+def get_symbol_master() -> SymbolMaster:
+    """Process-wide master, built on first use (safe from worker threads)"""
+    global _master
+    if _master is None:
+        with _master_lock:
+            if _master is None:
+                _master = SymbolMaster.load()
+    return _master
+
+
+def lookup_symbol(ticker) -> Optional[Symbol]:
+    return get_symbol_master().lookup(ticker)
+
+
+def resolve_symbol(ticker: str, asset_type: str) -> Tuple[str, str, bool]:
+    """
+    Provider symbol and asset type a fetcher should use
+
+    Only stock / mutual fund routing is corrected; PMS, AIF and bonds keep
+    the caller's ticker and type.
+
+    Returns:
+        (symbol, asset_type, listed); listed means the master knows the
+        security, so "maybe it is misclassified" fallbacks can be skipped
+    """
+    known = lookup_symbol(ticker)
+    if not known or {known.asset_type, asset_type} - {'stock', 'mutual_fund'}:
+        return ticker, asset_type, False
+    return known.symbol, known.asset_type, True
@@ -21,12 +21,23 @@ from typing import Dict, List, Any, Optional
 warnings.filterwarnings('ignore')
 
 # Performance optimization decorators
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_cached_holdings(user_id: str):
-    """Cache holdings data to avoid repeated database calls"""
-    from database_shared import SharedDatabaseManager
-    db = SharedDatabaseManager()
-    return db.get_user_holdings_silent(user_id)
+@st.cache_data(max_entries=200, show_spinner=False)
+def get_cached_holdings(user_id: str, data_version: str):
+    """
+    Cache holdings data to avoid repeated database calls
+    
+    Keyed on the user's data version (db.get_data_version), so writes show up
+    on the next rerun and unchanged holdings are never refetched.
+    """
+    from database_shared import get_shared_db
+    return get_shared_db().get_user_holdings_silent(user_id)
+
+@st.cache_data(max_entries=50, show_spinner=False)
+def get_cached_value_history(user_id: str, data_version: str, weeks: int = 52):
+    """Weekly invested vs market value from the transaction ledger"""
+    from database_shared import get_shared_db
+    end = datetime.now().date()
+    return get_shared_db().ledger.value_history(user_id, end - timedelta(weeks=weeks), end)
 
 @st.cache_data(ttl=600)  # Cache for 10 minutes
 def get_cached_portfolio_summary(holdings: List[Dict]) -> str:
@@ -70,11 +81,15 @@ def get_cached_portfolio_summary(holdings: List[Dict]) -> str:
     return portfolio_summary
 
 # Import modules
-from database_shared import SharedDatabaseManager
+from database_shared import get_shared_db
+from query_tracer import start_trace, end_trace, query_panel_enabled, render_query_panel
 from enhanced_price_fetcher import EnhancedPriceFetcher
 from bulk_ai_fetcher import BulkAIFetcher
 from weekly_manager_streamlined import StreamlinedWeeklyManager
-from smart_ticker_detector import detect_ticker_type, normalize_ticker
+from pms_aif_calculator import get_pms_aif_calculator
+from smart_ticker_detector import smart_price_fetch_batch
+from streaming_import import import_csv_stream
+from import_jobs import get_import_jobs
 
 # Page configuration
 st.set_page_config(
@@ -106,7 +121,7 @@ st.markdown("""
 if 'user' not in st.session_state:
     st.session_state.user = None
 if 'db' not in st.session_state:
-    st.session_state.db = SharedDatabaseManager()
+    st.session_state.db = get_shared_db()
 if 'price_fetcher' not in st.session_state:
     st.session_state.price_fetcher = EnhancedPriceFetcher()
 if 'bulk_ai_fetcher' not in st.session_state:
@@ -207,133 +222,48 @@ def process_uploaded_files(uploaded_files, user_id, portfolio_id):
         st.caption(f"📁 [{file_idx}/{len(uploaded_files)}] Processing {uploaded_file.name}...")
         
         try:
-            # Read CSV
-            df = pd.read_csv(uploaded_file)
-            st.caption(f"   📊 Found {len(df)} rows in {uploaded_file.name}")
-            
-            imported = 0
-            skipped = 0
-            errors = 0
-            
-            # Progress bar for large files
-            if len(df) > 10:
-                progress_bar = st.progress(0)
-                progress_text = st.empty()
-            
-            for idx, row in df.iterrows():
-                try:
-                    # Detect ticker type
-                    ticker = str(row.get('ticker', '')).strip()
-                    if not ticker:
-                        skipped += 1
-                        continue
-                    
-                    # Log ticker detection
-                    asset_type = detect_ticker_type(ticker)
-                    normalized_ticker = normalize_ticker(ticker, asset_type)
-                    st.caption(f"   🔍 Row {idx+1}: {ticker} → {normalized_ticker} ({asset_type})")
-                    
-                    # Parse date
-                    try:
-                        trans_date = pd.to_datetime(row['date']).strftime('%Y-%m-%d')
-                        st.caption(f"   📅 Date: {trans_date}")
-                    except Exception as date_error:
-                        trans_date = datetime.now().strftime('%Y-%m-%d')
-                        st.caption(f"   ⚠️ Date parsing failed, using today: {trans_date}")
-                    
-                    # Get price - if not provided, fetch historical price for that date
-                    price = row.get('price', 0)
-                    if pd.isna(price) or price == '' or price == 0:
-                        st.caption(f"   💰 Price: Not provided, fetching historical price for {trans_date}...")
-                        
-                        # Fetch historical price for the transaction date
-                        try:
-                            historical_price = price_fetcher.get_historical_price(
-                                normalized_ticker, 
-                                asset_type, 
-                                trans_date
-                            )
-                            if historical_price and historical_price > 0:
-                                price = historical_price
-                                st.caption(f"   ✅ Historical price: ₹{price:,.2f}")
-                            else:
-                                price = 0
-                                st.caption(f"   ⚠️ Could not fetch historical price (using 0)")
-                        except Exception as e:
-                            price = 0
-                            st.caption(f"   ❌ Error fetching price: {str(e)[:50]}")
-                    else:
-                        price = float(price)
-                        st.caption(f"   💰 Price: ₹{price:,.2f}")
-                    
-                    # Determine channel: check CSV column first, then use filename
-                    channel = None
-                    if 'channel' in row and pd.notna(row['channel']) and str(row['channel']).strip():
-                        channel = str(row['channel']).strip()
-                    else:
-                        channel = uploaded_file.name.replace('.csv', '')
-                    
-                    # Create transaction (week tracking auto-calculated in database_shared.py)
-                    transaction_data = {
-                        'user_id': user_id,
-                        'portfolio_id': portfolio_id,
-                        'ticker': normalized_ticker,
-                        'stock_name': row.get('stock_name', ticker),
-                        'asset_type': asset_type,
-                        'sector': row.get('sector', 'Unknown'),
-                        'transaction_type': 'buy' if 'buy' in str(row['transaction_type']).lower() else 'sell',
-                        'quantity': float(row['quantity']),
-                        'price': price,
-                        'transaction_date': trans_date,
-                        'channel': channel,  # Channel from CSV column or filename
-                        'notes': f"Imported from {uploaded_file.name}"
-                    }
-                    
-                    st.caption(f"   💾 Saving transaction to database...")
-                    result = db.add_transaction(transaction_data)
-                    
-                    if result['success']:
-                        imported += 1
-                        st.caption(f"   ✅ Transaction saved successfully")
-                        
-                        # Log week calculation
-                        if 'week_label' in result.get('transaction', {}):
-                            week_label = result['transaction']['week_label']
-                            st.caption(f"   📅 Week calculated: {week_label}")
-                        else:
-                            st.caption(f"   ⚠️ Week calculation may have failed")
-                    else:
-                        errors += 1
-                        st.caption(f"   ❌ Database error: {result.get('error', 'Unknown error')}")
-                
-                except Exception as e:
-                    errors += 1
-                    st.caption(f"   ❌ Error in row {idx+1}: {str(e)}")
-                
-                # Update progress bar
-                if len(df) > 10:
-                    progress = (idx + 1) / len(df)
-                    progress_bar.progress(progress)
-                    progress_text.text(f"Processing row {idx+1}/{len(df)}")
-            
-            # Clear progress bar
-            if len(df) > 10:
-                progress_bar.empty()
-                progress_text.empty()
-            
-            total_imported += imported
+            progress_bar = st.progress(0.0, text=f"{uploaded_file.name}: reading...")
+            
+            # Chunked: hash, dedupe, price and bulk-write IMPORT_CHUNK_ROWS rows at a time,
+            # with a resumable checkpoint after every chunk
+            result = import_csv_stream(
+                db, uploaded_file, uploaded_file.name, user_id, portfolio_id,
+                fetch_price=lambda ticker, asset_type, date: price_fetcher.get_historical_price(ticker, asset_type, date),
+                on_progress=lambda fraction, message: progress_bar.progress(fraction, text=message),
+                batch_fetch=smart_price_fetch_batch
+            )
+            progress_bar.empty()
+            
+            if result['status'] == 'already_imported':
+                previous = result['previous']
+                st.caption(f"   ⏭️ Already imported on {str(previous.get('upload_date', ''))[:10]} "
+                           f"as {previous['file_name']} - skipping")
+            if result.get('format', 'Standard') != 'Standard':
+                st.caption(f"   🏦 Read as {result['format']}")
+            if result['resumed_from_chunk']:
+                st.caption(f"   ↪️ Resumed after {result['resumed_from_chunk']} committed chunk(s)")
+            if result['price_missing']:
+                st.caption(f"   ⚠️ No historical price for {result['price_missing']} of {result['price_lookups']} ticker/date lookups (saved with price 0)")
+            if result['db_errors']:
+                st.caption(f"   ❌ Database error: {result['db_errors'][0][:120]}")
+            if not result['issues'].empty:
+                with st.expander(f"⚠️ Row issues in {uploaded_file.name} (first {len(result['issues'])})"):
+                    st.dataframe(result['issues'], hide_index=True, use_container_width=True)
+            
+            total_imported += result['imported']
             
             # File summary
             file_summary = {
                 'file': uploaded_file.name,
-                'total_rows': len(df),
-                'imported': imported,
-                'skipped': skipped,
-                'errors': errors
+                'total_rows': result['total_rows'],
+                'imported': result['imported'],
+                'skipped': result['skipped'],
+                'duplicates': result['duplicates'],
+                'errors': result['errors']
             }
             processing_log.append(file_summary)
             
-            st.caption(f"✅ {uploaded_file.name}: {imported}/{len(df)} transactions imported ({skipped} skipped, {errors} errors)")
+            st.caption(f"✅ {uploaded_file.name}: {result['imported']}/{result['total_rows']} transactions imported ({result['skipped']} skipped, {result['duplicates']} duplicates, {result['errors']} errors)")
         
         except Exception as e:
             st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
@@ -342,6 +272,12 @@ def process_uploaded_files(uploaded_files, user_id, portfolio_id):
                 'error': str(e)
             })
     
+    # Holdings recomputes were queued per stock during the import; apply them
+    # before anything below reads holdings back
+    flush_result = db.flush_pending_writes()
+    if flush_result['errors']:
+        st.caption(f"⚠️ Some holdings updates are still queued and will retry: {flush_result['errors'][0][:80]}")
+
     # Final summary
     st.success(f"🎉 Processing Complete!")
     st.info(f"📊 **Final Summary:**")
@@ -354,7 +290,7 @@ def process_uploaded_files(uploaded_files, user_id, portfolio_id):
             if 'error' in log:
                 st.error(f"❌ {log['file']}: {log['error']}")
             else:
-                st.success(f"✅ {log['file']}: {log['imported']}/{log['total_rows']} imported ({log['skipped']} skipped, {log['errors']} errors)")
+                st.success(f"✅ {log['file']}: {log['imported']}/{log['total_rows']} imported ({log['skipped']} skipped, {log.get('duplicates', 0)} duplicates, {log['errors']} errors)")
     
     if total_imported > 0:
         st.info("🔄 Next: Fetching missing weekly prices for your holdings...")
@@ -535,7 +471,7 @@ def main_dashboard():
             st.session_state.pdf_context = db.get_all_pdfs_text(user['id'])
         
         # Get portfolio context (cached)
-        holdings = get_cached_holdings(user['id'])
+        holdings = get_cached_holdings(user['id'], db.get_data_version(user['id']))
         
         # Get cached portfolio summary
         portfolio_summary = get_cached_portfolio_summary(holdings)
@@ -674,7 +610,7 @@ def main_dashboard():
                                 st.info(pdf['ai_summary'])
                     with col2:
                         if st.button("🗑️", key=f"del_{pdf['id']}", help="Delete this PDF"):
-                            if db.delete_pdf(pdf['id']):
+                            if db.delete_pdf(pdf['id'], user_id=user['id']):
                                 st.success("Deleted!")
                                 st.session_state.pdf_context = db.get_all_pdfs_text(user['id'])
                                 st.rerun()
@@ -803,9 +739,10 @@ def main_dashboard():
     elif page == "📁 Upload More Files":
         upload_files_page()
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_portfolio_metrics(holdings: List[Dict]) -> Dict[str, Any]:
-    """Cache expensive portfolio calculations"""
+@st.cache_data(max_entries=200, show_spinner=False)
+def get_portfolio_metrics(user_id: str, data_version: str, _holdings: List[Dict]) -> Dict[str, Any]:
+    """Cache expensive portfolio calculations (keyed on user and data version, not the holdings list)"""
+    holdings = _holdings
     if not holdings:
         return {}
     
@@ -861,11 +798,12 @@ def portfolio_overview_page():
     
     user = st.session_state.user
     
-    # Use cached holdings data
-    holdings = get_cached_holdings(user['id'])
+    # Use cached holdings data (one version check instead of a refetch)
+    data_version = db.get_data_version(user['id'])
+    holdings = get_cached_holdings(user['id'], data_version)
     
     # Get cached metrics
-    metrics = get_portfolio_metrics(holdings)
+    metrics = get_portfolio_metrics(user['id'], data_version, holdings)
     
     if not holdings:
         st.info("No holdings found. Upload transaction files to see your portfolio.")
@@ -1622,6 +1560,19 @@ def charts_page():
             df_display['P&L'] = df_display['P&L'].apply(lambda x: f"₹{x:,.0f}")
             df_display['P&L %'] = df_display['P&L %'].apply(lambda x: f"{x:+.1f}%")
             st.dataframe(df_display, use_container_width=True)
+        
+        # Portfolio value over time (point-in-time holdings from the ledger)
+        st.subheader("📈 Portfolio Value Over Time")
+        value_history = get_cached_value_history(user['id'], db.get_data_version(user['id']))
+        if value_history:
+            df_history = pd.DataFrame(value_history)
+            fig_history = go.Figure()
+            fig_history.add_trace(go.Scatter(x=df_history['date'], y=df_history['value'], name='Market Value', mode='lines'))
+            fig_history.add_trace(go.Scatter(x=df_history['date'], y=df_history['invested'], name='Invested', mode='lines', line=dict(dash='dash')))
+            fig_history.update_layout(title="Weekly Portfolio Value (52 weeks)", xaxis_title="Week", yaxis_title="Value (₹)", height=400)
+            st.plotly_chart(fig_history, use_container_width=True)
+        else:
+            st.caption("No weekly history yet")
     
     with tab3:
         st.subheader("📅 52-Week NAVs")
@@ -1633,8 +1584,14 @@ def charts_page():
         selected_ticker_nav = st.selectbox("Select Ticker for NAV History", ticker_options, key="nav_ticker")
         
         if selected_ticker_nav:
-            stock_id = next(h['stock_id'] for h in holdings if h['ticker'] == selected_ticker_nav)
+            holding = next(h for h in holdings if h['ticker'] == selected_ticker_nav)
+            stock_id = holding['stock_id']
             prices = db.get_historical_prices_for_stock_silent(stock_id)
+            if holding.get('asset_type') in ['pms', 'aif']:
+                # Stored rows are the scheme index; show the NAV of this user's lots
+                prices = get_pms_aif_calculator().apply_lots(
+                    db.get_user_transactions(user['id']), {stock_id: prices}
+                )[stock_id]
             
             if prices:
                 df_navs = pd.DataFrame(prices)
@@ -2997,6 +2954,81 @@ def charts_page():
             else:
                 st.info("No holdings match the selected filters")
 
+IMPORT_POLL_SECONDS = 2
+IMPORT_STATUS_ICONS = {
+    'queued': '🕒', 'processing': '⏳', 'completed': '✅', 'partial': '⚠️',
+    'failed': '❌', 'interrupted': '⏸️', 'skipped': '⏭️'
+}
+
+
+def _import_jobs_panel(user_id):
+    """Recent imports with live progress (re-run every IMPORT_POLL_SECONDS while jobs are active)"""
+    jobs = get_import_jobs()
+    uploads = jobs.jobs(user_id, limit=10)
+    if not uploads:
+        return
+    
+    st.markdown("### 📥 Imports")
+    for upload in uploads:
+        status = upload.get('processing_status') or 'pending'
+        icon = IMPORT_STATUS_ICONS.get(status, '•')
+        rows = upload.get('rows_processed') or 0
+        label = f"{icon} **{upload['file_name']}** - {status} ({rows:,} rows read)"
+        
+        if 'fraction' in upload and status in ('queued', 'processing'):
+            st.progress(upload['fraction'], text=f"{upload['file_name']}: {upload['message']}")
+        else:
+            st.caption(label)
+        
+        result = upload.get('result')
+        if result and result.get('format', 'Standard') != 'Standard':
+            st.caption(f"   🏦 Read as {result['format']}")
+        if status == 'interrupted':
+            st.caption("   ↪️ Upload the same file again to resume from its last committed chunk")
+        elif result and result.get('db_errors'):
+            st.caption(f"   ❌ {result['db_errors'][0][:120]}")
+        elif upload.get('error_message') and status in ('failed', 'partial'):
+            st.caption(f"   ❌ {upload['error_message'][:120]}")
+        if result is not None and not result.get('issues', pd.DataFrame()).empty:
+            with st.expander(f"⚠️ Row issues in {upload['file_name']} (first {len(result['issues'])})"):
+                st.dataframe(result['issues'], hide_index=True, use_container_width=True)
+    
+    # Weekly prices once this session's imports have finished
+    if st.session_state.get('fetch_weekly_after_import') and not jobs.has_active_jobs(user_id):
+        if st.button("📅 Fetch Missing Weekly Prices", key="import_jobs_fetch_weekly"):
+            st.session_state.fetch_weekly_after_import = False
+            with st.spinner("Fetching missing weekly prices..."):
+                result = weekly_manager.fetch_missing_weeks_till_current(user_id)
+            if result['success']:
+                st.success(f"✅ Fetched {result.get('fetched', 0)} missing week prices!")
+            else:
+                st.error(f"❌ {result.get('error', 'Unknown error')}")
+
+
+def _poll_import_jobs_panel(user_id):
+    """Live panel; one full rerun when the last job finishes swaps in the static panel"""
+    _import_jobs_panel(user_id)
+    if not get_import_jobs().has_active_jobs(user_id):
+        st.rerun()
+
+
+# Poll job progress without re-running the whole page, and only while this
+# process is running jobs for the user (older Streamlit: manual refresh)
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+_live_import_jobs_panel = _fragment(run_every=IMPORT_POLL_SECONDS)(_poll_import_jobs_panel) if _fragment else None
+
+
+def import_jobs_panel(user_id):
+    # has_active_jobs is an in-memory check: idle pages make no queries
+    if not get_import_jobs().has_active_jobs(user_id):
+        _import_jobs_panel(user_id)
+    elif _live_import_jobs_panel is not None:
+        _live_import_jobs_panel(user_id)
+    else:
+        _import_jobs_panel(user_id)
+        st.button("🔄 Refresh import status", key="import_jobs_refresh")
+
+
 def upload_files_page():
     """Enhanced upload more files page"""
     st.header("📁 Upload More Files")
@@ -3109,27 +3141,27 @@ def upload_files_page():
         
         with col2:
             if st.button("🚀 Process Files", type="primary", use_container_width=True):
-                st.info(f"🚀 Processing {len(uploaded_files)} file(s) for portfolio: {portfolio['portfolio_name']}")
-                
-                # Show progress
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                try:
-                    process_uploaded_files(uploaded_files, user['id'], portfolio['id'])
-                    progress_bar.progress(1.0)
-                    status_text.success("✅ All files processed successfully!")
-                    st.balloons()
-                    time.sleep(2)
-                    st.rerun()
-                except Exception as e:
-                    progress_bar.progress(0)
-                    status_text.error(f"❌ Error processing files: {str(e)}")
+                # Imports run on background workers; progress is shown below
+                jobs = get_import_jobs()
+                for uploaded_file in uploaded_files:
+                    queued = jobs.submit(uploaded_file, uploaded_file.name, user['id'], portfolio['id'],
+                                         fetch_prices=auto_fetch_prices)
+                    if not queued['success']:
+                        st.error(f"❌ {uploaded_file.name}: {queued['error']}")
+                    elif queued['status'] == 'already_imported':
+                        st.caption(f"⏭️ {uploaded_file.name}: already imported - skipping")
+                    elif queued['status'] == 'running':
+                        st.caption(f"⏳ {uploaded_file.name}: already importing")
+                    else:
+                        st.caption(f"📥 {uploaded_file.name}: queued")
+                st.session_state.fetch_weekly_after_import = fetch_weekly_prices
         
         with col3:
             if st.button("🗑️ Clear Files", use_container_width=True):
                 st.session_state.upload_files_main = []
-        st.rerun()
+                st.rerun()
+    
+    import_jobs_panel(user['id'])
     
     # Show transactions with week info
     st.subheader("📊 Your Transactions (with Week Info)")
@@ -3233,10 +3265,17 @@ def upload_files_page():
 
 def main():
     """Main app function"""
-    if st.session_state.user is None:
-        login_page()
-    else:
-        main_dashboard()
+    # Collect every database query made during this rerun
+    start_trace()
+    try:
+        if st.session_state.user is None:
+            login_page()
+        else:
+            main_dashboard()
+    finally:
+        trace = end_trace()
+        if query_panel_enabled():
+            render_query_panel(trace)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+"""
+ISO Week Calendar
+- Week key: int32 yyyyww (202405 = ISO week 5 of 2024); keys sort chronologically
+- Precomputed tables: every day in CALENDAR_START..CALENDAR_END -> week key,
+  and every week key -> its ISO Monday
+- Vectorized conversions over arrays, so week joins and missing-week sets are
+  integer operations instead of per-row isocalendar() calls
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+CALENDAR_START = date(1990, 1, 1)  # a Monday, so day offsets line up with weeks
+CALENDAR_END = date(2045, 12, 31)
+
+DateLike = Union[date, datetime, str, pd.Timestamp, np.datetime64]
+
+
+def _build_tables() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    days = pd.date_range(CALENDAR_START, CALENDAR_END, freq='D')
+    iso = days.isocalendar()
+    day_keys = (iso['year'].to_numpy(np.int32) * 100 + iso['week'].to_numpy(np.int32)).astype(np.int32)
+
+    is_monday = iso['day'].to_numpy() == 1
+    week_keys = day_keys[is_monday]
+    week_mondays = days[is_monday].to_numpy().astype('datetime64[D]')
+    return day_keys, week_keys, week_mondays
+
+
+# DAY_KEYS[i] is the week key of CALENDAR_START + i days;
+# WEEK_KEYS / WEEK_MONDAYS are aligned and sorted
+DAY_KEYS, WEEK_KEYS, WEEK_MONDAYS = _build_tables()
+_START = np.datetime64(CALENDAR_START, 'D')
+
+
+# ============================================================================
+# SCALAR HELPERS
+# ============================================================================
+
+def week_key(year: int, week: int) -> int:
+    """(ISO year, ISO week) -> yyyyww"""
+    return int(year) * 100 + int(week)
+
+
+def split_week_key(key: int) -> Tuple[int, int]:
+    """yyyyww -> (ISO year, ISO week)"""
+    return int(key) // 100, int(key) % 100
+
+
+def week_label(key: int) -> str:
+    """Display label used on transactions, e.g. 'Wk5 2024'"""
+    year, week = split_week_key(key)
+    return f"Wk{week} {year}"
+
+
+def date_to_week_key(value: DateLike) -> int:
+    """ISO week key of one date"""
+    return int(dates_to_week_keys([value])[0])
+
+
+def week_key_to_monday(key: int) -> date:
+    """ISO Monday of one week key"""
+    return pd.Timestamp(week_keys_to_mondays([key])[0]).date()
+
+
+# ============================================================================
+# VECTORIZED CONVERSIONS
+# ============================================================================
+
+def dates_to_week_keys(values) -> np.ndarray:
+    """
+    ISO week keys for many dates
+
+    Args:
+        values: Anything pandas can turn into datetimes (list, Series, DatetimeIndex, array)
+
+    Returns:
+        int32 array of yyyyww keys
+    """
+    days = pd.to_datetime(pd.Series(values) if not isinstance(values, pd.Series) else values)
+    if getattr(days.dt, 'tz', None) is not None:
+        days = days.dt.tz_localize(None)
+    day_numbers = days.to_numpy().astype('datetime64[D]')
+    offsets = (day_numbers - _START).astype(np.int64)
+
+    in_range = (offsets >= 0) & (offsets < len(DAY_KEYS))
+    keys = np.empty(len(offsets), dtype=np.int32)
+    keys[in_range] = DAY_KEYS[offsets[in_range]]
+
+    if not in_range.all():
+        # Outside the precomputed table - fall back to pandas for those rows
+        iso = days[~in_range].dt.isocalendar()
+        keys[~in_range] = iso['year'].to_numpy(np.int32) * 100 + iso['week'].to_numpy(np.int32)
+    return keys
+
+
+def week_keys_to_mondays(keys) -> np.ndarray:
+    """
+    ISO Mondays for many week keys
+
+    Returns:
+        datetime64[D] array
+
+    Raises:
+        ValueError: for keys that are not valid ISO weeks inside the calendar
+    """
+    keys = np.asarray(keys, dtype=np.int32)
+    idx = np.searchsorted(WEEK_KEYS, keys)
+    idx_clipped = np.minimum(idx, len(WEEK_KEYS) - 1)
+    valid = WEEK_KEYS[idx_clipped] == keys
+    if not valid.all():
+        raise ValueError(f"Not ISO week keys in the calendar: {keys[~valid][:5].tolist()}")
+    return WEEK_MONDAYS[idx_clipped]
+
+
+def year_week_to_keys(years, weeks) -> np.ndarray:
+    """Combine ISO year and week columns into keys"""
+    return (np.asarray(years, dtype=np.int32) * 100 + np.asarray(weeks, dtype=np.int32)).astype(np.int32)
+
+
+def keys_to_year_week(keys) -> Tuple[np.ndarray, np.ndarray]:
+    """Split keys into ISO year and week arrays"""
+    keys = np.asarray(keys, dtype=np.int32)
+    return keys // 100, keys % 100
+
+
+# ============================================================================
+# RANGES
+# ============================================================================
+
+def week_keys_between(start: DateLike, end: DateLike) -> np.ndarray:
+    """Every week key from the week containing start through the week containing end"""
+    first, last = dates_to_week_keys([start, end])
+    return WEEK_KEYS[np.searchsorted(WEEK_KEYS, first):np.searchsorted(WEEK_KEYS, last, side='right')]
+
+
+def last_n_week_keys(n: int, today: DateLike = None) -> np.ndarray:
+    """The current week and the n weeks before it (n + 1 keys, like a 52-week lookback)"""
+    today = pd.Timestamp(today or date.today())
+    return week_keys_between(today - timedelta(weeks=n), today)
+
+
+def add_weeks(key: int, n: int) -> int:
+    """Week key n weeks after (or before, for negative n) key"""
+    monday = week_keys_to_mondays([key])[0] + np.timedelta64(7 * n, 'D')
+    return int(dates_to_week_keys([monday])[0])
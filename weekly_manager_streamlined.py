@@ -13,6 +13,9 @@ from typing import List, Dict, Any, Optional
 from database_shared import SharedDatabaseManager
 from enhanced_price_fetcher import EnhancedPriceFetcher
 from bulk_ai_fetcher import BulkAIFetcher
+import week_calendar as wc
+from symbol_master import resolve_symbol
+from pms_aif_calculator import CAGR_INDEX_SOURCE, get_pms_aif_calculator
 
 class StreamlinedWeeklyManager:
     """
@@ -29,42 +32,32 @@ class StreamlinedWeeklyManager:
     
     def fetch_missing_weeks_till_current(self, user_id: str) -> Dict[str, Any]:
         """
-        Fetch missing weeks till current week - OPTIMIZED YEARLY BULK FETCH
-        Fetches entire year of data in ONE API call per ticker
+        Fetch missing weeks till current week - GAP RANGE FETCH
+        Plans the missing weeks of every holding as coalesced ranges and
+        fetches each gap with ONE API call, skipping weeks already stored
         """
         try:
-            from datetime import datetime, timedelta
-            from fetch_yearly_bulk import fetch_yearly_prices_for_all_tickers, save_yearly_prices_to_db
+            from fetch_yearly_bulk import fetch_prices_for_plan, fetch_pms_aif_prices_for_plan, save_yearly_prices_to_db
             
-            st.caption("🔍 Analyzing user holdings and transaction weeks...")
-            
-            # Get user holdings first
-            holdings = self.db.get_user_holdings(user_id)
-            if not holdings:
-                st.caption("ℹ️ No holdings found - nothing to fetch")
-                return {'success': True, 'message': 'No holdings found', 'fetched': 0}
+            st.caption("🔍 Planning missing weekly prices...")
             
-            # Show unique tickers being analyzed
-            unique_tickers = list(set([h['ticker'] for h in holdings]))
-            st.caption(f"📊 Found {len(holdings)} holdings ({len(unique_tickers)} unique tickers)")
-            st.caption(f"🎯 Tickers: {', '.join(unique_tickers[:10])}{'...' if len(unique_tickers) > 10 else ''}")
+            with st.spinner("Analyzing transaction weeks..."):
+                plan = self.db.plan_missing_week_fetches(user_id)
             
-            # Get unique holdings (deduplicate by ticker)
-            unique_holdings = {}
-            for h in holdings:
-                if h['ticker'] not in unique_holdings:
-                    unique_holdings[h['ticker']] = h
-            unique_holdings_list = list(unique_holdings.values())
+            if not plan:
+                st.caption("✅ All weeks up-to-date - no missing prices found")
+                return {'success': True, 'message': 'All weeks up-to-date', 'fetched': 0}
             
-            # Calculate date range: Last 52 weeks
-            current_date = datetime.now()
-            start_date = current_date - timedelta(weeks=52)
+            unique_tickers = sorted({task['ticker'] for task in plan})
+            st.caption(f"🎯 Tickers: {', '.join(unique_tickers[:10])}{'...' if len(unique_tickers) > 10 else ''}")
             
-            st.caption(f"📅 Fetching last 52 weeks: {start_date.strftime('%Y-%m-%d')} to {current_date.strftime('%Y-%m-%d')}")
+            # OPTIMIZED: One range request per gap instead of 52 weeks per holding
+            st.subheader(f"⚡ Gap Fetch ({len(plan)} range request(s))")
+            all_prices = fetch_prices_for_plan(plan)
             
-            # OPTIMIZED: Fetch entire year for all holdings at once
-            st.subheader("⚡ Bulk Yearly Fetch (1 API call per holding)")
-            all_prices = fetch_yearly_prices_for_all_tickers(unique_holdings_list, start_date, current_date)
+            # PMS/AIF: the shared scheme index, one vectorised CAGR pass
+            for ticker, weekly_prices in fetch_pms_aif_prices_for_plan(plan).items():
+                all_prices.setdefault(ticker, {}).update(weekly_prices)
             
             # Save to database
             if all_prices:
@@ -127,13 +120,14 @@ class StreamlinedWeeklyManager:
             st.caption(f"🎯 Unique tickers: {len(unique_tickers)} ({', '.join(unique_tickers[:3])}{'...' if len(unique_tickers) > 3 else ''})")
             st.caption(f"📅 Unique weeks: {len(unique_weeks)} ({', '.join(unique_weeks[:3])}{'...' if len(unique_weeks) > 3 else ''})")
             
-            # Group by week for bulk fetching
+            # Group by integer week key for bulk fetching (chronological order)
             week_groups = {}
             for missing in missing_weeks:
-                week_key = f"{missing['year']}-W{missing['week']:02d}"
-                if week_key not in week_groups:
-                    week_groups[week_key] = []
-                week_groups[week_key].append(missing)
+                week_groups.setdefault(wc.week_key(missing['year'], missing['week']), []).append(missing)
+            week_groups = dict(sorted(week_groups.items()))
+            
+            # Stock info for every missing row in one lookup
+            stocks = self.db.get_stocks_by_ids([m['stock_id'] for m in missing_weeks])
             
             st.caption(f"🔄 Grouped into {len(week_groups)} week(s) for bulk fetching")
             
@@ -146,10 +140,9 @@ class StreamlinedWeeklyManager:
             progress_text = st.empty()
             
             # Process each week group
-            for week_idx, (week_key, week_missing) in enumerate(week_groups.items(), 1):
-                year, week_num = week_key.split('-W')
-                year = int(year)
-                week_num = int(week_num)
+            for week_idx, (week_int, week_missing) in enumerate(week_groups.items(), 1):
+                year, week_num = wc.split_week_key(week_int)
+                week_key = f"{year}-W{week_num:02d}"
                 
                 # Update progress
                 progress = week_idx / len(week_groups)
@@ -158,21 +151,17 @@ class StreamlinedWeeklyManager:
                 
                 st.caption(f"📅 [{week_idx}/{len(week_groups)}] Processing Week {week_num}, {year}...")
                 
-                # Get Monday of this week
-                week_monday = datetime.strptime(f'{year}-W{week_num:02d}-1', '%Y-W%W-%w')
+                # Get ISO Monday of this week
+                week_monday = datetime.combine(wc.week_key_to_monday(week_int), datetime.min.time())
                 st.caption(f"   📅 Week Monday: {week_monday.strftime('%Y-%m-%d')}")
                 
                 # Prepare bulk fetch data
                 tickers_with_info = []
                 ticker_names = []
                 for missing in week_missing:
-                    # Get stock info
-                    stock_info = self.db.supabase.table('stock_master').select(
-                        'ticker, stock_name, asset_type'
-                    ).eq('id', missing['stock_id']).execute()
+                    stock = stocks.get(missing['stock_id'])
                     
-                    if stock_info.data:
-                        stock = stock_info.data[0]
+                    if stock:
                         tickers_with_info.append((
                             stock['ticker'],
                             stock['stock_name'],
@@ -247,6 +236,7 @@ class StreamlinedWeeklyManager:
         import yfinance as yf
         
         weekly_prices = {}
+        ticker, asset_type, _ = resolve_symbol(ticker, asset_type)
         
         try:
             if asset_type == 'stock':
@@ -263,10 +253,9 @@ class StreamlinedWeeklyManager:
                     stock = yf.Ticker(yf_ticker)
                     hist = stock.history(start=start_date, end=end_date, interval='1wk')
                 
-                # Convert to weekly prices
-                for date, row in hist.iterrows():
-                    year, week, _ = date.isocalendar()
-                    price = float(row['Close'])
+                # Convert to weekly prices (vectorized ISO week keys)
+                years, weeks = wc.keys_to_year_week(wc.dates_to_week_keys(hist.index))
+                for year, week, price in zip(years.tolist(), weeks.tolist(), hist['Close'].astype(float).tolist()):
                     if price > 0:
                         weekly_prices[(year, week)] = price
                         
@@ -308,7 +297,7 @@ class StreamlinedWeeklyManager:
                         'name': name,
                         'asset_type': asset_type,
                         'price': price,
-                        'source': 'api'
+                        'source': CAGR_INDEX_SOURCE if asset_type in ['pms', 'aif'] else 'api'
                     })
                     st.caption(f"   ✅ {ticker}: ₹{price:,.2f} (via {asset_type} API)")
                 else:
@@ -316,9 +305,9 @@ class StreamlinedWeeklyManager:
             except Exception as e:
                 st.caption(f"   ⚠️ {ticker}: Error - {str(e)}")
         
-        # Use bulk AI for remaining tickers
+        # Use bulk AI for remaining tickers (not PMS/AIF: their stored series is an index)
         remaining = [(t, n, a, d) for t, n, a, d in tickers_with_info 
-                    if not any(p['ticker'] == t for p in prices)]
+                    if a not in ['pms', 'aif'] and not any(p['ticker'] == t for p in prices)]
         
         if remaining and self.bulk_ai.available:
             st.caption(f"   🤖 Trying bulk AI for {len(remaining)} failed tickers...")
@@ -360,17 +349,15 @@ class StreamlinedWeeklyManager:
     
     def _calculate_pms_aif_nav(self, ticker: str, asset_type: str, date: str) -> Optional[float]:
         """
-        Calculate PMS/AIF NAV using CAGR (as per your requirements)
+        Scheme index of a PMS/AIF for the ISO week of date
+        
+        This is the shared series saved to historical_prices (the same for
+        every holder); users' lots are applied when reading.
         """
         try:
-            # This would integrate with your PMS/AIF calculator
-            # For now, return a placeholder
-            if asset_type == 'pms':
-                return 1000.0  # Placeholder PMS NAV
-            elif asset_type == 'aif':
-                return 1200.0  # Placeholder AIF NAV
-            return None
-        except:
+            index = get_pms_aif_calculator().weekly_index({ticker: asset_type}, [wc.date_to_week_key(date)])
+            return float(index['price'].iloc[0]) if not index.empty else None
+        except Exception:
             return None
     
     def _save_week_prices(self, prices: List[Dict[str, Any]], week_monday: datetime, year: int, week_num: int):
@@ -410,29 +397,33 @@ class StreamlinedWeeklyManager:
         """
         Get 52-week NAVs for user's holdings
         Matches your requirement: "for 52 week use navs"
+        Reads every holding's weekly closes in one batched query;
+        PMS/AIF NAVs come from the stored scheme index and the user's lots
         """
         try:
             holdings = self.db.get_user_holdings(user_id)
-            nav_data = {}
             
-            for holding in holdings:
-                ticker = holding['ticker']
-                asset_type = holding['asset_type']
-                stock_id = holding['stock_id']
-                
-                # Get 52 weeks of historical prices
-                end_date = datetime.now()
-                start_date = end_date - timedelta(weeks=52)
-                
-                prices = self.db.get_historical_prices_for_stock(
-                    stock_id,
-                    start_date.strftime('%Y-%m-%d'),
-                    end_date.strftime('%Y-%m-%d')
+            # Get 52 weeks of historical prices
+            end_date = datetime.now()
+            start_date = end_date - timedelta(weeks=52)
+            
+            weekly_prices = self.db.get_weekly_prices_for_stocks(
+                list(set(h['stock_id'] for h in holdings)),
+                start_date.strftime('%Y-%m-%d'),
+                end_date.strftime('%Y-%m-%d')
+            )
+            
+            # PMS/AIF rows are the shared scheme index; apply this user's lots
+            if any(h.get('asset_type') in ['pms', 'aif'] for h in holdings):
+                weekly_prices = get_pms_aif_calculator().apply_lots(
+                    self.db.get_user_transactions(user_id), weekly_prices
                 )
-                
+            
+            nav_data = {}
+            for holding in holdings:
                 # Convert to NAV format
                 navs = []
-                for price in prices:
+                for price in weekly_prices.get(holding['stock_id'], []):
                     navs.append({
                         'date': price['price_date'],
                         'nav': price['price'],
@@ -440,7 +431,7 @@ class StreamlinedWeeklyManager:
                         'year': price.get('iso_year', 0)
                     })
                 
-                nav_data[ticker] = navs
+                nav_data[holding['ticker']] = navs
             
             return nav_data
             
@@ -0,0 +1,190 @@
+"""
+Write-Behind Queue for Deferred Database Writes
+- Live price updates and holdings recomputes are queued instead of written inline
+- Updates coalesce per key (last write wins), so a burst becomes one bulk write
+- Flushed in bulk by a background thread on a timer or when the queue grows large
+- Every queued write is journaled to a local SQLite file first, so it survives a crash
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, List, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_FLUSH_INTERVAL = 2.0  # seconds between background flushes
+WRITE_BEHIND_MAX_PENDING = 500  # queued keys that trigger an early flush
+
+# Queue kinds and the repository method that applies them in bulk
+KIND_LIVE_PRICE = 'live_price'
+KIND_HOLDINGS = 'holdings'
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS write_journal (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+
+class WriteBehindQueue:
+    """
+    Durable, coalescing write-behind buffer in front of a repository
+
+    The journal table is the queue: enqueue is an INSERT OR REPLACE on
+    (kind, key), which is what makes the last write win. A flush reads the
+    journal, applies each kind with one bulk call and deletes only the rows
+    whose seq it applied, so writes queued during a flush are kept. Failed
+    kinds stay journaled and are retried on the next flush.
+    """
+
+    def __init__(self, db, journal_path: str = 'write_behind.db',
+                 flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.db = db
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._conn = sqlite3.connect(journal_path, check_same_thread=False, isolation_level=None)
+        if journal_path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.executescript(JOURNAL_SCHEMA)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM write_journal').fetchone()[0]
+
+    # ========================================================================
+    # ENQUEUE
+    # ========================================================================
+
+    def enqueue_live_price(self, record: Dict[str, Any]):
+        """Queue a stock_master live price row ({id, live_price, last_updated, ...})"""
+        self._enqueue(KIND_LIVE_PRICE, record['id'], record)
+
+    def enqueue_holdings(self, user_id: str, portfolio_id: str, stock_id: str):
+        """Queue a holdings recompute for one (user, portfolio, stock)"""
+        self._enqueue(KIND_HOLDINGS, f'{user_id}|{portfolio_id}|{stock_id}', {
+            'user_id': user_id,
+            'portfolio_id': portfolio_id,
+            'stock_id': stock_id
+        })
+
+    def _enqueue(self, kind: str, key: str, payload: Dict[str, Any]):
+        with self._lock:
+            self._seq += 1
+            self._conn.execute(
+                'INSERT OR REPLACE INTO write_journal (kind, key, payload, seq) VALUES (?, ?, ?, ?)',
+                (kind, key, json.dumps(payload, default=str), self._seq)
+            )
+            pending = self._conn.execute('SELECT COUNT(*) FROM write_journal').fetchone()[0]
+
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending_count(self) -> int:
+        """Number of coalesced writes waiting in the journal"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM write_journal').fetchone()[0]
+
+    # ========================================================================
+    # FLUSH
+    # ========================================================================
+
+    def flush(self) -> Dict[str, Any]:
+        """
+        Apply everything queued so far
+
+        Returns:
+            Dict with applied (rows written per kind) and errors
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT kind, key, payload, seq FROM write_journal ORDER BY seq'
+                ).fetchall()
+
+            batches: Dict[str, List[Tuple[str, Dict[str, Any], int]]] = {}
+            for kind, key, payload, seq in rows:
+                batches.setdefault(kind, []).append((key, json.loads(payload), seq))
+
+            result = {'applied': {}, 'errors': []}
+            for kind, entries in batches.items():
+                error = self._apply(kind, [payload for _, payload, _ in entries])
+                if error:
+                    result['errors'].append(f'{kind}: {error}')
+                    continue
+
+                result['applied'][kind] = len(entries)
+                with self._lock:
+                    # A newer write for the same key has a higher seq and stays queued
+                    self._conn.executemany(
+                        'DELETE FROM write_journal WHERE kind = ? AND key = ? AND seq = ?',
+                        [(kind, key, seq) for key, _, seq in entries]
+                    )
+
+            if result['errors']:
+                logger.warning("Write-behind flush kept %d kind(s) queued: %s",
+                               len(result['errors']), '; '.join(result['errors'])[:200])
+            return result
+
+    def _apply(self, kind: str, payloads: List[Dict[str, Any]]) -> Optional[str]:
+        """Write one kind in bulk, returning an error message or None"""
+        try:
+            if kind == KIND_LIVE_PRICE:
+                outcome = self.db.write_live_prices(payloads)
+            elif kind == KIND_HOLDINGS:
+                outcome = self.db.recompute_holdings(
+                    [(p['user_id'], p['portfolio_id'], p['stock_id']) for p in payloads]
+                )
+            else:
+                return f'unknown kind {kind}'
+        except Exception as e:
+            return str(e)
+
+        if not outcome['success']:
+            return (outcome['errors'] or ['write failed'])[0]
+        return None
+
+    # ========================================================================
+    # BACKGROUND FLUSHER
+    # ========================================================================
+
+    def start(self):
+        """Start the background flusher (also replays any journal left by a crash)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush: bool = True):
+        """Stop the flusher, optionally draining the queue first"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 5)
+        if flush:
+            self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self.pending_count():
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning("Write-behind flush failed: %s", e)
+                    time.sleep(self.flush_interval)